@@ -8,6 +8,7 @@ More or less ripped straight from the Agilent manual where it is given in C, and
 """
 import pyvisa
 from pyvisa import constants
+from pyvisa.errors import VisaIOError
 from pyvisa.resources import SerialInstrument
 from pyvisa.resources.messagebased import MessageBasedResource
 import time
@@ -16,8 +17,15 @@ import argparse
 import sys
 import logging
 from typing import cast
+from contextlib import contextmanager
+from dataclasses import dataclass
+from fractions import Fraction
 import datetime
+import hashlib
 import json
+import os
+from Metrics import LatencyHistograms
+from EventJournal import EventJournal, migrate_json
 
 
 # Configure logging
@@ -31,20 +39,94 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Settings whose value the instrument may silently change when another setting
+# is written. Writing the key drops the listed entries from the shadow model so
+# the next configure call re-sends them instead of trusting a stale cache.
+COUPLED_SETTINGS = {
+    "FUNCTION": ("FREQUENCY", "PULSE:PERIOD", "PULSE:WIDTH", "PULSE:TRANSITION", "PULSE:DUTY"),
+    "FREQUENCY": ("PULSE:PERIOD",),
+    "PULSE:PERIOD": ("FREQUENCY", "PULSE:DUTY"),
+    "PULSE:WIDTH": ("PULSE:DUTY",),
+    "PULSE:DUTY": ("PULSE:WIDTH",),
+}
+
+# Adaptive query timeout: once a query header has ADAPTIVE_TIMEOUT_MIN_SAMPLES
+# replies on record, wait ADAPTIVE_TIMEOUT_FACTOR x its p99 turnaround (never
+# less than MIN_QUERY_TIMEOUT_MS) instead of the full connection timeout
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = 5
+ADAPTIVE_TIMEOUT_FACTOR = 4.0
+MIN_QUERY_TIMEOUT_MS = 500
+
+# The 33250A error queue holds at most 20 entries
+MAX_ERROR_QUEUE = 20
+
+# Arbitrary waveform limits of the 33250A
+ARB_MAX_POINTS = 65536
+ARB_MAX_SAMPLE_RATE = 200e6
+ARB_MAX_FREQUENCY = 25e6
+DAC_MAX = 2047
+
+# Bytes per write_raw when streaming a waveform block. Small enough that the
+# RTS/CTS handshake can pause the transfer between chunks without the driver
+# holding the whole block, large enough to keep per-call overhead negligible
+UPLOAD_CHUNK_SIZE = 1024
+
+# Long forms used in this driver that address the same setting
+SETTING_ALIASES = {
+    "OUTPUT": "OUTPUT:STATE",
+}
+
+
+@dataclass
+class CompiledPulseTrains:
+    samples: np.ndarray         # int16 DAC codes, one arbitrary waveform period
+    sample_period: float        # seconds per sample
+    arb_frequency: float        # waveform repetition frequency to program
+    train_starts: np.ndarray    # offset of each train from the trigger, seconds
+    counts: tuple               # pulses per train, in playback order
+
 
 class Agilent33250A:
-    def __init__(self, port="/dev/ttyUSB0", baud_rate=57600, timeout=50000):
+    def __init__(self, port="/dev/ttyUSB0", baud_rate=57600, timeout=50000, max_batch_length=256,
+                 trigger_log="trigger_log.ndjson", resource_manager=None, events=None,
+                 legacy_trigger_log="trigger_log.json"):
         self.port = port
         self.data_bits = 8
         self.baud_rate = baud_rate
         self.timeout = timeout
-        self.rm = pyvisa.ResourceManager('@py')
+        # Longest line (without \r\n) that batch() joins commands into
+        self.max_batch_length = max_batch_length
+        self._batch_depth = 0
+        self._pending = []
+        # Every *TRG is journaled by a background writer, one JSON line per trigger;
+        # the history of the old whole-file JSON log is carried over once
+        if legacy_trigger_log and os.path.exists(legacy_trigger_log):
+            try:
+                migrate_json(legacy_trigger_log, trigger_log, key="triggers")
+                os.replace(legacy_trigger_log, legacy_trigger_log + ".migrated")
+            except Exception as e:
+                logger.error(f"Could not migrate {legacy_trigger_log}: {str(e)}")
+        self.trigger_journal = EventJournal(trigger_log)
+        # EventBus that also gets every trigger, on the timeline shared with the other drivers (optional)
+        self.events = events
+        # Content hash of the last waveform uploaded to each name
+        self._uploaded_waveforms = {}
+        # Write-to-terminator turnaround per query header, e.g. "*IDN?"
+        self.query_latency = LatencyHistograms()
+        self._inst_timeout = None
+        # A pyvisa-compatible ResourceManager may be injected, e.g. SimulatedResourceManager
+        self.rm = resource_manager if resource_manager is not None else pyvisa.ResourceManager('@py')
+        # Shadow model of the instrument settings, header -> value as last sent
+        self._state = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_bytes_saved = 0
         resource_list = self.rm.list_resources()
         logger.info(f"Available resources: {resource_list}")
 
         resource = self.rm.open_resource(
-            resource_name='ASRL/dev/ttyUSB0::INSTR',
-            baud_rate=57600,
+            resource_name=f"ASRL{self.port}::INSTR",
+            baud_rate=self.baud_rate,
             data_bits=8,
             parity=constants.Parity.none,
             stop_bits=constants.StopBits.one,
@@ -80,6 +162,9 @@ class Agilent33250A:
                 timeout=self.timeout
             )
             self.inst = cast(MessageBasedResource, resource)
+            self._inst_timeout = None
+            self.invalidate_cache()
+            self._uploaded_waveforms.clear()
             idn = self.query("*IDN?")
             logger.info(f"Connected to: {idn}")
             #self.reset()
@@ -94,60 +179,238 @@ class Agilent33250A:
         if self.inst:
             self.inst.close()
             self.inst = None
+            self.invalidate_cache()
+            self._uploaded_waveforms.clear()
             logger.info("Agilent33250A disconnected")
     
     def send(self, cmd: str):
-        logger.info(f"SCPI: {cmd!r}")
-        raw = cmd.strip().encode() + b'\r\n'
-        logger.info(f"RAW BYTES SENT: {raw!r}")
-        print(f"send() called: {raw!r}")
+        cmd = cmd.strip()
+        if self._batch_depth:
+            self._queue(cmd)
+        else:
+            self._write_line(cmd)
+        self._track_state(cmd)
+
+    def send_many(self, cmds):
+        """
+        Send a sequence of commands joined into as few writes as possible
+        
+        Args:
+            cmds (iterable of str): SCPI commands, in order
+        """
+        with self.batch():
+            for cmd in cmds:
+                self.send(cmd)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect every send() inside the block and write them as ";"-joined lines
+        
+        Lines are flushed when they reach max_batch_length, before any query and
+        when the outermost batch block exits. Blocks may be nested.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+
+    def flush(self):
+        """Write any commands queued by batch() to the instrument."""
+        if not self._pending:
+            return
+        line = self._pending[0]
+        for cmd in self._pending[1:]:
+            # Common commands (*TRG, *CLS, ...) may follow ";" as they are, but
+            # subsystem commands need a leading ":" or the parser resolves the
+            # header relative to the previous command's subsystem
+            line += ";" + (cmd if cmd.startswith("*") else ":" + cmd.lstrip(":"))
+        self._pending.clear()
+        try:
+            self._write_line(line)
+        except Exception:
+            # The queued settings are already in the shadow model
+            self.invalidate_cache()
+            raise
+
+    def _queue(self, cmd: str):
+        pending_length = sum(len(c) + 2 for c in self._pending)
+        if self._pending and pending_length + len(cmd) > self.max_batch_length:
+            self.flush()
+        self._pending.append(cmd)
+        if len(cmd) > self.max_batch_length:
+            self.flush()
+
+    def _write_line(self, line: str):
+        raw = line.encode() + b'\r\n'
+        logger.info(f"SCPI: {line!r}")
+        logger.debug(f"RAW BYTES SENT: {raw!r}")
         self.inst.write_raw(raw)
 
+    @staticmethod
+    def _split_setting(cmd: str):
+        """Split a SCPI setting into (HEADER, value); value is None for commands without one."""
+        header, _, value = cmd.strip().partition(" ")
+        header = header.upper().lstrip(":")
+        header = SETTING_ALIASES.get(header, header)
+        return header, (value.strip() or None)
+
+    def _track_state(self, cmd: str):
+        """Keep the shadow model in step with a command that was written to the instrument."""
+        header, value = self._split_setting(cmd)
+        if header == "*RST" or header.startswith("APPLY"):
+            # *RST restores defaults and APPLY rewrites function, frequency,
+            # amplitude, offset, trigger source and the burst/mod/sweep states
+            self.invalidate_cache()
+        elif header.startswith("*") or header.endswith("?") or value is None:
+            return
+        else:
+            for coupled in COUPLED_SETTINGS.get(header, ()):
+                self._state.pop(coupled, None)
+            self._state[header] = value
+
+    def set_param(self, header: str, value, force=False):
+        """
+        Write-through setter: send "HEADER value" only if it differs from the shadow model
+        
+        Args:
+            header (str): SCPI header, e.g. "BURST:NCYCLES"
+            value: Value to set, formatted with str()
+            force (bool): Send even if the cached value matches
+            
+        Returns:
+            bool: True if the command was sent, False if it was skipped
+        """
+        cmd = f"{header} {value}"
+        key, value = self._split_setting(cmd)
+        if not force and self._state.get(key) == value:
+            self.cache_hits += 1
+            self.cache_bytes_saved += len(cmd.encode()) + 2  # plus \r\n
+            logger.debug(f"SCPI cache hit, skipped: {cmd!r}")
+            return False
+        self.cache_misses += 1
+        self.send(cmd)
+        return True
+
+    def invalidate_cache(self):
+        """Forget everything the shadow model knows about the instrument state."""
+        self._state.clear()
+
+    def cache_stats(self):
+        """Return the shadow-model counters."""
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "bytes_saved": self.cache_bytes_saved,
+            "cached_settings": len(self._state),
+        }
 
-    def query(self, cmd: str):
+    def query(self, cmd: str, timeout=None):
+        """
+        Send a query and block until the reply's read terminator arrives
+        
+        Args:
+            cmd (str): SCPI query, e.g. "*IDN?"
+            timeout (float): Read timeout in ms. Default: adaptive, derived from
+                this header's recorded turnaround and capped at self.timeout
+                
+        Returns:
+            str: The stripped response
+        """
+        self.flush()
+        cmd = cmd.strip()
+        header = cmd.split(" ")[0].upper()
         logger.info(f"SCPI QUERY: {cmd!r}")
-        raw = cmd.strip().encode() + b'\r\n'
-        logger.info(f"RAW BYTES SENT: {raw!r}")
+        raw = cmd.encode() + b'\r\n'
+        logger.debug(f"RAW BYTES SENT: {raw!r}")
+        read_timeout = timeout if timeout is not None else self._adaptive_timeout(header)
+        self._set_inst_timeout(read_timeout)
+        start = time.perf_counter()
         self.inst.write_raw(raw)
-        time.sleep(0.05)  # Give the instrument time to reply
-        response = self.inst.read().strip()
+        try:
+            response = self.inst.read()
+        except VisaIOError:
+            if timeout is not None or read_timeout >= self.timeout:
+                raise
+            # The adaptive estimate was too tight, give the reply the full timeout
+            logger.warning(f"{header} not answered within {read_timeout:.0f} ms, waiting up to {self.timeout} ms")
+            self._set_inst_timeout(self.timeout)
+            response = self.inst.read()
+        self.query_latency.record(header, time.perf_counter() - start)
+        response = response.strip()
         logger.info(f"RESPONSE: {response!r}")
         return response
 
+    def _adaptive_timeout(self, header):
+        if header not in self.query_latency:
+            return self.timeout
+        latency = self.query_latency[header]
+        if latency.count < ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+            return self.timeout
+        estimate = ADAPTIVE_TIMEOUT_FACTOR * 1000 * latency.percentile(99)
+        return min(self.timeout, max(MIN_QUERY_TIMEOUT_MS, estimate))
+
+    def _set_inst_timeout(self, timeout):
+        if timeout != self._inst_timeout:
+            self.inst.timeout = timeout
+            self._inst_timeout = timeout
+
+    def query_stats(self):
+        """Return per-header query turnaround (count, mean, p50/p95/p99, max in ms)."""
+        return self.query_latency.summary()
+
     def reset(self):
         logger.info("Resetting instrument...")
-        self.send("*RST")
-        self.send("*CLS")
+        self.invalidate_cache()
+        self.send_many(["*RST", "*CLS"])
         
     def check_errors(self):
-        while True:
+        """
+        Drain the instrument error queue
+        
+        Returns:
+            list: The error strings read, empty if the queue was clear
+        """
+        errors = []
+        for _ in range(MAX_ERROR_QUEUE + 1):
             err = self.query(":SYST:ERR?").strip()
             err_num = int(err.split(',')[0])
             if err_num == 0:
                 break
             else:
                 logger.warning(f"Instrument error: {err}")
+                errors.append(err)
+        return errors
                 
     def close(self):
         if self.inst:
             self.inst.close()
+            self.invalidate_cache()
+            self._uploaded_waveforms.clear()
             logger.info("Connection closed")
+        self.trigger_journal.close()
             
-    def configure_output(self, load="INF", state=True):
+    def configure_output(self, load="INF", state=True, force=False):
         """        
         Args:
             load (str): Output load in ohms or "INF" for high impedance
             state (bool): Enable/disable output
+            force (bool): Re-send settings even if the cache says they are set
         """
-        self.send(f"OUTPUT:LOAD {load}")
-        self.send(f"OUTPUT:STATE {'ON' if state else 'OFF'}")
+        with self.batch():
+            self.set_param("OUTPUT:LOAD", load, force=force)
+            self.set_param("OUTPUT:STATE", 'ON' if state else 'OFF', force=force)
         
-    def configure_sync(self, state=True):
+    def configure_sync(self, state=True, force=False):
         """
         Args:
             state (bool): Enable/disable sync output
+            force (bool): Re-send the setting even if the cache says it is set
         """
-        self.send(f"OUTPUT:SYNC {'ON' if state else 'OFF'}")
+        self.set_param("OUTPUT:SYNC", 'ON' if state else 'OFF', force=force)
         
     def apply_waveform(self, waveform_type, frequency, amplitude, offset=0):
         """
@@ -163,7 +426,7 @@ class Agilent33250A:
         logger.info(f"Applying waveform: {cmd}")
         self.send(cmd)
         
-    def set_am_modulation(self, depth=80, mod_frequency=1000, mod_shape="SIN", enable=True):
+    def set_am_modulation(self, depth=80, mod_frequency=1000, mod_shape="SIN", enable=True, force=False):
         """
         Configure amplitude modulation
         
@@ -172,13 +435,15 @@ class Agilent33250A:
             mod_frequency (float): Modulation frequency in Hz
             mod_shape (str): SIN, SQU, RAMP, NOIS, or USER
             enable (bool): Enable/disable modulation
+            force (bool): Re-send settings even if the cache says they are set
         """
-        self.send(f"AM:INTERNAL:FUNCTION {mod_shape}")
-        self.send(f"AM:INTERNAL:FREQUENCY {mod_frequency}")
-        self.send(f"AM:DEPTH {depth}")
-        self.send(f"AM:STATE {'ON' if enable else 'OFF'}")
+        with self.batch():
+            self.set_param("AM:INTERNAL:FUNCTION", mod_shape, force=force)
+            self.set_param("AM:INTERNAL:FREQUENCY", mod_frequency, force=force)
+            self.set_param("AM:DEPTH", depth, force=force)
+            self.set_param("AM:STATE", 'ON' if enable else 'OFF', force=force)
         
-    def set_fm_modulation(self, deviation=1000, mod_frequency=1000, mod_shape="SIN", enable=True):
+    def set_fm_modulation(self, deviation=1000, mod_frequency=1000, mod_shape="SIN", enable=True, force=False):
         """
         Configure frequency modulation
         
@@ -187,13 +452,15 @@ class Agilent33250A:
             mod_frequency (float): Modulation frequency in Hz
             mod_shape (str): SIN, SQU, RAMP, NOIS, or USER
             enable (bool): Enable/disable modulation
+            force (bool): Re-send settings even if the cache says they are set
         """
-        self.send(f"FM:INTERNAL:FUNCTION {mod_shape}")
-        self.send(f"FM:INTERNAL:FREQUENCY {mod_frequency}")
-        self.send(f"FM:DEVIATION {deviation}")
-        self.send(f"FM:STATE {'ON' if enable else 'OFF'}")
+        with self.batch():
+            self.set_param("FM:INTERNAL:FUNCTION", mod_shape, force=force)
+            self.set_param("FM:INTERNAL:FREQUENCY", mod_frequency, force=force)
+            self.set_param("FM:DEVIATION", deviation, force=force)
+            self.set_param("FM:STATE", 'ON' if enable else 'OFF', force=force)
         
-    def set_frequency_sweep(self, start_freq=100, stop_freq=1000, sweep_time=1, enable=True):
+    def set_frequency_sweep(self, start_freq=100, stop_freq=1000, sweep_time=1, enable=True, force=False):
         """
         Configure frequency sweep
         
@@ -202,13 +469,15 @@ class Agilent33250A:
             stop_freq (float): Stop frequency in Hz
             sweep_time (float): Sweep time in seconds
             enable (bool): Enable/disable sweep
+            force (bool): Re-send settings even if the cache says they are set
         """
-        self.send(f"FREQUENCY:START {start_freq}")
-        self.send(f"FREQUENCY:STOP {stop_freq}")
-        self.send(f"SWEEP:TIME {sweep_time}")
-        self.send(f"SWEEP:STATE {'ON' if enable else 'OFF'}")
+        with self.batch():
+            self.set_param("FREQUENCY:START", start_freq, force=force)
+            self.set_param("FREQUENCY:STOP", stop_freq, force=force)
+            self.set_param("SWEEP:TIME", sweep_time, force=force)
+            self.set_param("SWEEP:STATE", 'ON' if enable else 'OFF', force=force)
 
-    def configure_pulse(self, frequency=1000, width=100e-6, edge_time=10e-6):
+    def configure_pulse(self, frequency=1000, width=100e-6, edge_time=10e-6, force=False):
         """
         Configure pulse waveform
         
@@ -216,14 +485,16 @@ class Agilent33250A:
             frequency (float): Pulse frequency in Hz
             width (float): Pulse width in seconds
             edge_time (float): Edge time in seconds
+            force (bool): Re-send settings even if the cache says they are set
         """
         period = 1.0 / frequency
-        self.send(f"FUNCTION PULSE")
-        self.send(f"PULSE:PERIOD {period}")
-        self.send(f"PULSE:WIDTH {width}")
-        self.send(f"PULSE:TRANSITION {edge_time}")
+        with self.batch():
+            self.set_param("FUNCTION", "PULSE", force=force)
+            self.set_param("PULSE:PERIOD", period, force=force)
+            self.set_param("PULSE:WIDTH", width, force=force)
+            self.set_param("PULSE:TRANSITION", edge_time, force=force)
         
-    def set_burst_mode(self, cycles=3, phase=0, trigger_source="BUS", enable=True):
+    def set_burst_mode(self, cycles=3, phase=0, trigger_source="BUS", enable=True, force=False):
         """
         Configure burst mode
         
@@ -232,40 +503,94 @@ class Agilent33250A:
             phase (float): Starting phase in degrees
             trigger_source (str): IMM, EXT, or BUS
             enable (bool): Enable/disable burst mode
+            force (bool): Re-send settings even if the cache says they are set
         """
-        self.send(f"BURST:MODE TRIG")
-        self.send(f"BURST:NCYCLES {cycles}")
-        self.send(f"BURST:PHASE {phase}")
-        self.send(f"TRIGGER:SOURCE {trigger_source}")
-        self.send(f"BURST:STATE {'ON' if enable else 'OFF'}")
-        
-    def send_trigger(self, n, logfile="trigger_log.json"):
-        """inter_block_delay = float(command.get("inter_burst_wait", 0.5))     # Default 0.5s wait between blocks        # Call the actual configuration logic that sets the agilent controller.
-        for i in range(10):
-                self.send("*TRG")
-                logger.info(f"Burst {i+1}/10 triggered.")
-                time.sleep(inter_block_delay)"""
-        trigger_event = {
+        with self.batch():
+            self.set_param("BURST:MODE", "TRIG", force=force)
+            self.set_param("BURST:NCYCLES", cycles, force=force)
+            self.set_param("BURST:PHASE", phase, force=force)
+            self.set_param("TRIGGER:SOURCE", trigger_source, force=force)
+            self.set_param("BURST:STATE", 'ON' if enable else 'OFF', force=force)
+        
+    def send_trigger(self, n):
+        """
+        Send *TRG and journal the trigger event
+        
+        The event carries a perf_counter_ns timestamp taken right after the
+        serial write, so differences between records are the real
+        inter-trigger intervals. Writing it to disk happens off this thread.
+        
+        Args:
+            n: Burst number (or label) stored with the event
+        """
+        self.send("*TRG")
+        self.flush()  # A trigger never waits for the end of a batch
+        sent_ns = time.perf_counter_ns()
+        timestamp_unix = time.time()
+        self.trigger_journal.record({
             "burst_number": n,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "timestamp_unix": time.time(),
+            "timestamp_unix": timestamp_unix,
+            "perf_counter_ns": sent_ns,
             "command": "*TRG"
-        }
-        logger.info(f"Burst {n} triggered at {trigger_event['timestamp']}")
-        self.send("*TRG")
-        try:
-            try:
-                with open(logfile, 'r') as f:
-                    data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                data = {"triggers": []}
-
-            data["triggers"].append(trigger_event)
-            with open(logfile, 'w') as f:
-                json.dump(data, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to log trigger event: {str(e)}")
+        })
+        if self.events is not None:
+            self.events.record("trigger", perf_ns=sent_ns, value=n if isinstance(n, (int, float)) else float("nan"))
+        logger.info(f"Burst {n} triggered")
+        
+    def upload_waveform(self, data, name="VOLATILE", normalized=None, chunk_size=UPLOAD_CHUNK_SIZE, force=False):
+        """
+        Upload an arbitrary waveform as a definite-length binary block
         
+        Samples are scaled and clipped to the DAC range in one vectorised pass,
+        sent as big-endian int16 ("DATA:DAC <name>, #<n><len><bytes>") and
+        streamed in chunk_size pieces. Uploading the same samples to the same
+        name again is skipped unless force is set.
+        
+        Args:
+            data (list/array): Waveform points, -1.0 to 1.0 if normalized, else DAC codes (-2047 to 2047)
+            name (str): Waveform name (default: VOLATILE)
+            normalized (bool): Whether data is in -1.0..1.0. Default: True for float data
+            chunk_size (int): Bytes per serial write
+            force (bool): Upload even if the instrument already holds this waveform
+            
+        Returns:
+            dict: points, bytes, seconds, bytes_per_s and whether the upload was skipped
+        """
+        data = np.asarray(data)
+        if data.ndim != 1 or not 1 <= len(data) <= ARB_MAX_POINTS:
+            raise ValueError(f"Waveform must be a 1-D sequence of 1 to {ARB_MAX_POINTS} points")
+        if normalized is None:
+            normalized = np.issubdtype(data.dtype, np.floating)
+        if normalized:
+            codes = np.rint(np.clip(data, -1.0, 1.0) * DAC_MAX)
+        else:
+            codes = np.clip(data, -DAC_MAX, DAC_MAX)
+            if not np.array_equal(codes, data):
+                logger.warning(f"Waveform {name}: samples outside ±{DAC_MAX} were clipped")
+        payload = codes.astype(">i2").tobytes()
+
+        digest = hashlib.sha1(payload).hexdigest()
+        if not force and self._uploaded_waveforms.get(name) == digest:
+            logger.info(f"Waveform {name} ({len(codes)} points) already on the instrument, upload skipped")
+            return {"points": len(codes), "bytes": 0, "seconds": 0.0, "bytes_per_s": None, "skipped": True}
+
+        length = str(len(payload))
+        block = (f"DATA:DAC {name}, #{len(length)}{length}".encode() + payload + b'\r\n')
+        self.flush()
+        logger.info(f"Uploading waveform {name} ({len(codes)} points, {len(block)} bytes)")
+        self._uploaded_waveforms.pop(name, None)
+        start = time.perf_counter()
+        view = memoryview(block)
+        for offset in range(0, len(block), chunk_size):
+            self.inst.write_raw(bytes(view[offset:offset + chunk_size]))
+        elapsed = time.perf_counter() - start
+        self._uploaded_waveforms[name] = digest
+
+        throughput = len(block) / elapsed if elapsed > 0 else None
+        logger.info(f"Uploaded waveform {name} in {elapsed:.3f} s"
+                    + (f" ({throughput / 1000:.1f} kB/s)" if throughput else ""))
+        return {"points": len(codes), "bytes": len(block), "seconds": elapsed, "bytes_per_s": throughput, "skipped": False}
+
     def upload_arbitrary_waveform(self, data, name="VOLATILE"):
         """
         Upload arbitrary waveform data
@@ -274,16 +599,7 @@ class Agilent33250A:
             data (list/array): Waveform data points (-1.0 to 1.0)
             name (str): Waveform name (default: VOLATILE)
         """
-        if isinstance(data, np.ndarray):
-            data_list = data.tolist()
-        else:
-            data_list = list(data)
-            
-        # Format as comma-separated list
-        data_str = ",".join(str(x) for x in data_list)
-        cmd = f"DATA:{name} "
-        logger.info(f"Uploading arbitrary waveform ({len(data_list)} points)")
-        self.send(cmd + data_str)
+        return self.upload_waveform(data, name=name, normalized=True)
         
     def upload_arbitrary_waveform_binary(self, data, name="VOLATILE"):
         """
@@ -293,16 +609,102 @@ class Agilent33250A:
             data (numpy.ndarray): Waveform data points (-2047 to 2047)
             name (str): Waveform name (default: VOLATILE)
         """
-        # Convert to int16 array (from -2047 to 2047)
-        if not isinstance(data, np.ndarray):
-            data = np.array(data, dtype=np.int16)
-        else:
-            data = data.astype(np.int16)
+        return self.upload_waveform(data, name=name, normalized=False)
+
+    @staticmethod
+    def compile_pulse_trains(counts, pulse_frequency, duty_cycle=50.0, gap=0.1, max_points=ARB_MAX_POINTS):
+        """
+        Render a sequence of pulse trains into one arbitrary waveform
+        
+        The sample period is the largest one that puts both pulse edges on
+        sample boundaries (duty cycle p/q -> q samples per pulse period), so
+        every train and every gap is exact to the instrument's sample clock.
+        
+        Args:
+            counts (iterable of int): Pulses per train, in playback order
+            pulse_frequency (float): Pulse repetition frequency inside a train in Hz
+            duty_cycle (float): High time in percent of the pulse period
+            gap (float): Low time between the end of one train and the start of the next in seconds
+            max_points (int): Largest waveform the instrument accepts
             
-        cmd = f"DATA:DAC:{name} "
-        logger.info(f"Uploading binary arbitrary waveform ({len(data)} points)")
-        self.inst.write_binary_values(cmd, data, datatype='h', is_big_endian=True)
+        Returns:
+            CompiledPulseTrains
+            
+        Raises:
+            ValueError: If the sequence does not fit the arbitrary waveform memory or sample rate
+        """
+        counts = tuple(int(n) for n in counts)
+        if not counts or min(counts) < 1:
+            raise ValueError("Need at least one train with at least one pulse")
+        duty = Fraction(duty_cycle / 100.0).limit_denominator(1000)
+        if not 0 < duty < 1:
+            raise ValueError("Duty cycle must be between 0 and 100 percent (exclusive)")
+        samples_per_pulse = duty.denominator
+        high_samples = duty.numerator
+        sample_period = 1.0 / (pulse_frequency * samples_per_pulse)
+        if sample_period < 1.0 / ARB_MAX_SAMPLE_RATE:
+            raise ValueError(f"{pulse_frequency} Hz at {duty_cycle}% duty needs {1 / sample_period:.3g} Sa/s, "
+                             f"more than the {ARB_MAX_SAMPLE_RATE:.3g} Sa/s available")
+        gap_samples = int(round(gap / sample_period))
+        # One leading low sample: in burst mode the output idles at the first
+        # point, which must be the low level
+        n_points = 1 + sum(counts) * samples_per_pulse + (len(counts) - 1) * gap_samples
+        if n_points > max_points:
+            # The arbitrary waveform has one sample clock, so the gaps cost as many points as the pulses
+            free = max_points - 1 - sum(counts) * samples_per_pulse
+            if free < 0:
+                hint = "the trains alone do not fit"
+            elif len(counts) == 1:
+                hint = "a single train has no gap to shorten"
+            else:
+                hint = f"gaps of at most {free // (len(counts) - 1) * sample_period:.3g} s would fit"
+            raise ValueError(f"Sequence needs {n_points} points at {sample_period:.3g} s/sample, "
+                             f"the arbitrary waveform memory holds {max_points}; {hint}")
+        arb_frequency = 1.0 / (n_points * sample_period)
+        if arb_frequency > ARB_MAX_FREQUENCY:
+            raise ValueError(f"Sequence is too short: {arb_frequency:.3g} Hz exceeds {ARB_MAX_FREQUENCY:.3g} Hz")
+
+        pulse = np.full(samples_per_pulse, -DAC_MAX, dtype=np.int16)
+        pulse[:high_samples] = DAC_MAX
+        samples = np.full(n_points, -DAC_MAX, dtype=np.int16)
+        train_lengths = np.array(counts) * samples_per_pulse
+        starts = 1 + np.concatenate(([0], np.cumsum(train_lengths[:-1] + gap_samples)))
+        for start, n in zip(starts, counts):
+            samples[start:start + n * samples_per_pulse] = np.tile(pulse, n)
+
+        return CompiledPulseTrains(
+            samples=samples,
+            sample_period=sample_period,
+            arb_frequency=arb_frequency,
+            train_starts=starts * sample_period,
+            counts=counts
+        )
+
+    def play_compiled_pulse_trains(self, compiled, name="VOLATILE", trigger=True):
+        """
+        Upload a compiled pulse-train sequence and fire it with a single trigger
+        
+        The whole sequence plays as one burst cycle of the arbitrary waveform,
+        so the train spacing is set by the instrument's sample clock.
         
+        Args:
+            compiled (CompiledPulseTrains): Output of compile_pulse_trains()
+            name (str): Waveform name (default: VOLATILE)
+            trigger (bool): Send *TRG once armed
+        """
+        logger.info(f"Playing {len(compiled.counts)} compiled pulse trains "
+                    f"({len(compiled.samples)} points, {compiled.arb_frequency:.6g} Hz)")
+        self.upload_arbitrary_waveform_binary(compiled.samples, name=name)
+        with self.batch():
+            self.select_arbitrary_waveform(name)
+            self.set_param("FUNCTION", "USER")
+            self.set_param("FREQUENCY", compiled.arb_frequency)
+            self.set_burst_mode(cycles=1, trigger_source="BUS", enable=True)
+        if not self.wait_opc():
+            raise RuntimeError("Instrument did not finish loading the compiled sequence")
+        if trigger:
+            self.send_trigger(len(compiled.counts))
+
     def select_arbitrary_waveform(self, name="VOLATILE"):
         """
         Select an arbitrary waveform
@@ -310,12 +712,34 @@ class Agilent33250A:
         Args:
             name (str): Waveform name (default: VOLATILE)
         """
-        self.send(f"FUNCTION:USER {name}")
+        self.set_param("FUNCTION:USER", name)
         
     def get_status_byte(self):
         """Get and return the status byte"""
         return int(self.query("*STB?").strip())
-    
+
+    def wait_opc(self, timeout=10):
+        """
+        Block until all pending operations have completed, using *OPC?
+        
+        The instrument only answers *OPC? once its pending operations are
+        done, so this is a single blocking read instead of a status poll. On a
+        timeout the instrument is cleared, so the reply can't arrive later in
+        place of another query's.
+        
+        Args:
+            timeout (float): Timeout in seconds
+            
+        Returns:
+            bool: True if completed, False if timed out
+        """
+        try:
+            return self.query("*OPC?", timeout=timeout * 1000) == "1"
+        except VisaIOError as e:
+            logger.warning(f"*OPC? timed out after {timeout} s: {str(e)}")
+            # Otherwise its late "1" would be read as the reply to the next query
+            self.inst.clear()
+            return False
     
     def wait_for_completion(self, timeout=10):
         """
@@ -327,14 +751,7 @@ class Agilent33250A:
         Returns:
             bool: True if successful, False if timed out
         """
-        self.send("*OPC")
-        start_time = time.time()
-        while (time.time() - start_time) < timeout:
-            stb = self.get_status_byte()
-            if stb & 0x10:  # Check if operation complete bit is set
-                return True
-            time.sleep(0.1)
-        return False
+        return self.wait_opc(timeout=timeout)
 
     def set_frequency(self, frequency: float):
         """
@@ -342,7 +759,7 @@ class Agilent33250A:
         Args:
             frequency (float): Frequency in Hz
         """
-        self.send(f"FREQUENCY {frequency}")
+        self.set_param("FREQUENCY", frequency)
         logger.info(f"Frequency set to {frequency} Hz")
 
     def set_burst_count(self, burst_count: int):
@@ -351,7 +768,7 @@ class Agilent33250A:
         Args:
             burst_count (int): Number of cycles in a burst
         """
-        self.send(f"BURST:NCYCLES {burst_count}")
+        self.set_param("BURST:NCYCLES", burst_count)
         logger.info(f"Burst count set to {burst_count} cycles")
 
     def set_duty_cycle(self, duty_cycle: float):
@@ -360,8 +777,9 @@ class Agilent33250A:
         Args:
             duty_cycle (float): Duty cycle in percent (0–100)
         """
-        self.send("FUNCTION PULSE")
-        self.send(f"PULSE:DUTY {duty_cycle}")
+        with self.batch():
+            self.set_param("FUNCTION", "PULSE")
+            self.set_param("PULSE:DUTY", duty_cycle)
         logger.info(f"Duty cycle set to {duty_cycle}%")
 
     
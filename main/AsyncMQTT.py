@@ -0,0 +1,224 @@
+"""
+asyncio transport for MQTTHandler, for clients living in an event loop (the NiceGUI frontend).
+
+AsyncMQTTHandler drives the paho client from the running loop instead of a
+loop_start() thread. The socket is watched with add_reader/add_writer, and
+keepalive and reconnect (with the same exponential backoff) run in a task.
+Message handlers, subscriptions and request() replies therefore run on the
+loop itself, without a cross-thread handoff.
+
+    mqtt = AsyncMQTTHandler("web_ui", broker=..., topics=...)
+    await mqtt.start()
+    reply = await mqtt.request({"type": "channel_select", "channel": 2})
+    async with mqtt.subscribe("/temperature") as samples:
+        async for payload in samples:
+            ...
+
+Clients without a socket (LoopbackMQTT) keep their own network thread; their
+messages are handed to the loop with call_soon_threadsafe.
+"""
+import asyncio
+import logging
+import threading
+import uuid
+
+import paho.mqtt.client as mqtt
+
+from MQTTHandler import MQTTHandler
+
+logger = logging.getLogger(__name__)
+
+# Job events that end a request()
+TERMINAL_EVENTS = ("completed", "failed", "cancelled")
+
+
+class Subscription:
+    """Async iterator over the payloads of one topic filter; drops the oldest when the reader falls behind."""
+    def __init__(self, handler, topic_filter, maxsize):
+        self._handler = handler
+        self.topic_filter = topic_filter
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self._registration = handler.register_handler(topic_filter, self._put, executor=handler.loop_executor(),
+                                                      name=f"subscription:{topic_filter}:{id(self)}")
+
+    def _put(self, payload):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(payload)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._handler.unregister_handler(self._registration)
+
+
+class AsyncMQTTHandler(MQTTHandler):
+    def __init__(self, *args, **kwargs):
+        self.loop = None
+        self._loop_thread = None
+        self._native = False
+        self._misc_task = None
+        self._stopping = False
+        self._acks = {}
+        self._requests = {}
+        self._request_handlers = None
+        super().__init__(*args, **kwargs)
+
+    def loop_executor(self):
+        """Executor for handlers that must run on the loop: inline when the loop is the network thread."""
+        return "inline" if self._native else self.loop
+
+    async def start(self):
+        """Connect from the running event loop; reconnects are handled in the background."""
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.current_thread()
+        self._native = hasattr(self.client, "loop_misc") and hasattr(self.client, "on_socket_open")
+        if not self._native:
+            self.connect()
+            return
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+        self.client.on_publish = self._on_publish
+        self.client.connect_async(self.broker, self.port, keepalive=self.keepalive)
+        self._misc_task = self.loop.create_task(self._misc_loop())
+        self.logger.info(f"Connecting to MQTT broker at {self.broker}:{self.port} (asyncio)")
+
+    async def stop(self):
+        self._stopping = True
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+        self.disconnect()
+
+    def _on_loop(self, callback, *args):
+        # Socket callbacks may come from the executor thread running a blocking (re)connect.
+        # On the loop thread they run at once: paho closes the socket right after on_socket_close.
+        if threading.current_thread() is self._loop_thread:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._on_loop(self.loop.add_reader, sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._on_loop(self.loop.remove_reader, sock)
+        self._on_loop(self.loop.remove_writer, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._on_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._on_loop(self.loop.remove_writer, sock)
+
+    async def _misc_loop(self):
+        # Keepalive pings plus (re)connect with exponential backoff, like paho's own loop thread
+        delay = self.reconnect_delay[0]
+        while not self._stopping:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+                try:
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                    delay = self.reconnect_delay[0]
+                except Exception as e:
+                    self.logger.warning(f"Connecting to {self.broker}:{self.port} failed ({str(e)}), retrying in {delay} s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.reconnect_delay[1])
+                    continue
+            await asyncio.sleep(1)
+
+    def _publish_now(self, topic, payload, qos, retain):
+        # The outbox thread must not touch a client whose socket belongs to the loop
+        if self._native and threading.current_thread() is not self._loop_thread:
+            self.loop.call_soon_threadsafe(super()._publish_now, topic, payload, qos, retain)
+            return None
+        return super()._publish_now(topic, payload, qos, retain)
+
+    def _on_publish(self, client, userdata, mid):
+        future = self._acks.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(mid)
+
+    async def publish_async(self, topic, payload, qos=None, retain=None, timeout=10.0):
+        """
+        Publish directly from the loop, bypassing the outbox, and wait until it is sent
+        (QoS 0) or acknowledged by the broker (QoS 1/2)
+
+        Returns:
+            bool: True once delivered, False if it went to the offline queue instead
+        """
+        policy = self.outbox.policy(topic)
+        qos = policy.qos if qos is None else qos
+        retain = policy.retain if retain is None else retain
+        encoded = self.encode(topic, payload)
+        if not self.connected:
+            self.offline_queue.put(topic, encoded, qos, retain)
+            return False
+        info = self.client.publish(topic, encoded, qos=qos, retain=retain)
+        if not self._native or info.is_published():
+            return True
+        future = self.loop.create_future()
+        self._acks[info.mid] = future
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            self._acks.pop(info.mid, None)
+        return True
+
+    async def request(self, command, timeout=30.0):
+        """
+        Send a UI command and wait for its outcome
+
+        The command gets an "id" if it has none. The reply is its terminal job event
+        on the status topic (completed/failed/cancelled), or the backend's answer on
+        the response topic; a rejection there is raised as RuntimeError.
+        """
+        command = dict(command)
+        command_id = command.setdefault("id", uuid.uuid4().hex[:12])
+        if self._request_handlers is None:
+            self._request_handlers = [
+                self.register_handler(self.topics.get("operation_status", "/status"), self._on_request_status,
+                                      executor=self.loop_executor(), qos=1),
+                self.register_handler(self.topics.get("control_response", "/control_response"),
+                                      self._on_request_response, executor=self.loop_executor(), qos=1),
+            ]
+        future = self.loop.create_future()
+        self._requests[command_id] = future
+        try:
+            await self.publish_async(self.topics.get("UI_command", "/ui_command"), command, qos=1)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._requests.pop(command_id, None)
+
+    def _on_request_status(self, payload):
+        if isinstance(payload, dict) and payload.get("event") in TERMINAL_EVENTS:
+            future = self._requests.get(payload.get("id"))
+            if future is not None and not future.done():
+                future.set_result(payload)
+
+    def _on_request_response(self, payload):
+        # Rejections, and the replies of commands the backend handles without a job (all_off, ...)
+        if isinstance(payload, dict) and isinstance(payload.get("command"), dict):
+            future = self._requests.get(payload["command"].get("id"))
+            if future is None or future.done():
+                return
+            if "error" in payload:
+                future.set_exception(RuntimeError(payload["error"]))
+            else:
+                future.set_result(payload)
+
+    def subscribe(self, topic_filter, maxsize=1000):
+        """Async iterator (and async context manager) over the payloads of a topic filter."""
+        return Subscription(self, topic_filter, maxsize)
@@ -0,0 +1,172 @@
+"""
+Declarative calibration runs: every channel x drive level x signal of a plan, as one backend job.
+
+A plan is JSON (or YAML when PyYAML is installed):
+
+    {
+        "name": "full_matrix",
+        "channels": [1, 2, 3, 4, 5, 6, 7, 8],
+        "drive": {"percent": [10, 25, 50, 100]},
+        "signals": [
+            {"frequency": 1000, "duty_cycle": 50, "bursts": 5, "triggers": 3},
+            {"pulse_train_sweep": {"max_pulses": 20, "min_pulses": 1}}
+        ],
+        "settle_s": 0.5
+    }
+
+"drive" takes "codes" (wiper codes), "percent" or "voltages" (calibrated, see
+AD5260Controller.voltage_to_code). A signal is either a burst configuration
+(configure_signal, then "triggers" *TRGs "inter_burst_wait" apart) or a
+pulse-train sweep (sweeping_pulse_train).
+
+Steps are ordered to reconfigure as little as possible. The instrument is the
+slow part, so signals form the outer loop: consecutive burst configurations
+differ in as few parameters as possible, and pulse-train sweeps (which reset
+the instrument) come last. Channels and drive levels run in alternating
+direction, so each channel starts at the wiper code the previous one ended on
+and each signal at the channel the previous one ended on.
+
+A run appends one JSON line per finished step to <runs_dir>/<run_id>.ndjson.
+The run ID includes a hash of the plan, so submitting the same plan again
+resumes after the steps already done.
+"""
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from EventJournal import EventJournal, read_events
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+# One row per step, in execution order
+PLAN_STEP = np.dtype([
+    ("step", "<i4"),
+    ("signal", "<i2"),   # index into CalibrationPlan.signals
+    ("channel", "i1"),
+    ("code", "<i2"),
+])
+
+# Burst parameters compared when ordering signals, with configure_signal's defaults
+BURST_DEFAULTS = {"frequency": 1000.0, "duty_cycle": 50.0, "bursts": 10, "amplitude": 3.0,
+                  "inter_burst_wait": 0.5, "triggers": 1}
+
+
+def load_plan(path):
+    """Read a plan file; .yaml/.yml needs PyYAML, anything else is JSON."""
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise RuntimeError("PyYAML is not installed; use a JSON plan")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+class CalibrationPlan:
+    def __init__(self, plan):
+        """
+        Args:
+            plan (dict): See the module docstring
+        """
+        self.plan = plan
+        self.name = plan.get("name", "calibration")
+        self.channels = [int(c) for c in plan.get("channels", range(1, 9))]
+        if any(not 1 <= c <= 8 for c in self.channels):
+            raise ValueError("Channels must be between 1 and 8")
+        self.drive = plan.get("drive", {"percent": [50]})
+        self.signals = [self._signal(s) for s in plan.get("signals", [{}])]
+        self.settle_s = float(plan.get("settle_s", 0.5))
+        digest = hashlib.sha256(json.dumps(plan, sort_keys=True).encode("utf-8")).hexdigest()
+        self.run_id = f"{self.name}-{digest[:12]}"
+
+    @staticmethod
+    def _signal(signal):
+        if "pulse_train_sweep" in signal:
+            return {"pulse_train_sweep": dict(signal["pulse_train_sweep"])}
+        return {**BURST_DEFAULTS, **signal}
+
+    def codes(self, voltage_to_code=None):
+        """Wiper codes of the drive levels, in plan order."""
+        if "codes" in self.drive:
+            codes = [int(c) for c in self.drive["codes"]]
+        elif "percent" in self.drive:
+            codes = [int(p / 100 * 255) for p in self.drive["percent"]]
+        elif "voltages" in self.drive:
+            if voltage_to_code is None:
+                raise ValueError("Voltage drive levels need voltage_to_code")
+            codes = [int(voltage_to_code(float(v))) for v in self.drive["voltages"]]
+        else:
+            raise ValueError("drive needs codes, percent or voltages")
+        if any(not 0 <= c <= 255 for c in codes):
+            raise ValueError("Drive codes must be 0-255")
+        return codes
+
+    def signal_order(self):
+        """Signal indices in execution order (greedy nearest neighbour on changed parameters)."""
+        bursts = [i for i, s in enumerate(self.signals) if "pulse_train_sweep" not in s]
+        sweeps = [i for i, s in enumerate(self.signals) if "pulse_train_sweep" in s]
+        order = bursts[:1]
+        remaining = bursts[1:]
+        while remaining:
+            last = self.signals[order[-1]]
+            nearest = min(remaining, key=lambda i: sum(self.signals[i][k] != last[k] for k in BURST_DEFAULTS))
+            order.append(nearest)
+            remaining.remove(nearest)
+        return order + sweeps
+
+    def steps(self, voltage_to_code=None):
+        """Every (signal, channel, code) step as a PLAN_STEP array, in execution order."""
+        codes = self.codes(voltage_to_code)
+        rows = []
+        flip_channels = flip_codes = False
+        for signal in self.signal_order():
+            for channel in (self.channels[::-1] if flip_channels else self.channels):
+                for code in (codes[::-1] if flip_codes else codes):
+                    rows.append((len(rows), signal, channel, code))
+                flip_codes = not flip_codes
+            flip_channels = not flip_channels
+        return np.array(rows, dtype=PLAN_STEP)
+
+
+class CalibrationRun:
+    def __init__(self, plan, runs_dir="calibration_runs", restart=False):
+        """
+        The results file of a plan's run; steps already in it count as done
+
+        restart: Start over, keeping the previous results as <run_id>.ndjson.<n>
+        """
+        os.makedirs(runs_dir, exist_ok=True)
+        self.plan = plan
+        self.path = os.path.join(runs_dir, f"{plan.run_id}.ndjson")
+        if restart and os.path.exists(self.path):
+            n = 1
+            while os.path.exists(f"{self.path}.{n}"):
+                n += 1
+            os.replace(self.path, f"{self.path}.{n}")
+        self.completed = set()
+        if os.path.exists(self.path):
+            self.completed = {e["step"] for e in read_events(self.path) if "step" in e}
+            logger.info(f"Resuming calibration run {plan.run_id}: {len(self.completed)} steps already done")
+        self._journal = EventJournal(self.path)
+        if not self.completed:
+            self._journal.record({"run_id": plan.run_id, "plan": plan.plan})
+
+    def pending(self, steps):
+        return steps[~np.isin(steps["step"], list(self.completed))]
+
+    def record(self, result):
+        """Append a step result and wait until it is on disk, so a crash never loses a finished step."""
+        self._journal.record(result)
+        self._journal.flush()
+        self.completed.add(result["step"])
+
+    def close(self):
+        """Stop the results file's writer; everything recorded is on disk afterwards."""
+        self._journal.close()
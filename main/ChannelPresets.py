@@ -0,0 +1,57 @@
+"""
+Per-channel AD5260 wiper codes, kept in memory and persisted to a small JSON file
+({"<channel>": code}). The backend reads the file once at start-up; selecting a
+channel then only needs a dict lookup.
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelPresets:
+    def __init__(self, path="channel_presets.json", channels=range(1, 9), default_code=127):
+        """
+        Args:
+            path (str): JSON file the presets are loaded from and saved to
+            channels (iterable of int): Valid channel numbers
+            default_code (int): Wiper code for channels without a stored preset (127 = 50%)
+        """
+        self.path = path
+        self.codes = {channel: default_code for channel in channels}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            for channel, code in stored.items():
+                if int(channel) in self.codes:
+                    self.codes[int(channel)] = int(code)
+            logger.info(f"Loaded channel presets from {self.path}: {self.codes}")
+        except Exception as e:
+            logger.error(f"Failed to load channel presets from {self.path}: {str(e)}")
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({str(channel): code for channel, code in self.codes.items()}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def code(self, channel):
+        if channel not in self.codes:
+            raise ValueError(f"Channel must be one of {sorted(self.codes)}, got {channel}")
+        return self.codes[channel]
+
+    def set(self, channel, code):
+        """Store a channel's code, writing the file only if it changed. Returns True if it did."""
+        if not 0 <= code <= 255:
+            raise ValueError("Code must be 0-255")
+        if self.code(channel) == code:
+            return False
+        self.codes[channel] = int(code)
+        self.save()
+        return True
@@ -0,0 +1,212 @@
+"""
+Runs UI commands off the MQTT network thread.
+Every hardware resource gets its own lane: a worker thread with a bounded queue,
+so a long Agilent sweep never holds up a multiplexer switch and vice versa.
+Each job carries an ID and reports queued/started/progress/completed/failed/
+cancelled events through the publish callback (the backend sends them to /status).
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class CommandCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, command_id, command_type, lane, fn, publish):
+        self.id = command_id
+        self.type = command_type
+        self.lane = lane
+        self.fn = fn
+        self.state = "queued"
+        self.cancel_event = threading.Event()
+        self._publish = publish
+        self._last_progress = 0.0
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check(self):
+        """Raise CommandCancelled if a cancel was requested; call this between steps."""
+        if self.cancel_event.is_set():
+            raise CommandCancelled(self.id)
+
+    def sleep(self, seconds):
+        """Sleep, but wake up and raise CommandCancelled as soon as a cancel arrives."""
+        if seconds > 0 and self.cancel_event.wait(seconds):
+            raise CommandCancelled(self.id)
+        self.check()
+
+    def progress(self, done, total, min_interval=0.2, **extra):
+        """Publish a progress event, at most one every min_interval seconds plus the final step."""
+        now = time.monotonic()
+        if done < total and now - self._last_progress < min_interval:
+            return
+        self._last_progress = now
+        self.publish("progress", done=done, total=total, **extra)
+
+    def publish(self, event, **fields):
+        self._publish({"event": event, "id": self.id, "type": self.type, "lane": self.lane, **fields})
+
+
+class _NullJob:
+    """Stand-in used when a long operation is called directly rather than through the executor."""
+    id = None
+    cancelled = False
+
+    def check(self):
+        pass
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def progress(self, done, total, **extra):
+        pass
+
+    def publish(self, event, **fields):
+        pass
+
+
+NULL_JOB = _NullJob()
+
+
+class CommandExecutor:
+    def __init__(self, publish_status, lanes=("agilent", "spi_gpio"), max_queue=16):
+        """
+        Args:
+            publish_status (callable): Receives every job event as a dict
+            lanes (iterable of str): One worker thread is started per lane
+            max_queue (int): Jobs that may wait per lane before submit() refuses more
+        """
+        self._publish_status = publish_status
+        self._lock = threading.Lock()
+        # Notified whenever a job leaves the registry, for wait_idle()
+        self._finished = threading.Condition(self._lock)
+        self._jobs = {}
+        self._queues = {}
+        self._workers = []
+        for lane in lanes:
+            self._queues[lane] = queue.Queue(maxsize=max_queue)
+            worker = threading.Thread(target=self._run_lane, args=(lane,), name=f"lane-{lane}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Command executor started with lanes: {list(self._queues)}")
+
+    def submit(self, lane, command_type, fn, command_id=None):
+        """
+        Queue fn(job) on a lane
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            queue.Full: If the lane already has max_queue jobs waiting
+            ValueError: If command_id belongs to a job that is still queued or running
+        """
+        command_id = command_id or uuid.uuid4().hex[:12]
+        job = Job(command_id, command_type, lane, fn, self._publish)
+        with self._lock:
+            if command_id in self._jobs:
+                # Cancel and status would only reach one of the two
+                raise ValueError(f"Command id {command_id} is already in use by an active job")
+            self._queues[lane].put_nowait(job)
+            self._jobs[command_id] = job
+        job.publish("queued", queue_depth=self._queues[lane].qsize())
+        return job
+
+    def cancel(self, command_id=None):
+        """
+        Cancel one job by ID, or every queued and running job if no ID is given
+
+        Returns:
+            list: IDs of the jobs that were flagged
+        """
+        with self._lock:
+            if command_id is None:
+                jobs = list(self._jobs.values())
+            else:
+                jobs = [self._jobs[command_id]] if command_id in self._jobs else []
+        for job in jobs:
+            job.cancel()
+        return [job.id for job in jobs]
+
+    def cancel_lane(self, lane):
+        """Cancel every queued and running job of one lane; returns their IDs."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.lane == lane]
+        for job in jobs:
+            job.cancel()
+        return [job.id for job in jobs]
+
+    def wait_idle(self, lane, timeout=None):
+        """Block until no job of lane is queued or running; False if timeout (s) passed first."""
+        with self._finished:
+            return self._finished.wait_for(lambda: all(job.lane != lane for job in self._jobs.values()),
+                                           timeout=timeout)
+
+    def active_jobs(self):
+        with self._lock:
+            return [{"id": job.id, "type": job.type, "lane": job.lane, "state": job.state}
+                    for job in self._jobs.values()]
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            self.cancel()
+        for q in self._queues.values():
+            q.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+
+    def _publish(self, event):
+        try:
+            self._publish_status(event)
+        except Exception as e:
+            logger.error(f"Failed to publish job event {event.get('event')}: {str(e)}")
+
+    def _run_lane(self, lane):
+        q = self._queues[lane]
+        while True:
+            job = q.get()
+            if job is None:
+                break
+            try:
+                self._run_job(job)
+            finally:
+                with self._lock:
+                    if self._jobs.get(job.id) is job:
+                        del self._jobs[job.id]
+                    self._finished.notify_all()
+
+    def _run_job(self, job):
+        if job.cancelled:
+            job.state = "cancelled"
+            job.publish("cancelled")
+            return
+        job.state = "running"
+        job.publish("started")
+        start = time.perf_counter()
+        try:
+            result = job.fn(job)
+        except CommandCancelled:
+            job.state = "cancelled"
+            job.publish("cancelled", elapsed_s=time.perf_counter() - start)
+            logger.info(f"Command {job.id} ({job.type}) cancelled")
+        except Exception as e:
+            job.state = "failed"
+            job.publish("failed", error=str(e), elapsed_s=time.perf_counter() - start)
+            logger.error(f"Command {job.id} ({job.type}) failed: {str(e)}")
+        else:
+            job.state = "completed"
+            fields = {"result": result} if result is not None else {}
+            job.publish("completed", elapsed_s=time.perf_counter() - start, **fields)
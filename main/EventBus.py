@@ -0,0 +1,234 @@
+"""
+One timeline for every hardware action: triggers, channel changes, wiper writes
+and temperature samples.
+
+Events are stamped on one clock, t_ns: the wall time when the bus started plus
+perf_counter_ns elapsed since. That makes t_ns monotonic within a run (wall
+clock steps do not move it), comparable across runs, and directly comparable
+with the journals' timestamp_unix. record() appends to an in-memory column
+buffer. A writer thread saves the buffer every segment_interval seconds as a
+columnar .npz segment, "events.<first t_ns>-<last t_ns>.npz", one array per
+column.
+
+Queries read the segments overlapping a time range, plus what is not yet
+written, and join by time:
+
+    asof(left_t, right_t)                  latest right event at or before each left one
+    window_join(left_t, right_t, -1, 1)    every right event within [-1 s, +1 s] of each left one
+    bus.correlate_triggers(window_s=1.0)   per trigger: channel, wiper code, temperature before/after
+
+    python EventBus.py correlate event_segments --window 1.0
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EVENT_KINDS = {"trigger": 1, "channel": 2, "wiper": 3, "temperature": 4}
+
+# One row per event; columns not used by a kind hold -1 (integers) or NaN
+EVENT_RECORD = np.dtype([
+    ("t_ns", "<i8"),
+    ("kind", "u1"),
+    ("channel", "i1"),   # channel events: the channel switched on, 0 for all off
+    ("code", "i2"),      # wiper events: the code written
+    ("value", "<f8"),    # trigger: burst number; temperature: K
+])
+
+CHUNK_SIZE = 4096
+
+
+class EventBus:
+    def __init__(self, directory="event_segments", segment_interval=300.0):
+        """
+        Args:
+            directory (str): Where the .npz segments are written (created if missing)
+            segment_interval (float): Seconds between segment writes; at most this much is lost on a crash
+        """
+        self.directory = directory
+        self.segment_interval = segment_interval
+        self._anchor_unix_ns = time.time_ns()
+        self._anchor_perf_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._chunks = [np.empty(CHUNK_SIZE, dtype=EVENT_RECORD)]
+        self._fill = 0
+        self.recorded = 0
+        self.segments_written = 0
+        self._stop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._run, name="event-bus-writer", daemon=True)
+        self._writer.start()
+
+    def now_ns(self):
+        return self.from_perf_ns(time.perf_counter_ns())
+
+    def from_perf_ns(self, perf_ns):
+        """Bus time of a perf_counter_ns reading (scalar or array) taken in this process."""
+        return self._anchor_unix_ns + (np.asarray(perf_ns, dtype=np.int64) - self._anchor_perf_ns)
+
+    def record(self, kind, perf_ns=None, channel=-1, code=-1, value=np.nan):
+        """Append one event; perf_ns is when it happened (perf_counter_ns), default now."""
+        perf_ns = time.perf_counter_ns() if perf_ns is None else perf_ns
+        row = (self._anchor_unix_ns + perf_ns - self._anchor_perf_ns, EVENT_KINDS[kind], channel, code, value)
+        with self._lock:
+            if self._fill == CHUNK_SIZE:
+                self._chunks.append(np.empty(CHUNK_SIZE, dtype=EVENT_RECORD))
+                self._fill = 0
+            self._chunks[-1][self._fill] = row
+            self._fill += 1
+            self.recorded += 1
+
+    def record_many(self, kind, perf_ns, channel=-1, code=-1, value=np.nan):
+        """Append events given as arrays (or scalars broadcast over perf_ns)."""
+        perf_ns = np.asarray(perf_ns, dtype=np.int64)
+        rows = np.empty(len(perf_ns), dtype=EVENT_RECORD)
+        rows["t_ns"] = self.from_perf_ns(perf_ns)
+        rows["kind"] = EVENT_KINDS[kind]
+        rows["channel"] = channel
+        rows["code"] = code
+        rows["value"] = value
+        with self._lock:
+            self._chunks[-1] = self._chunks[-1][:self._fill]
+            self._chunks.append(rows)
+            self._chunks.append(np.empty(CHUNK_SIZE, dtype=EVENT_RECORD))
+            self._fill = 0
+            self.recorded += len(rows)
+
+    def _take_pending(self, clear):
+        with self._lock:
+            chunks = self._chunks[:-1] + [self._chunks[-1][:self._fill]]
+            pending = np.concatenate(chunks)
+            if clear:
+                self._chunks = [np.empty(CHUNK_SIZE, dtype=EVENT_RECORD)]
+                self._fill = 0
+        # record_many() may interleave with record() out of time order
+        return pending[np.argsort(pending["t_ns"], kind="stable")]
+
+    def _run(self):
+        while not self._stop.wait(self.segment_interval):
+            self.flush()
+
+    def flush(self):
+        """Write everything recorded so far as a segment."""
+        events = self._take_pending(clear=True)
+        if not len(events):
+            return
+        path = os.path.join(self.directory, f"events.{events['t_ns'][0]:020d}-{events['t_ns'][-1]:020d}.npz")
+        try:
+            with open(path + ".tmp", "wb") as f:
+                np.savez(f, **{name: events[name] for name in EVENT_RECORD.names})
+            os.replace(path + ".tmp", path)
+            self.segments_written += 1
+        except Exception as e:
+            logger.error(f"Failed to write {len(events)} events to {path}: {str(e)}")
+
+    def close(self):
+        self._stop.set()
+        self._writer.join(timeout=2.0)
+        self.flush()
+
+    def segments(self):
+        """(path, first t_ns, last t_ns) of every segment, in time order."""
+        found = []
+        for path in glob.glob(os.path.join(self.directory, "events.*-*.npz")):
+            first, last = os.path.basename(path)[len("events."):-len(".npz")].split("-")
+            found.append((path, int(first), int(last)))
+        return sorted(found, key=lambda segment: segment[1])
+
+    def read(self, start_ns=None, end_ns=None, kinds=None):
+        """
+        Every event with start_ns <= t_ns < end_ns, oldest first, including those not yet written
+
+        kinds: Names from EVENT_KINDS to keep (default all)
+        """
+        parts = []
+        for path, first, last in self.segments():
+            if (end_ns is not None and first >= end_ns) or (start_ns is not None and last < start_ns):
+                continue
+            with np.load(path) as columns:
+                events = np.empty(len(columns["t_ns"]), dtype=EVENT_RECORD)
+                for name in EVENT_RECORD.names:
+                    events[name] = columns[name]
+            parts.append(events)
+        parts.append(self._take_pending(clear=False))
+        events = np.concatenate(parts)
+        events = events[np.argsort(events["t_ns"], kind="stable")]
+        lo = 0 if start_ns is None else np.searchsorted(events["t_ns"], start_ns, side="left")
+        hi = len(events) if end_ns is None else np.searchsorted(events["t_ns"], end_ns, side="left")
+        events = events[lo:hi]
+        if kinds is not None:
+            events = events[np.isin(events["kind"], [EVENT_KINDS[kind] for kind in kinds])]
+        return events
+
+    def correlate_triggers(self, start_ns=None, end_ns=None, window_s=1.0):
+        """
+        One row per trigger: the channel and wiper code in effect, and the mean
+        temperature over window_s before and after it (NaN without samples)
+        """
+        events = self.read(start_ns, end_ns)
+        by_kind = {kind: events[events["kind"] == code] for kind, code in EVENT_KINDS.items()}
+        triggers = by_kind["trigger"]
+        result = np.empty(len(triggers), dtype=[
+            ("t_ns", "<i8"), ("burst", "<f8"), ("channel", "i1"), ("code", "i2"),
+            ("temperature_before_k", "<f8"), ("temperature_after_k", "<f8"),
+        ])
+        result["t_ns"] = triggers["t_ns"]
+        result["burst"] = triggers["value"]
+        for column, kind in (("channel", "channel"), ("code", "wiper")):
+            index = asof(triggers["t_ns"], by_kind[kind]["t_ns"])
+            if not len(by_kind[kind]):
+                result[column] = -1
+                continue
+            result[column] = np.where(index >= 0, by_kind[kind][column][index], -1)
+        temperature = by_kind["temperature"]
+        window_ns = int(window_s * 1e9)
+        for column, before, after in (("temperature_before_k", -window_ns, 0), ("temperature_after_k", 0, window_ns)):
+            left, right = window_join(triggers["t_ns"], temperature["t_ns"], before, after)
+            sums = np.bincount(left, weights=temperature["value"][right], minlength=len(triggers))
+            counts = np.bincount(left, minlength=len(triggers))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[column] = sums / counts
+        return result
+
+
+def asof(left_t, right_t):
+    """Index into sorted right_t of the latest entry at or before each left_t; -1 where there is none."""
+    return np.searchsorted(right_t, left_t, side="right") - 1
+
+
+def window_join(left_t, right_t, before, after):
+    """
+    Pairs (left index, right index) with left_t + before <= right_t <= left_t + after
+
+    right_t must be sorted; before and after are offsets in the same unit (e.g. -1e9, 1e9).
+    """
+    left_t = np.asarray(left_t)
+    lo = np.searchsorted(right_t, left_t + before, side="left")
+    hi = np.searchsorted(right_t, left_t + after, side="right")
+    counts = np.maximum(hi - lo, 0)
+    left = np.repeat(np.arange(len(left_t)), counts)
+    # Offsets 0..count-1 within each left row's run of matches
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return left, np.repeat(lo, counts) + offsets
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Event timeline queries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    correlate = subparsers.add_parser("correlate", help="Channel, wiper code and temperature around each trigger")
+    correlate.add_argument("directory")
+    correlate.add_argument("--window", type=float, default=1.0, help="Seconds before/after each trigger")
+    args = parser.parse_args()
+    if args.command == "correlate":
+        bus = EventBus(args.directory, segment_interval=3600.0)
+        for row in bus.correlate_triggers(window_s=args.window).tolist():
+            print(json.dumps(dict(zip(("t_ns", "burst", "channel", "code", "temperature_before_k",
+                                       "temperature_after_k"), row))))
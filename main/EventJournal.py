@@ -0,0 +1,140 @@
+"""
+Background NDJSON journal for events recorded on a hot path.
+record() only puts the event on an in-memory queue; a writer thread appends one
+JSON line per event and fsyncs in batches, so the caller never waits on disk and
+the cost of an append does not grow with the size of the file.
+"""
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Queued by flush() so the writer wakes up immediately
+_FLUSH = object()
+# Queued by close(): the writer writes what came before it, closes the file and exits
+_STOP = object()
+
+
+class EventJournal:
+    def __init__(self, path, flush_interval=0.5, max_queue=100000):
+        """
+        Args:
+            path (str): NDJSON file to append to
+            flush_interval (float): Longest time (s) an event waits in memory before it is written and fsynced
+            max_queue (int): Events held in memory before record() starts dropping them
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._writer = threading.Thread(target=self._run, name=f"journal-{os.path.basename(path)}", daemon=True)
+        self._writer.start()
+
+    def record(self, event):
+        """Queue an event (a JSON-serialisable dict) for writing; never blocks."""
+        try:
+            with self._flushed:
+                self._pending += 1
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._flushed:
+                self._pending -= 1
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Block until every event recorded so far is on disk."""
+        with self._flushed:
+            if self._pending:
+                self._queue.put(_FLUSH)
+            return self._flushed.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def close(self, timeout=5.0):
+        """Write everything recorded so far, then stop the writer thread and close the file."""
+        self.flush(timeout=timeout)
+        self._queue.put(_STOP)
+        self._writer.join(timeout=timeout)
+
+    def _run(self):
+        with open(self.path, "a") as f:
+            while True:
+                batch = [self._queue.get()]
+                # Collect whatever arrives within flush_interval so it shares one write and fsync
+                deadline = time.monotonic() + self.flush_interval
+                while batch[-1] is not _FLUSH and batch[-1] is not _STOP:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                events = [e for e in batch if e is not _FLUSH and e is not _STOP]
+                try:
+                    for e in events:
+                        f.write(json.dumps(_with_iso_timestamp(e)) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self.written += len(events)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(events)} events to {self.path}: {str(e)}")
+                with self._flushed:
+                    self._pending -= len(events)
+                    self._flushed.notify_all()
+                if batch[-1] is _STOP:
+                    return
+
+
+def _with_iso_timestamp(event):
+    # Formatting the human-readable time is deferred to the writer thread
+    if "timestamp_unix" in event and "timestamp" not in event:
+        event = {**event, "timestamp": datetime.datetime.fromtimestamp(event["timestamp_unix"]).isoformat()}
+    return event
+
+
+def migrate_json(json_path, journal_path, key=None):
+    """
+    Copy the events of an old JSON log in front of an NDJSON journal's own
+
+    The log is a JSON array of event dicts, or an object holding one under key
+    (the old trigger_log.json format is {"triggers": [...]}). Call it before a
+    journal on journal_path is opened.
+
+    Returns:
+        int: Number of events copied
+    """
+    with open(json_path) as f:
+        data = json.load(f)
+    events = data[key] if key is not None else data
+    existing = []
+    if os.path.exists(journal_path):
+        with open(journal_path) as f:
+            existing = f.readlines()
+    with open(journal_path + ".tmp", "w") as f:
+        for event in events:
+            f.write(json.dumps(_with_iso_timestamp(event)) + "\n")
+        f.writelines(existing)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(journal_path + ".tmp", journal_path)
+    logger.info(f"Migrated {len(events)} events from {json_path} into {journal_path}")
+    return len(events)
+
+
+def read_events(path):
+    """Read an NDJSON journal back as a list of dicts, skipping a torn last line."""
+    events = []
+    with open(path) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable line in {path}")
+    return events
@@ -2,16 +2,33 @@
 Simple GPIO Controller for Raspberry Pi
 Controls 4 GPIO pins that can be set high or low.
 """
-import RPi.GPIO as GPIO
 import time
-import spidev
 import logging
 import sys
 import json
+import hashlib
+import os
 from dataclasses import dataclass, asdict
-import board
-import digitalio
-import adafruit_max31865
+import numpy as np
+from CommandExecutor import NULL_JOB
+from Metrics import LatencyHistogram
+
+# The hardware libraries only exist on the Pi. Elsewhere the controllers need
+# injected backends (see SimulatedHardware)
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None
+try:
+    import spidev
+except ImportError:
+    spidev = None
+try:
+    import board
+    import digitalio
+    import adafruit_max31865
+except ImportError:
+    board = digitalio = adafruit_max31865 = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,72 +40,154 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+# Channel -> pin-state bitmask: bit 0 is the enable pin, bits 1-3 the address (channel - 1)
+CHANNEL_STATES = {channel: 1 | (channel - 1) << 1 for channel in range(1, 9)}
+
+# One row per point of AD5260Controller.voltage_sweep
+SWEEP_RECORD = np.dtype([
+    ("step", "<i4"),
+    ("code", "u1"),
+    ("target_v", "<f8"),
+    ("actual_v", "<f8"),
+    ("scheduled_s", "<f8"),  # offset from the start of the sweep
+    ("late_s", "<f8"),       # how far behind schedule the write landed
+    ("timestamp", "<f8"),
+])
+
+# SPI0 chip-select pins the kernel driver can drive itself: BCM pin -> spidev device
+HARDWARE_CS_PINS = {8: 0, 7: 1}
+
+# MAX31865 registers (OR 0x80 into the address to write) and configuration bits
+MAX31865_CONFIG = 0x00
+MAX31865_RTD_MSB = 0x01
+MAX31865_FAULT_STATUS = 0x07
+MAX31865_BIAS = 0x80
+MAX31865_AUTO = 0x40
+MAX31865_THREE_WIRE = 0x10
+MAX31865_FAULT_CLEAR = 0x02
+MAX31865_FILTER_50HZ = 0x01
+# Fault status bit -> meaning
+MAX31865_FAULTS = {
+    0x80: "High threshold exceeded",
+    0x40: "Low threshold exceeded",
+    0x20: "Reference low",
+    0x10: "Reference high",
+    0x08: "RTD input low (short to GND)",
+    0x04: "Over/under voltage",
+}
+# Callendar-Van Dusen coefficients (IEC 60751)
+RTD_A = 3.9083e-3
+RTD_B = -5.775e-7
+
+
+def _require(backend, name):
+    if backend is None:
+        raise RuntimeError(f"{name} is not installed; pass a backend explicitly (e.g. from SimulatedHardware)")
+    return backend
+
+
 class Multiplexer:    
-    def __init__(self, pins=[24, 23, 22, 27]):
+    def __init__(self, pins=[24, 23, 22, 27], gpio=None, events=None):
         'Pin 24: On/Off, Pins 23, 22, 27 are A2, A1 and A0 respectively. Aka 18 = 0/1, 22 = 2/0, 27 = 4/0 from binary numbering. Also all Pin references are BCM'
         self.pins = pins
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
+        # EventBus that gets a "channel" event for every switch (optional)
+        self.events = events
+        self.gpio = gpio if gpio is not None else _require(GPIO, "RPi.GPIO")
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setwarnings(False)
         for pin in self.pins:
-            GPIO.setup(pin, GPIO.OUT)
-            GPIO.output(pin, GPIO.LOW)
+            self.gpio.setup(pin, self.gpio.OUT)
+            self.gpio.output(pin, self.gpio.LOW)
+
+        # Pin levels as a bitmask, bit i = self.pins[i]; every write goes through here
+        self.state = 0
+        # (current state, target state) -> (pins, levels) for one GPIO.output() call
+        self._transitions = {
+            (current, target): self._plan_transition(current, target)
+            for current in range(1 << len(self.pins))
+            for target in list(CHANNEL_STATES.values()) + [current & ~1]
+        }
+        self.switch_latency = LatencyHistogram()
         
         logging.info(f"GPIO Controller multiplexer initialized with pins: {self.pins}")
+
+    def _plan_transition(self, current, target):
+        """
+        Pin writes taking the multiplexer from current to target without lighting an unintended channel
+
+        One address line changing while enabled is a clean single-pin switch. When
+        several change, or the output is switched off, the enable pin goes low
+        first (break before make) and comes back up only once the address is final.
+        """
+        enabled = current & 1
+        address_changes = [i for i in range(1, len(self.pins)) if (current ^ target) >> i & 1]
+        steps = []
+        if enabled and (len(address_changes) > 1 or not target & 1):
+            steps.append((0, 0))
+            enabled = 0
+        steps += [(i, target >> i & 1) for i in address_changes]
+        if target & 1 and not enabled:
+            steps.append((0, 1))
+        return ([self.pins[i] for i, _ in steps],
+                [self.gpio.HIGH if level else self.gpio.LOW for _, level in steps])
+
+    def _apply(self, target):
+        start = time.perf_counter()
+        pins, levels = self._transitions[(self.state, target)]
+        if pins:
+            self.gpio.output(pins, levels)
+        self.state = target
+        elapsed = time.perf_counter() - start
+        self.switch_latency.record(elapsed)
+        if pins and self.events is not None:
+            self.events.record("channel", channel=(target >> 1) + 1 if target & 1 else 0)
+        return elapsed
+
+    def switch(self, channel):
+        """
+        Route the output to channel 1-8, writing only the pins that change in one GPIO call
+
+        Returns:
+            float: Time the switch took in seconds
+        """
+        if channel not in CHANNEL_STATES:
+            raise ValueError(f"Channel must be 1-8, got {channel}")
+        elapsed = self._apply(CHANNEL_STATES[channel])
+        logging.debug(f"Multiplexer switched to channel {channel} in {elapsed * 1e6:.1f} µs")
+        return elapsed
+
+    def off(self):
+        """Disable the output; the address lines are left as they are."""
+        return self._apply(self.state & ~1)
+
+    def active_channel(self):
+        """The channel currently routed, or None when the output is disabled."""
+        if not self.state & 1:
+            return None
+        return (self.state >> 1) + 1
+
+    def switch_stats(self):
+        return self.switch_latency.summary()
     
     def set_pin(self, pin_index, state):        
         pin = self.pins[pin_index]
-        GPIO.output(pin, GPIO.HIGH if state else GPIO.LOW)
-        logging.info(f"Pin {pin} (index {pin_index}) set to {'HIGH' if state else 'LOW'}")
+        self.gpio.output(pin, self.gpio.HIGH if state else self.gpio.LOW)
+        if state:
+            self.state |= 1 << pin_index
+        else:
+            self.state &= ~(1 << pin_index)
+        logging.debug(f"Pin {pin} (index {pin_index}) set to {'HIGH' if state else 'LOW'}")
         return True
     
     def set_all_pins(self, state):
-        for i in range(len(self.pins)):
-            self.set_pin(i, state)
+        self.gpio.output(self.pins, self.gpio.HIGH if state else self.gpio.LOW)
+        self.state = (1 << len(self.pins)) - 1 if state else 0
     
     def cleanup(self):
-        GPIO.cleanup()
+        self.gpio.cleanup()
         logging.info("GPIO cleanup complete")
 
-    def Switch_1(self):
-        self.set_all_pins(state=False)
-        self.set_pin(pin_index=0, state=True) 
-
-    def Switch_2(self):
-        self.set_all_pins(state=False)
-        self.set_pin(pin_index=0, state=True) 
-        self.set_pin(pin_index=1, state=True) 
-
-    def Switch_3(self):
-        self.set_all_pins(state=False)
-        self.set_pin(pin_index=0, state=True) 
-        self.set_pin(pin_index=2, state=True) 
-
-    def Switch_4(self):
-        self.set_all_pins(state=False)
-        self.set_pin(pin_index=0, state=True)
-        self.set_pin(pin_index=1, state=True)
-        self.set_pin(pin_index=2, state=True)
-
-    def Switch_5(self):
-        self.set_all_pins(state=False)
-        self.set_pin(pin_index=0, state=True)
-        self.set_pin(pin_index=3, state=True) 
-
-    def Switch_6(self):
-        self.set_all_pins(state=False)
-        self.set_pin(pin_index=0, state=True)
-        self.set_pin(pin_index=3, state=True)
-        self.set_pin(pin_index=1, state=True)
-
-    def Switch_7(self):
-        self.set_all_pins(state=False)
-        self.set_pin(pin_index=0, state=True)
-        self.set_pin(pin_index=3, state=True)
-        self.set_pin(pin_index=2, state=True)
-
-    def Switch_8(self):
-        self.set_all_pins(state=True)
-
 @dataclass
 class CalibrationPoint:
     name: str
@@ -96,8 +195,82 @@ class CalibrationPoint:
     voltage: float
     notes: str = ""
 
+
+class CalibrationLUT:
+    """
+    Measured wiper voltage for every AD5260 code, interpolated from calibration points
+
+    voltages[code] is np.interp between the measured points, extended linearly
+    past the first and last one. code_for() inverts it with a binary search,
+    which needs the table to be monotonic, as the wiper voltage is.
+    """
+    def __init__(self, voltages):
+        self.voltages = np.asarray(voltages, dtype=float)
+        if self.voltages.shape != (256,):
+            raise ValueError("A calibration LUT has exactly 256 entries")
+        if not np.all(np.isfinite(self.voltages)):
+            raise ValueError("Calibrated voltages must be finite")
+        steps = np.diff(self.voltages)
+        if not (np.all(steps >= 0) or np.all(steps <= 0)):
+            raise ValueError("Calibrated voltages must be monotonic in the code")
+        self._descending = self.voltages[-1] < self.voltages[0]
+        self._ascending = self.voltages[::-1] if self._descending else self.voltages
+
+    @classmethod
+    def from_points(cls, points):
+        # Repeated measurements at one code are averaged, so every code appears once
+        codes, index = np.unique([p.code for p in points], return_inverse=True)
+        codes = codes.astype(float)
+        voltages = (np.bincount(index, weights=[p.voltage for p in points], minlength=len(codes))
+                    / np.bincount(index, minlength=len(codes)))
+        if len(codes) < 2:
+            raise ValueError("Calibration needs points at two or more distinct codes")
+        all_codes = np.arange(256)
+        lut = np.interp(all_codes, codes, voltages)
+        for edge, (i, j) in ((all_codes < codes[0], (0, 1)), (all_codes > codes[-1], (-2, -1))):
+            slope = (voltages[j] - voltages[i]) / (codes[j] - codes[i])
+            lut[edge] = voltages[i] + slope * (all_codes[edge] - codes[i])
+        return cls(lut)
+
+    def voltage(self, code):
+        return self.voltages[np.asarray(code, dtype=int)]
+
+    def code_for(self, voltage):
+        """Code whose calibrated voltage is nearest to voltage (scalar or array)."""
+        voltage = np.asarray(voltage, dtype=float)
+        hi = np.clip(np.searchsorted(self._ascending, voltage), 1, 255)
+        lo = hi - 1
+        nearest = np.where(voltage - self._ascending[lo] <= self._ascending[hi] - voltage, lo, hi)
+        if self._descending:
+            nearest = 255 - nearest
+        return nearest.astype(np.uint8)
+
+    @classmethod
+    def for_file(cls, filename, points, cache_dir=None):
+        """
+        LUT for a calibration file, reusing the compiled table cached for the same file contents
+
+        The cache is an .npy file named after the SHA-256 of the calibration file,
+        so editing the file invalidates it automatically.
+        """
+        with open(filename, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(filename)), ".calibration_cache")
+        cache_path = os.path.join(cache_dir, f"ad5260_lut_{digest}.npy")
+        if os.path.exists(cache_path):
+            try:
+                return cls(np.load(cache_path))
+            except (OSError, ValueError) as e:
+                logging.warning(f"[AD5260] Ignoring unreadable LUT cache {cache_path}: {str(e)}")
+        lut = cls.from_points(points)
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(cache_path, lut.voltages)
+        return lut
+
+
 class AD5260Controller:
-    def __init__(self, pins=[14, 9, 10, 25, 8], rab=20000, vdd=5.0, vss=0.0):
+    def __init__(self, pins=[14, 9, 10, 25, 8], rab=20000, vdd=5.0, vss=0.0, gpio=None, spi=None,
+                 hardware_cs=False, events=None):
         """
         Initialize SPI interface for AD5260 control.
         Parameters:
@@ -105,6 +278,11 @@ class AD5260Controller:
         - rab: Nominal resistance (20kΩ, 50kΩ, or 200kΩ)
         - vdd: Positive supply voltage (default 5.0V)
         - vss: Negative supply voltage (default 0.0V)
+        - gpio: RPi.GPIO-compatible backend (default: RPi.GPIO)
+        - spi: Unopened spidev.SpiDev-compatible handle (default: spidev.SpiDev())
+        - hardware_cs: Let the SPI driver assert CS (CS* must be CE0, BCM 8) instead of toggling it
+          through GPIO around every transfer
+        - events: EventBus that gets a "wiper" event for every code written (optional)
         """
         print(f"Initializing AD5260 with pins: {pins}, RAB: {rab}Ω, VDD: {vdd}V, VSS: {vss}V")
         self.CLK = pins[0]  # Clock
@@ -119,74 +297,224 @@ class AD5260Controller:
         self.vss = vss      # Negative supply
 
         self.calibration_points = []
-
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        GPIO.setup(self.PR, GPIO.OUT)
-        GPIO.output(self.PR, GPIO.HIGH)  # Deassert reset
-        GPIO.setup(self.CS, GPIO.OUT)
-        GPIO.output(self.CS, GPIO.HIGH)  # Deselect device
+        self.lut = None     # CalibrationLUT once a calibration is loaded; the datasheet formula until then
+        self.hardware_cs = hardware_cs
+        self.events = events
+        if hardware_cs and self.CS not in HARDWARE_CS_PINS:
+            raise ValueError(f"Hardware CS needs CS* on BCM {sorted(HARDWARE_CS_PINS)}, got {self.CS}")
+        # The CE line this chip occupies: the one on its CS* pin; no other SPI device may use it
+        self.spi_device = self.chip_select_device(self.CS)
+        self.code = None    # Last code written; None until the first write
+        self.writes = 0
+        self.skipped_writes = 0
+
+        self.gpio = gpio if gpio is not None else _require(GPIO, "RPi.GPIO")
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setwarnings(False)
+        self.gpio.setup(self.PR, self.gpio.OUT)
+        self.gpio.output(self.PR, self.gpio.HIGH)  # Deassert reset
+        if not hardware_cs:
+            self.gpio.setup(self.CS, self.gpio.OUT)
+            self.gpio.output(self.CS, self.gpio.HIGH)  # Deselect device
         
         # Setup SPI bus (using hardware SPI)
-        self.spi = spidev.SpiDev()
-        self.spi.open(0, 1)  # Bus 0, CE1
+        self.spi = spi if spi is not None else _require(spidev, "spidev").SpiDev()
+        self.spi.open(0, self.spi_device)  # Bus 0, the CE on CS*
+        if not hardware_cs:
+            self.spi.no_cs = True  # CS* is toggled through GPIO; the driver must not assert any CE line
         self.spi.max_speed_hz = 500000
         self.spi.mode = 0b00  # CPOL=0, CPHA=0
         
-        logging.info(f"[AD5260] Initialized | RAB={rab/1000}kΩ | VDD={vdd}V | VSS={vss}V")
+        logging.info(f"[AD5260] Initialized | RAB={rab/1000}kΩ | VDD={vdd}V | VSS={vss}V | "
+                     f"CS={'hardware' if hardware_cs else 'GPIO'}")
+
+    @staticmethod
+    def chip_select_device(cs_pin):
+        """spidev device (CE line) of bus 0 that an AD5260 with CS* on cs_pin occupies."""
+        return HARDWARE_CS_PINS.get(cs_pin, 0)
 
     def reset(self):
-        GPIO.output(self.PR, GPIO.LOW)
+        self.gpio.output(self.PR, self.gpio.LOW)
         time.sleep(0.01)  # 10ms pulse width
-        GPIO.output(self.PR, GPIO.HIGH)
+        self.gpio.output(self.PR, self.gpio.HIGH)
+        self.code = 128
         logging.info("[AD5260] Reset to midscale (code 128)")
 
-    def set_resistance(self, code):
+    def _write(self, code):
+        if self.hardware_cs:
+            self.spi.xfer2([code])
+        else:
+            self.gpio.output(self.CS, self.gpio.LOW)
+            self.spi.xfer2([code])
+            self.gpio.output(self.CS, self.gpio.HIGH)
+        self.code = code
+        self.writes += 1
+        if self.events is not None:
+            self.events.record("wiper", code=code)
+
+    def set_resistance(self, code, force=False):
         """
         Set wiper position (0-255)
         0 = minimum resistance (A terminal)
         255 = maximum resistance (B terminal)
+        The write is skipped when the wiper is already at code, unless force is set.
         """
         if not 0 <= code <= 255:
             raise ValueError("Code must be 0-255")
-            
-        data = [code]
-        GPIO.output(self.CS, GPIO.LOW)
-        self.spi.xfer2(data)
-        GPIO.output(self.CS, GPIO.HIGH)
-        
-        logging.info(f"[AD5260] Set code: {code} | Expected voltage: {self.calculate_voltage(code):.2f}V")
+        if code == self.code and not force:
+            self.skipped_writes += 1
+            return
+        self._write(int(code))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[AD5260] Set code: {code} | Expected voltage: {self.calculate_voltage(code):.2f}V")
+
+    def _check_codes(self, codes):
+        codes = np.asarray(codes)
+        if codes.size and (codes.min() < 0 or codes.max() > 255):
+            raise ValueError("Codes must be 0-255")
+        return codes.astype(int)
+
+    def _run_schedule(self, codes, offsets, job=NULL_JOB, progress=None):
+        """
+        Write codes[i] at start + offsets[i] (perf_counter seconds)
+        Every write is scheduled against the start time rather than the previous
+        write, so timing errors do not accumulate. Codes equal to the current
+        wiper position are not re-sent.
+        Returns:
+        - (start, write_times, skipped): perf_counter start, perf_counter time of each step, skipped count
+        """
+        codes = codes.tolist()
+        offsets = np.asarray(offsets, dtype=float).tolist()
+        write_times = np.empty(len(codes))
+        skipped = 0
+        start = time.perf_counter()
+        for i, code in enumerate(codes):
+            job.check()
+            deadline = start + offsets[i]
+            remaining = deadline - time.perf_counter()
+            if remaining > 0.002:
+                time.sleep(remaining - 0.001)  # sleep overshoots; spin the last millisecond
+            while time.perf_counter() < deadline:
+                pass
+            if code == self.code:
+                skipped += 1
+            else:
+                self._write(code)
+            write_times[i] = time.perf_counter()
+            if progress is not None:
+                progress(i)
+        self.skipped_writes += skipped
+        return start, write_times, skipped
+
+    def write_codes(self, codes, dt, job=NULL_JOB):
+        """
+        Stream a precomputed code sequence, one code every dt seconds, on a drift-free schedule.
+        Parameters:
+        - codes: Sequence or array of integer codes 0-255
+        - dt: Interval between codes (s)
+        - job: CommandExecutor job, checked for cancellation between codes
+        Returns:
+        - dict with writes, skipped, max_late_s (worst lateness against the schedule) and duration_s
+        """
+        codes = self._check_codes(codes)
+        offsets = np.arange(len(codes)) * dt
+        start, write_times, skipped = self._run_schedule(
+            codes, offsets, job, progress=lambda i: job.progress(i + 1, len(codes), code=int(codes[i])))
+        stats = {
+            "writes": len(codes) - skipped,
+            "skipped": skipped,
+            "max_late_s": float(np.max(write_times - start - offsets)) if len(codes) else 0.0,
+            "duration_s": time.perf_counter() - start,
+        }
+        logging.info(f"[AD5260] Streamed {len(codes)} codes at {dt * 1e3:.3f} ms intervals | {stats}")
+        return stats
 
     def calculate_voltage(self, code):
         """
         Calculate expected wiper voltage based on current code.
-        Formula from AD5260 datasheet: V_W = (D/256)*(V_A - V_B) + V_B
+        Uses the calibration LUT when one is loaded, otherwise the
+        formula from AD5260 datasheet: V_W = (D/256)*(V_A - V_B) + V_B
         """
+        if self.lut is not None:
+            return self.lut.voltage(code)
         return (code / 256) * (self.vdd - self.vss) + self.vss
 
-    def voltage_sweep(self, start_v, end_v, steps, duration=2):
-        if not (self.vss <= start_v <= self.vdd) or not (self.vss <= end_v <= self.vdd):
+    def voltage_to_code(self, voltage):
+        """Nearest wiper code for a voltage (scalar or array), the inverse of calculate_voltage."""
+        if self.lut is not None:
+            return self.lut.code_for(voltage)
+        codes = np.rint((np.asarray(voltage, dtype=float) - self.vss) * 256 / (self.vdd - self.vss))
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def set_voltage(self, voltage, force=False):
+        """Set the wiper to the code nearest to voltage in a single write; returns the code."""
+        code = int(self.voltage_to_code(voltage))
+        self.set_resistance(code, force=force)
+        return code
+
+    def sweep_profile(self, start_v, end_v, steps, profile="linear", voltages=None):
+        """
+        Target voltages of a sweep: steps + 1 points from start_v to end_v
+        Parameters:
+        - profile: "linear", "log" (geometric spacing; both ends must be non-zero with the same sign)
+          or "custom" (voltages is used as given)
+        - voltages: Target voltages for the custom profile
+        """
+        if profile == "custom":
+            if voltages is None or len(voltages) == 0:
+                raise ValueError("The custom profile needs a list of voltages")
+            targets = np.asarray(voltages, dtype=float)
+        else:
+            steps = int(steps)
+            if steps < 1:
+                raise ValueError("A sweep needs at least 1 step")
+            if profile == "linear":
+                targets = np.linspace(start_v, end_v, steps + 1)
+            elif profile == "log":
+                if start_v * end_v <= 0:
+                    raise ValueError("The log profile needs start and end voltages of the same sign, neither 0")
+                targets = np.geomspace(start_v, end_v, steps + 1)
+            else:
+                raise ValueError(f"Unknown sweep profile: {profile}")
+        if targets.min() < self.vss or targets.max() > self.vdd:
             raise ValueError(f"Voltages must be between {self.vss}V and {self.vdd}V")
-        results = []
-        step_size = (end_v - start_v) / steps
-        logging.info(f"[AD5260] Starting sweep: {start_v}V → {end_v}V ({steps} steps)")
-        
-        for step in range(steps + 1):
-            target_v = start_v + step * step_size
-            code = int(255 * (target_v - self.vss) / (self.vdd - self.vss))
-            code = max(0, min(255, code))  # Clamp to valid range
-            
-            self.set_resistance(code)
-            time.sleep(duration)
-            
-            results.append({
-                'step': step,
-                'code': code,
-                'target_v': target_v,
-                'actual_v': self.calculate_voltage(code),
-                'timestamp': time.time()
-            })
-        
+        return targets
+
+    def voltage_sweep(self, start_v, end_v, steps, duration=2, profile="linear", voltages=None, job=NULL_JOB):
+        """
+        Sweep the wiper through a precomputed voltage profile in duration seconds.
+        Each of the N points is held for duration / N, scheduled against perf_counter
+        deadlines, so the whole sweep takes duration regardless of the write cost.
+        Parameters:
+        - start_v, end_v, steps, profile, voltages: see sweep_profile
+        - duration: Total sweep time (s)
+        - job: CommandExecutor job, used to report progress and stop early on cancel
+        Returns:
+        - numpy record array (SWEEP_RECORD) with one row per point
+        """
+        targets = self.sweep_profile(start_v, end_v, steps, profile, voltages)
+        codes = self.voltage_to_code(targets)
+        n = len(targets)
+        offsets = np.arange(n) * (duration / n)
+        logging.info(f"[AD5260] Starting {profile} sweep: {targets[0]}V → {targets[-1]}V ({n} points in {duration}s)")
+
+        def progress(i):
+            job.progress(i + 1, n, code=int(codes[i]), target_v=float(targets[i]))
+
+        wall_start = time.time()
+        start, write_times, skipped = self._run_schedule(codes, offsets, job, progress)
+        job.sleep(start + duration - time.perf_counter())  # hold the last point for its share
+
+        results = np.empty(n, dtype=SWEEP_RECORD)
+        results["step"] = np.arange(n)
+        results["code"] = codes
+        results["target_v"] = targets
+        results["actual_v"] = self.calculate_voltage(codes)
+        results["scheduled_s"] = offsets
+        results["late_s"] = write_times - start - offsets
+        results["timestamp"] = wall_start + (write_times - start)
+        logging.info(f"[AD5260] Sweep done | {n - skipped} writes, {skipped} unchanged | "
+                     f"max late {results['late_s'].max() * 1e3:.3f} ms")
         return results
 
     def save_calibration(self, filename="ad5260_calibration.json"):
@@ -206,11 +534,12 @@ class AD5260Controller:
         with open(filename) as f:
             data = json.load(f)
         self.calibration_points = [CalibrationPoint(**p) for p in data['calibration']]
+        self.lut = CalibrationLUT.for_file(filename, self.calibration_points) if self.calibration_points else None
         logging.info(f"[AD5260] Loaded {len(self.calibration_points)} calibration points")
 
     def cleanup(self):
         self.spi.close()
-        GPIO.cleanup()
+        self.gpio.cleanup()
         logging.info("[AD5260] Cleaned up SPI and GPIO")
 
 """class MAX31865Controller:
@@ -238,53 +567,152 @@ class AD5260Controller:
         return resistance"""
 
 
+class MAX31865Fault(RuntimeError):
+    """The MAX31865 flagged a fault; the reading it came with is not usable."""
+    def __init__(self, status):
+        self.status = status
+        self.faults = [name for bit, name in MAX31865_FAULTS.items() if status & bit]
+        super().__init__(f"MAX31865 fault 0x{status:02x}: {', '.join(self.faults) or 'unknown'}")
+
+
+def rtd_temperature_c(resistance, rtd_nominal=1000.0):
+    """
+    RTD resistance (Ω, scalar or array) -> temperature (°C)
+
+    Inverse Callendar-Van Dusen above 0 °C and the Analog Devices polynomial
+    below, the same math as adafruit_max31865, vectorised. NaN where the
+    resistance is beyond the range of the curve.
+    """
+    resistance = np.asarray(resistance, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        cvd = (np.sqrt(RTD_A * RTD_A - 4 * RTD_B + 4 * RTD_B / rtd_nominal * resistance) - RTD_A) / (2 * RTD_B)
+    r = resistance / rtd_nominal * 100  # the polynomial is for a 100 Ω RTD
+    poly = -242.02 + r * (2.2228 + r * (2.5859e-3 + r * (-4.8260e-6 + r * (-2.8183e-8 + r * 1.5243e-10))))
+    return np.where(cvd >= 0, cvd, np.where(np.isnan(cvd), np.nan, poly))
+
+
 class MAX31865Controller:
-    def __init__(self, cs_pin=5, wires=3, rtd_nominal=1000.0, ref_resistor=4300.0):
+    def __init__(self, cs_pin=5, wires=3, rtd_nominal=1000.0, ref_resistor=4300.0, sensor=None,
+                 driver="adafruit", spi=None, spi_device=1, filter_hz=60, fault_check_interval=1.0):
         """
-        cs_pin: BCM pin for chip select (default D5)
+        cs_pin: BCM pin for chip select (default D5); adafruit driver only
         wires: 2, 3, or 4 (default: 4 for PT100)
+        sensor: object with the adafruit MAX31865 interface (default: the real chip)
+        driver: "adafruit" triggers a one-shot conversion per read (~75 ms);
+                "registers" runs the chip in auto-conversion mode and reads the RTD
+                registers over spidev, one 3-byte transfer per read
+        spi: Unopened spidev.SpiDev-compatible handle for the registers driver (default: spidev.SpiDev())
+        spi_device: CE line of bus 0 wired to the MAX31865's CS (registers driver)
+        filter_hz: Mains filter, 60 (a conversion every ~16.7 ms) or 50 (~20 ms)
+        fault_check_interval: Seconds between fault register checks during reads
         """
-        spi = board.SPI()
-        cs = digitalio.DigitalInOut(getattr(board, f"D{cs_pin}"))
-
-        self.sensor = adafruit_max31865.MAX31865(
-            spi, cs,
-            rtd_nominal=int(rtd_nominal),
-            ref_resistor=ref_resistor,
-            wires=wires
-        )
+        self.driver = driver
+        self.rtd_nominal = rtd_nominal
+        self.ref_resistor = ref_resistor
+        self.fault_check_interval = fault_check_interval
+        self.faults = []
+        self._last_fault_check = 0.0
+        if driver == "registers":
+            self.sensor = None
+            self.spi = spi if spi is not None else _require(spidev, "spidev").SpiDev()
+            self.spi.open(0, spi_device)
+            self.spi.max_speed_hz = 1000000
+            self.spi.mode = 0b01  # CPOL=0, CPHA=1
+            self.config = MAX31865_BIAS | MAX31865_AUTO
+            if wires == 3:
+                self.config |= MAX31865_THREE_WIRE
+            if filter_hz == 50:
+                self.config |= MAX31865_FILTER_50HZ
+            # Temperature for every 15-bit ADC code, so a read is one transfer and one index
+            self.lut = rtd_temperature_c(np.arange(1 << 15) * ref_resistor / (1 << 15), rtd_nominal)
+            self._write_register(MAX31865_CONFIG, self.config | MAX31865_FAULT_CLEAR)
+            time.sleep(0.1)  # bias settling plus the first conversion
+        elif driver == "adafruit":
+            if sensor is not None:
+                self.sensor = sensor
+            else:
+                _require(adafruit_max31865, "adafruit_max31865")
+                spi = board.SPI()
+                cs = digitalio.DigitalInOut(getattr(board, f"D{cs_pin}"))
+
+                self.sensor = adafruit_max31865.MAX31865(
+                    spi, cs,
+                    rtd_nominal=int(rtd_nominal),
+                    ref_resistor=ref_resistor,
+                    wires=wires
+                )
+        else:
+            raise ValueError(f"Unknown MAX31865 driver: {driver}")
 
         logging.info(
-            f"[MAX31865] Initialized | "
+            f"[MAX31865] Initialized | Driver={driver} | "
             f"Wires={wires} | Nominal={rtd_nominal}Ω | Ref={ref_resistor}Ω"
         )
-
-        faults = self.sensor.fault
-        fault_names = [
-            "High threshold exceeded",
-            "Low threshold exceeded",
-            "Reference low",
-            "Reference high",
-            "RTD input low (short to GND)",
-            "Over/under voltage"
-        ]
-        for name, active in zip(fault_names, faults):
-            if active:
-                print(f"Fault detected: {name}")
-        if not any(faults):
+        faults = self.check_faults()
+        if not faults:
             print("No fault detected")
 
+    def _write_register(self, address, value):
+        self.spi.xfer2([address | 0x80, value])
+
+    def _read_code(self):
+        msb, lsb = self.spi.xfer2([MAX31865_RTD_MSB, 0, 0])[1:]
+        if lsb & 0x01:
+            raise self._fault(self._read_fault_status())
+        return (msb << 7) | (lsb >> 1)
+
+    def _read_fault_status(self):
+        if self.driver == "registers":
+            return self.spi.xfer2([MAX31865_FAULT_STATUS, 0])[1]
+        return sum(bit for bit, active in zip(MAX31865_FAULTS, self.sensor.fault) if active)
+
+    def _fault(self, status):
+        # Clearing leaves auto-conversion running; the error goes to the caller
+        if self.driver == "registers":
+            self._write_register(MAX31865_CONFIG, self.config | MAX31865_FAULT_CLEAR)
+        else:
+            self.sensor.clear_faults()
+        fault = MAX31865Fault(status)
+        self.faults = fault.faults
+        logging.warning(f"[MAX31865] {str(fault)}")
+        return fault
+
+    def check_faults(self):
+        """Read the fault register; returns the active fault names (logged, and cleared on the chip)."""
+        self._last_fault_check = time.monotonic()
+        status = self._read_fault_status()
+        self.faults = self._fault(status).faults if status else []
+        return self.faults
+
+    def _check_faults_due(self):
+        # The register driver also sees faults flagged with each reading; this catches the rest
+        if time.monotonic() - self._last_fault_check >= self.fault_check_interval:
+            self._last_fault_check = time.monotonic()
+            status = self._read_fault_status()
+            if status:
+                raise self._fault(status)
+
     def read_temperature_c(self):
-        temp_c = self.sensor.temperature
-        logging.info(f"[MAX31865] Temperature: {temp_c:.2f} °C")
+        self._check_faults_due()
+        if self.driver == "registers":
+            temp_c = float(self.lut[self._read_code()])
+        else:
+            temp_c = self.sensor.temperature
+        logging.debug(f"[MAX31865] Temperature: {temp_c:.2f} °C")
         return temp_c
 
     def read_temperature_k(self):
         return self.read_temperature_c() + 273.15
 
     def read_resistance(self):
-        resistance = self.sensor.resistance
-        logging.info(f"[MAX31865] Resistance: {resistance:.2f} Ω")
+        if self.driver == "registers":
+            resistance = self._read_code() * self.ref_resistor / (1 << 15)
+        else:
+            resistance = self.sensor.resistance
+        logging.debug(f"[MAX31865] Resistance: {resistance:.2f} Ω")
         return resistance
-    
 
+    def cleanup(self):
+        if self.driver == "registers":
+            self._write_register(MAX31865_CONFIG, 0)  # bias off, conversions stop
+            self.spi.close()
@@ -0,0 +1,222 @@
+"""
+In-process MQTT broker and paho-compatible client, for running the backend and
+UI clients in one process without a network broker (benchmarks, bench-less
+development). Only the part of the paho.mqtt.client.Client API this project
+uses is implemented. As with paho's loop_start(), every client delivers its
+callbacks on its own network thread.
+"""
+import itertools
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def topic_matches(subscription, topic):
+    """MQTT topic filter matching with '+' (one level) and '#' (rest of the topic)."""
+    sub_levels = subscription.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(sub_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(sub_levels) == len(topic_levels)
+
+
+class LoopbackMessage:
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+
+
+class LoopbackMessageInfo:
+    rc = 0
+
+    def __init__(self, mid):
+        self.mid = mid
+
+    def is_published(self):
+        return True
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+
+class LoopbackBroker:
+    _default = None
+    _default_lock = threading.Lock()
+
+    @classmethod
+    def default(cls):
+        """The process-wide broker shared by every client created with client_factory()."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def __init__(self):
+        self._clients = []
+        self._retained = {}
+        self._lock = threading.Lock()
+        self._mids = itertools.count(1)
+        self.published = 0
+
+    def client(self, client_id="", **kwargs):
+        """paho-style constructor: pass broker.client as MQTTHandler's client_factory."""
+        return LoopbackClient(self, client_id)
+
+    def _attach(self, client):
+        with self._lock:
+            if client not in self._clients:
+                self._clients.append(client)
+
+    def _detach(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def _publish(self, topic, payload, qos, retain):
+        mid = next(self._mids)
+        message = LoopbackMessage(topic, payload, qos, retain, mid)
+        with self._lock:
+            self.published += 1
+            if retain:
+                if payload:
+                    self._retained[topic] = message
+                else:
+                    self._retained.pop(topic, None)
+            clients = list(self._clients)
+        for client in clients:
+            if client._subscribed_to(topic):
+                client._deliver(message)
+        return mid
+
+    def _retained_for(self, subscription):
+        with self._lock:
+            return [m for topic, m in self._retained.items() if topic_matches(subscription, topic)]
+
+
+class LoopbackClient:
+    def __init__(self, broker, client_id=""):
+        self._broker = broker
+        self._client_id = client_id
+        self._subscriptions = {}
+        self._callbacks = []
+        self._inbox = queue.Queue()
+        self._thread = None
+        self._connected = False
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.userdata = None
+
+    def connect(self, host="localhost", port=1883, keepalive=60, **kwargs):
+        self._connected = True
+        self._broker._attach(self)
+        self._inbox.put(lambda: self.on_connect and self.on_connect(self, self.userdata, {}, 0))
+        return 0
+
+    connect_async = connect
+
+    def reconnect(self):
+        return self.connect()
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def is_connected(self):
+        return self._connected
+
+    def disconnect(self, *args, **kwargs):
+        if self._connected:
+            self._connected = False
+            self._broker._detach(self)
+            self._inbox.put(lambda: self.on_disconnect and self.on_disconnect(self, self.userdata, 0))
+        return 0
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name=f"loopback-{self._client_id}", daemon=True)
+            self._thread.start()
+        return 0
+
+    def loop_stop(self):
+        if self._thread is not None:
+            self._inbox.put(None)
+            if self._thread is not threading.current_thread():
+                self._thread.join(timeout=5)
+            self._thread = None
+        return 0
+
+    def subscribe(self, topic, qos=0, **kwargs):
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        for sub, sub_qos in topics:
+            self._subscriptions[sub] = sub_qos
+            for message in self._broker._retained_for(sub):
+                self._deliver(message)
+        return 0, next(self._broker._mids)
+
+    def unsubscribe(self, topic, **kwargs):
+        for sub in (topic if isinstance(topic, list) else [topic]):
+            self._subscriptions.pop(sub, None)
+        return 0, next(self._broker._mids)
+
+    def message_callback_add(self, sub, callback):
+        self._callbacks.append((sub, callback))
+
+    def message_callback_remove(self, sub):
+        self._callbacks = [(s, cb) for s, cb in self._callbacks if s != sub]
+
+    def publish(self, topic, payload=None, qos=0, retain=False, **kwargs):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif payload is None:
+            payload = b""
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode("utf-8")
+        mid = self._broker._publish(topic, bytes(payload), qos, retain)
+        if self.on_publish:
+            self._inbox.put(lambda: self.on_publish(self, self.userdata, mid))
+        return LoopbackMessageInfo(mid)
+
+    def _subscribed_to(self, topic):
+        return self._connected and any(topic_matches(sub, topic) for sub in self._subscriptions)
+
+    def _deliver(self, message):
+        self._inbox.put(message)
+
+    def _loop(self):
+        while True:
+            item = self._inbox.get()
+            if item is None:
+                break
+            try:
+                if callable(item):
+                    item()
+                else:
+                    self._dispatch(item)
+            except Exception as e:
+                logger.error(f"Loopback client {self._client_id}: callback failed: {str(e)}")
+
+    def _dispatch(self, message):
+        # Same rule as paho: topic-specific callbacks replace on_message
+        matched = False
+        for sub, callback in list(self._callbacks):
+            if topic_matches(sub, message.topic):
+                matched = True
+                callback(self, self.userdata, message)
+        if not matched and self.on_message:
+            self.on_message(self, self.userdata, message)
+
+
+def client_factory(client_id="", **kwargs):
+    """Create a client on the process-wide default broker."""
+    return LoopbackBroker.default().client(client_id=client_id, **kwargs)
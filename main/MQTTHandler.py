@@ -5,6 +5,12 @@ import json
 import logging
 from typing import Callable, Dict, Optional
 import paho.mqtt.client as mqtt
+from MQTTOutbox import MQTTOutbox, TopicPolicy
+from TopicRouter import TopicRouter
+from OfflineQueue import OfflineQueue
+from Metrics import LatencyHistogram
+import threading
+import PayloadCodecs
 
 # Configure logging
 logging.basicConfig(
@@ -17,31 +23,113 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def _job_progress_key(payload):
+    # Progress events of one job replace each other while queued; every other status event is kept
+    if isinstance(payload, dict) and payload.get("event") == "progress":
+        return payload.get("id")
+    return None
+
+
+def default_topic_policies(topics):
+    """Publish policies for the standard topics: batched QoS 0 telemetry, coalesced job progress."""
+    return {
+        topics.get("temperature", "/temperature"): TopicPolicy(qos=0, batch_interval=0.5, max_batch=50),
+        topics.get("operation_status", "/status"): TopicPolicy(qos=1, coalesce_key=_job_progress_key),
+        topics.get("control_response", "/control_response"): TopicPolicy(qos=1),
+        topics.get("UI_command", "/ui_command"): TopicPolicy(qos=1),
+    }
+
+
+def default_topic_codecs(topics):
+    """Codec per topic for what this client sends; topics not listed stay JSON text."""
+    return {
+        topics.get("temperature", "/temperature"): "temperature",
+    }
+
+def paho_client_factory(client_id="", clean_session=False, **kwargs):
+    """paho Client with the callback signatures this module uses, on paho 1.x and 2.x alike."""
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id, clean_session=clean_session, **kwargs)
+    return mqtt.Client(client_id=client_id, clean_session=clean_session, **kwargs)
+
+
 #I dont want a localhost, however at run time this should be replaced with the correct IP from the call coming from the HighlevelControll intialization
 class MQTTHandler:
-    def __init__(self, client_id: str, broker: str = "localhost", port: int = 1883, topics: Optional[Dict[str, str]] = None):
+    def __init__(self, client_id: str, broker: str = "localhost", port: int = 1883, topics: Optional[Dict[str, str]] = None,
+                 client_factory: Optional[Callable] = None, policies: Optional[Dict[str, TopicPolicy]] = None,
+                 max_publish_rate: float = 1000.0, codecs: Optional[Dict[str, str]] = None,
+                 keepalive: int = 60, clean_session: bool = False, reconnect_delay: tuple = (1, 60),
+                 offline_queue_path: str = ":memory:", max_offline_messages: int = 10000,
+                 max_offline_age: Optional[float] = None):
+        """
+        keepalive: Seconds between pings; the broker drops the client after 1.5x this without traffic
+        clean_session: False keeps subscriptions and queued QoS 1 messages on the broker across reconnects
+        reconnect_delay: (min, max) seconds of the exponential reconnect backoff
+        offline_queue_path: SQLite file holding publishes made while disconnected (see OfflineQueue)
+        max_offline_age: Queued messages older than this (s) are discarded instead of replayed
+        """
         self.broker = broker
         self.port = port
         self.client_id = client_id
         self.topics = topics or {}
+        self.keepalive = keepalive
+        self.clean_session = clean_session
+        self.reconnect_delay = reconnect_delay
+        self.max_offline_age = max_offline_age
+        # Builds the paho-compatible client, e.g. LoopbackMQTT.client_factory for an in-process broker
+        self.client_factory = client_factory or paho_client_factory
         self.logger = logging.getLogger(f"{__name__}.{client_id}")
+        self.offline_queue = OfflineQueue(offline_queue_path, max_messages=max_offline_messages)
+        self._offline_lock = threading.Lock()
+        self._replaying = False
+        self._disconnected_at = None
+        self.reconnects = 0
+        self.reconnect_time = LatencyHistogram(min_s=1e-3, max_s=3600.0)
+        self.last_replay = None
         self._setup_client()
+        # Topic -> codec name from PayloadCodecs, e.g. {"/status": "msgpack"}; receiving needs no setup
+        self.codecs = {topic: PayloadCodecs.get_codec(name)
+                       for topic, name in {**default_topic_codecs(self.topics), **(codecs or {})}.items()}
+        # publish() only queues; the outbox thread shapes and sends (see MQTTOutbox)
+        self.outbox = MQTTOutbox(self._publish_now, policies={**default_topic_policies(self.topics), **(policies or {})},
+                                 max_rate=max_publish_rate, encode=self.encode)
 
     def _setup_client(self):
-        self.client = mqtt.Client(client_id=self.client_id)
-        self.client._reconnect_on_failure = True
+        self.client = self.client_factory(client_id=self.client_id, clean_session=self.clean_session)
+        self.client.reconnect_delay_set(min_delay=self.reconnect_delay[0], max_delay=self.reconnect_delay[1])
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.client.on_disconnect = self._on_disconnect
         self.connected = False
-        self._message_handlers = {}
-        
-    def register_handler(self, topic: str, handler: Callable):
-        self._message_handlers[topic] = handler
-        if self.connected:
-            self.client.subscribe(topic)
-            self.logger.info(f"Subscribing the client to topic: {topic}")
-            
+        self.router = TopicRouter()
+        self._subscriptions = {}
+
+    def register_handler(self, topic: str, handler: Callable, executor="inline", qos: int = 0, name: Optional[str] = None):
+        """
+        Call handler(payload) for messages matching topic, which may contain + and # wildcards
+
+        executor: "inline" (network thread), "thread", a concurrent.futures executor or an
+        asyncio event loop; see TopicRouter. Returns the registration for unregister_handler().
+        """
+        registration = self.router.add(topic, handler, executor=executor, name=name)
+        if topic not in self._subscriptions or qos > self._subscriptions[topic]:
+            self._subscriptions[topic] = qos
+            if self.connected:
+                self.client.subscribe(topic, qos=qos)
+                self.logger.info(f"Subscribing the client to topic: {topic}")
+        return registration
+
+    def unregister_handler(self, registration):
+        if self.router.remove(registration):
+            self._subscriptions.pop(registration.topic_filter, None)
+            if self.connected:
+                self.client.unsubscribe(registration.topic_filter)
+
+    def dispatch_stats(self):
+        """Per handler: dispatch delay and run time, see TopicRouter.stats()."""
+        return self.router.stats()
+
     
     def send_response(self, data):
         topic = self.topics.get('control_response', 'control_response')
@@ -53,7 +141,8 @@ class MQTTHandler:
 
     def on_ui_command(self, handler: Callable):
         self.logger.info(f"on_ui_command is reached")
-        self.register_handler(self.topics.get("UI_command", "/ui_command"), handler)
+        # QoS 1 so the broker holds commands for this (persistent) session while it is offline
+        self.register_handler(self.topics.get("UI_command", "/ui_command"), handler, qos=1)
 
     def on_status_update(self, handler: Callable):
         self.register_handler(self.topics.get("operation_status", "/status"), handler)
@@ -62,8 +151,14 @@ class MQTTHandler:
         self.register_handler(self.topics.get("control_response", "/control_response"), handler)
 
     def connect(self):
+        """
+        Start connecting in the background; returns at once
+
+        The network thread keeps retrying with exponential backoff (reconnect_delay)
+        until the broker is reachable, and reconnects the same way after a drop.
+        """
         try:
-            self.client.connect(self.broker, self.port, keepalive=True)
+            self.client.connect_async(self.broker, self.port, keepalive=self.keepalive)
             self.client.loop_start()
             self.logger.info(f"Connecting to MQTT broker at {self.broker}:{self.port}")
             return True
@@ -72,56 +167,127 @@ class MQTTHandler:
             return False        
             
     def disconnect(self):
+        self.outbox.flush(timeout=2.0)
         self.client.publish(self.topics.get('status', 'status'), 
                           json.dumps({"status": "offline"}), 
                           qos=1, 
                           retain=True)
+        # Stops the sender thread, which would otherwise publish through a stopped client
+        self.outbox.close(timeout=2.0)
         self.client.loop_stop()
         self.client.disconnect()
+        self.router.shutdown()
+        self.offline_queue.close()
         self.logger.info("Disconnected from MQTT broker")
     
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            self.connected = True
-            self.logger.info("Successfully connected to MQTT broker")
-            for topic in self._message_handlers:
-                client.subscribe(topic)
+            with self._offline_lock:
+                # Set together, so no new publish can overtake the queued ones
+                self.connected = True
+                replay = len(self.offline_queue) > 0 and not self._replaying
+                self._replaying = self._replaying or replay
+            if self._disconnected_at is not None:
+                elapsed = time.perf_counter() - self._disconnected_at
+                self.reconnect_time.record(elapsed)
+                self._disconnected_at = None
+                self.logger.info(f"Successfully connected to MQTT broker after {elapsed:.3f} s")
+            else:
+                self.logger.info("Successfully connected to MQTT broker")
+            for topic, qos in self._subscriptions.items():
+                client.subscribe(topic, qos=qos)
 
             client.publish(self.topics.get('status', 'status'),
                          json.dumps({"status": "online"}),
                          qos=1,
                          retain=True)
+            if replay:
+                threading.Thread(target=self._replay_offline, name=f"mqtt-replay-{self.client_id}",
+                                 daemon=True).start()
         else:
             self.logger.error(f"Connection failed with code {rc}")
             
     def _on_disconnect(self, client, userdata, rc):
+        if self.connected:
+            self._disconnected_at = time.perf_counter()
+            self.reconnects += 1
         self.connected = False
         if rc != 0:
-            self.logger.warning(f"Unexpected disconnection (code: {rc})")
+            self.logger.warning(f"Unexpected disconnection (code: {rc}), reconnecting in the background")
+
+    def _replay_offline(self):
+        # Send what was queued while offline, oldest first. New publishes keep going
+        # to the queue until it is empty, so nothing overtakes a queued message.
+        start = time.perf_counter()
+        sent = expired = 0
+        while True:
+            with self._offline_lock:
+                rows = self.offline_queue.peek(100) if self.connected else []
+                if not rows:
+                    self._replaying = False
+                    break
+            now = time.time()
+            for message_id, topic, payload, qos, retain, queued_at in rows:
+                if self.max_offline_age is not None and now - queued_at > self.max_offline_age:
+                    expired += 1
+                    continue
+                self.client.publish(topic, payload, qos=qos, retain=bool(retain))
+                sent += 1
+            self.offline_queue.delete_through(rows[-1][0])
+        elapsed = time.perf_counter() - start
+        self.last_replay = {"messages": sent, "expired": expired, "seconds": elapsed,
+                            "per_s": sent / elapsed if elapsed > 0 else None}
+        self.logger.info(f"Replayed offline queue: {self.last_replay}")
             
     def _on_message(self, client, userdata, msg):
         try:
-            payload = msg.payload.decode("utf-8")
-            self.logger.debug(f"Received message on {msg.topic}: {payload}")
-#
-            try:
-                payload = json.loads(payload)
-            except json.JSONDecodeError:
-                pass  # Keep as raw string if not JSON
-                
-            handler = self._message_handlers.get(msg.topic)
-            if handler:
-                handler(payload)
-            else:
+            received = time.perf_counter()
+            payload = self.decode(msg.payload)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Received message on {msg.topic}: {payload}")
+
+            if not self.router.dispatch(msg.topic, payload, received):
                 self.logger.warning(f"No handler registered for topic {msg.topic}")
                 
         except Exception as e:
             self.logger.error(f"Error processing message: {str(e)}")
+
+    def encode(self, topic, payload):
+        """Encode a payload with the topic's codec; str/bytes payloads are sent as they are."""
+        if isinstance(payload, (str, bytes, bytearray)):
+            return payload
+        return PayloadCodecs.encode(payload, self.codecs.get(topic))
+
+    @staticmethod
+    def decode(payload):
+        """Decode a received payload, whatever codec the sender used."""
+        return PayloadCodecs.decode(payload)
             
-    def publish(self, topic: str, payload, qos: int = 1, retain: bool = False):
-        """Publish a message to a topic."""
-        if not isinstance(payload, str):
-            payload = json.dumps(payload)
+    def publish(self, topic: str, payload, qos: Optional[int] = None, retain: Optional[bool] = None):
+        """Queue a message for a topic; qos and retain default to the topic's policy."""
+        return self.outbox.put(topic, payload, qos=qos, retain=retain)
+
+    def _publish_now(self, topic, payload, qos, retain):
+        with self._offline_lock:
+            if not self.connected or self._replaying:
+                self.offline_queue.put(topic, payload, qos, retain)
+                return None
         result = self.client.publish(topic, payload, qos=qos, retain=retain)
-        self.logger.info(f"Published to {topic}: {payload} (result: {result.rc})")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Published to {topic}: {payload} (result: {result.rc})")
+        return result
+
+    def publish_stats(self):
+        """Outbox counters, queue depth and enqueue-to-publish latency."""
+        return self.outbox.stats()
 
+    def connection_stats(self):
+        """Reconnect count and durations, offline queue size and the last replay."""
+        return {
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "reconnect_time": self.reconnect_time.summary(),
+            "offline_queued": len(self.offline_queue),
+            "offline_dropped": self.offline_queue.dropped,
+            "last_replay": self.last_replay,
+        }
@@ -0,0 +1,230 @@
+"""
+Outbox between MQTTHandler.publish() and the MQTT client.
+Messages are queued and sent by one sender thread, shaped per topic:
+
+    coalesce  a pending message is replaced by a newer one with the same key
+              (latest value wins, e.g. progress of one job)
+    batch     telemetry is collected for batch_interval seconds and sent as one
+              JSON array payload
+    qos       default QoS (and retain flag) for the topic
+
+and the total publish rate is capped by a token bucket. While the sender is
+throttled, coalescing and batching keep the backlog small instead of letting it
+grow.
+"""
+import collections
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Optional
+
+from Metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TopicPolicy:
+    qos: int = 1
+    retain: bool = False
+    # Returns a key for payloads that may replace each other while queued, or None
+    coalesce_key: Optional[Callable[[object], Optional[Hashable]]] = None
+    # Collect payloads this long (s) and publish them as one JSON array
+    batch_interval: Optional[float] = None
+    max_batch: int = 100
+
+
+class _Entry:
+    __slots__ = ("topic", "payload", "qos", "retain", "enqueued", "key", "batch")
+
+    def __init__(self, topic, payload, qos, retain, enqueued, key=None, batch=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.enqueued = enqueued
+        self.key = key
+        self.batch = batch
+
+
+def encode_payload(payload):
+    if isinstance(payload, (str, bytes, bytearray)):
+        return payload
+    return json.dumps(payload)
+
+
+class MQTTOutbox:
+    def __init__(self, publish_fn: Callable, policies: Optional[Dict[str, TopicPolicy]] = None,
+                 max_rate: float = 1000.0, burst: int = 100, max_queue: int = 10000,
+                 encode: Optional[Callable] = None):
+        """
+        Args:
+            publish_fn (callable): publish_fn(topic, payload, qos, retain), e.g. the client's publish
+            encode (callable): encode(topic, payload) -> str or bytes; a batch is passed as one list.
+                Default: JSON text
+            policies (dict): Topic -> TopicPolicy; other topics get TopicPolicy()
+            max_rate (float): Messages per second the sender publishes at most (0 = unlimited)
+            burst (int): Messages that may go out back to back before the rate applies
+            max_queue (int): Queued messages before put() starts dropping
+        """
+        self._publish_fn = publish_fn
+        self._encode = encode
+        self.policies = dict(policies or {})
+        self.default_policy = TopicPolicy()
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self._queue = collections.deque()
+        self._pending_keys = {}
+        self._batches = {}
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._last_refill = time.perf_counter()
+        self._sending = False
+        self._closed = False
+
+        self.latency = LatencyHistogram()
+        self.counters = collections.Counter()
+        self.max_depth = 0
+
+        self._sender = threading.Thread(target=self._run, name="mqtt-outbox", daemon=True)
+        self._sender.start()
+
+    def policy(self, topic):
+        return self.policies.get(topic, self.default_policy)
+
+    def put(self, topic, payload, qos=None, retain=None):
+        """
+        Queue a message; never blocks
+
+        Returns:
+            bool: False if the queue was full and the message was dropped
+        """
+        policy = self.policy(topic)
+        qos = policy.qos if qos is None else qos
+        retain = policy.retain if retain is None else retain
+        now = time.perf_counter()
+        with self._cond:
+            self.counters["enqueued"] += 1
+            if policy.batch_interval:
+                entry = self._batches.get(topic)
+                if entry is None:
+                    entry = self._batches[topic] = _Entry(topic, [], qos, retain, now, batch=True)
+                entry.payload.append(payload)
+                if len(entry.payload) >= policy.max_batch:
+                    self._seal(topic)
+                self._cond.notify()
+                return True
+
+            key = policy.coalesce_key(payload) if policy.coalesce_key else None
+            if key is not None:
+                pending = self._pending_keys.get((topic, key))
+                if pending is not None:
+                    pending.payload = payload
+                    self.counters["coalesced"] += 1
+                    return True
+            if len(self._queue) >= self.max_queue:
+                self.counters["dropped"] += 1
+                return False
+            entry = _Entry(topic, payload, qos, retain, now, key=None if key is None else (topic, key))
+            self._queue.append(entry)
+            if entry.key is not None:
+                self._pending_keys[entry.key] = entry
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify()
+            return True
+
+    def _seal(self, topic):
+        # Move a collected batch into the send queue; call with the lock held
+        entry = self._batches.pop(topic)
+        self.counters["batched"] += len(entry.payload)
+        self._queue.append(entry)
+        self.max_depth = max(self.max_depth, len(self._queue))
+
+    def _next_batch_deadline(self):
+        return min((entry.enqueued + self.policy(topic).batch_interval for topic, entry in self._batches.items()),
+                   default=None)
+
+    def _take_token(self, now):
+        # Token bucket; returns the wait (s) until a token is available, 0 if one was taken
+        if not self.max_rate:
+            return 0.0
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.max_rate)
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.max_rate
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.perf_counter()
+                    for topic in [t for t, e in self._batches.items()
+                                  if self._closed or now >= e.enqueued + self.policy(t).batch_interval]:
+                        self._seal(topic)
+                    if self._queue:
+                        wait = self._take_token(now)
+                        if wait == 0:
+                            entry = self._queue.popleft()
+                            if entry.key is not None:
+                                self._pending_keys.pop(entry.key, None)
+                            self._sending = True
+                            break
+                    elif self._closed:
+                        return
+                    else:
+                        deadline = self._next_batch_deadline()
+                        wait = None if deadline is None else max(0.0, deadline - now)
+                    self._cond.wait(wait)
+            try:
+                self._send(entry)
+            finally:
+                with self._cond:
+                    self._sending = False
+                    self._cond.notify_all()
+
+    def _send(self, entry):
+        try:
+            if self._encode is not None:
+                payload = self._encode(entry.topic, entry.payload)
+            elif entry.batch:
+                payload = "[" + ",".join(encode_payload(p) for p in entry.payload) + "]"
+            else:
+                payload = encode_payload(entry.payload)
+            self._publish_fn(entry.topic, payload, entry.qos, entry.retain)
+            self.counters["published"] += 1
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.error(f"Publish to {entry.topic} failed: {str(e)}")
+        self.latency.record(time.perf_counter() - entry.enqueued)
+
+    def depth(self):
+        with self._cond:
+            return len(self._queue) + sum(len(e.payload) for e in self._batches.values())
+
+    def flush(self, timeout=5.0):
+        """Send open batches now and wait until everything queued so far is published."""
+        with self._cond:
+            for topic in list(self._batches):
+                self._seal(topic)
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._queue and not self._sending, timeout=timeout)
+
+    def close(self, timeout=5.0):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._sender.join(timeout=timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth(),
+            "max_queue_depth": self.max_depth,
+            **{name: self.counters[name] for name in ("enqueued", "published", "coalesced", "batched", "dropped", "failed")},
+            "latency": self.latency.summary(),
+        }
@@ -0,0 +1,119 @@
+"""
+Lightweight latency statistics shared by the hardware drivers and the MQTT layer.
+Values are recorded in seconds into log-spaced buckets, so recording is O(log n)
+with no per-sample storage and percentiles stay accurate to a few percent.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    def __init__(self, min_s=1e-6, max_s=100.0, buckets_per_decade=20):
+        """
+        Args:
+            min_s (float): Smallest latency resolved, smaller values land in the first bucket
+            max_s (float): Largest latency resolved, larger values land in the overflow bucket
+            buckets_per_decade (int): Resolution, 20 gives ~12% wide buckets
+        """
+        decades = math.log10(max_s / min_s)
+        n = int(math.ceil(decades * buckets_per_decade))
+        self._edges = [min_s * 10 ** (i / buckets_per_decade) for i in range(n + 1)]
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self._edges) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.min = math.inf
+            self.max = 0.0
+
+    def record(self, seconds):
+        index = bisect.bisect_right(self._edges, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.min = min(self.min, seconds)
+            self.max = max(self.max, seconds)
+
+    @contextmanager
+    def time(self):
+        """Record the wall time spent inside the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def percentile(self, q):
+        """
+        Estimate the q-th percentile (0-100) in seconds
+
+        Returns the geometric centre of the bucket holding the requested rank,
+        clamped to the observed min/max. Returns None when nothing was recorded.
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = max(1, int(math.ceil(self.count * q / 100.0)))
+            seen = 0
+            for index, n in enumerate(self._counts):
+                seen += n
+                if seen >= rank:
+                    break
+            if index == 0:
+                estimate = self._edges[0]
+            elif index == len(self._edges):
+                estimate = self.max
+            else:
+                estimate = math.sqrt(self._edges[index - 1] * self._edges[index])
+            return min(max(estimate, self.min), self.max)
+
+    def summary(self):
+        """Return count, mean and p50/p95/p99/max in milliseconds."""
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count,
+            "p50_ms": 1000 * self.percentile(50),
+            "p95_ms": 1000 * self.percentile(95),
+            "p99_ms": 1000 * self.percentile(99),
+            "max_ms": 1000 * self.max,
+        }
+
+
+class LatencyHistograms:
+    """A set of LatencyHistogram keyed by name (command header, topic, ...)."""
+    def __init__(self, **histogram_kwargs):
+        self._histogram_kwargs = histogram_kwargs
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram(**self._histogram_kwargs))
+        return histogram
+
+    def __contains__(self, key):
+        return key in self._histograms
+
+    def keys(self):
+        return list(self._histograms)
+
+    def record(self, key, seconds):
+        self[key].record(seconds)
+
+    def reset(self):
+        for histogram in list(self._histograms.values()):
+            histogram.reset()
+
+    def summary(self):
+        return {key: histogram.summary() for key, histogram in list(self._histograms.items())}
@@ -0,0 +1,70 @@
+"""
+Bounded, disk-backed FIFO of MQTT messages that could not be sent while the
+broker was unreachable. Messages live in a SQLite table (WAL mode), so they
+survive a restart of the process and are replayed in the order they were
+queued. When the queue is full the oldest message is dropped.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class OfflineQueue:
+    def __init__(self, path=":memory:", max_messages=10000):
+        """
+        Args:
+            path (str): SQLite file; ":memory:" keeps the queue for the life of the process only
+            max_messages (int): Messages kept before the oldest are dropped
+        """
+        self.path = path
+        self.max_messages = max_messages
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, payload BLOB, "
+            "qos INTEGER NOT NULL, retain INTEGER NOT NULL, queued_at REAL NOT NULL)"
+        )
+        self._count = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        if self._count:
+            logger.info(f"{self._count} queued messages found in {path}")
+
+    def __len__(self):
+        return self._count
+
+    def put(self, topic, payload, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            if self._count >= self.max_messages:
+                self._db.execute("DELETE FROM messages WHERE id = (SELECT MIN(id) FROM messages)")
+                self._count -= 1
+                self.dropped += 1
+            self._db.execute(
+                "INSERT INTO messages (topic, payload, qos, retain, queued_at) VALUES (?, ?, ?, ?, ?)",
+                (topic, payload, qos, int(retain), time.time())
+            )
+            self._count += 1
+
+    def peek(self, n=100):
+        """The n oldest messages as (id, topic, payload, qos, retain, queued_at) tuples."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, topic, payload, qos, retain, queued_at FROM messages ORDER BY id LIMIT ?", (n,)
+            ).fetchall()
+
+    def delete_through(self, message_id):
+        """Remove every message up to and including message_id."""
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM messages WHERE id <= ?", (message_id,)).rowcount
+            self._count -= deleted
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,158 @@
+"""
+Payload codecs for MQTT messages.
+
+An encoded payload starts with the marker byte 0xC1 followed by a codec ID
+byte. 0xC1 can never begin UTF-8 text (nor a msgpack object), so payloads
+without the marker are read as JSON text, exactly as before. Receivers
+therefore decode every codec without configuration; only the sender chooses
+a codec per topic.
+
+    JSON     0x01  always available
+    msgpack  0x02  needs the msgpack package
+    CBOR     0x03  needs the cbor2 package
+    struct   0x10+ fixed-schema float64 records (see STRUCT_SCHEMAS), e.g. telemetry
+"""
+import json
+import logging
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+logger = logging.getLogger(__name__)
+
+MARKER = 0xC1
+
+
+class Codec:
+    name = None
+    codec_id = None
+
+    def encode(self, obj) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes):
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    name = "json"
+    codec_id = 0x01
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    codec_id = 0x02
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class CBORCodec(Codec):
+    name = "cbor"
+    codec_id = 0x03
+
+    def encode(self, obj):
+        return cbor2.dumps(obj)
+
+    def decode(self, data):
+        return cbor2.loads(data)
+
+
+class StructCodec(Codec):
+    """
+    Packed little-endian float64 records with a fixed field list
+
+    Encodes one dict (decoded back as a dict) or a list of dicts (decoded as a
+    list); a flag byte after the codec ID tells the two apart.
+    """
+    def __init__(self, name, codec_id, fields):
+        self.name = name
+        self.codec_id = codec_id
+        self.fields = tuple(fields)
+        self.dtype = np.dtype([(field, "<f8") for field in self.fields])
+
+    def encode(self, obj):
+        single = isinstance(obj, dict)
+        rows = [obj] if single else obj
+        records = np.array([tuple(row[field] for field in self.fields) for row in rows], dtype=self.dtype)
+        return bytes([0 if single else 1]) + records.tobytes()
+
+    def decode(self, data):
+        records = np.frombuffer(data, dtype=self.dtype, offset=1)
+        rows = [dict(zip(self.fields, values)) for values in records.tolist()]
+        return rows[0] if data[0] == 0 else rows
+
+
+# Fixed-schema streams both ends know about: name -> (codec ID, fields)
+STRUCT_SCHEMAS = {
+    "temperature": (0x10, ("timestamp", "temperature_k")),
+}
+
+CODECS = {}
+
+
+def register_codec(codec):
+    if codec.codec_id in CODECS and CODECS[codec.codec_id].name != codec.name:
+        raise ValueError(f"Codec ID {codec.codec_id:#x} is already used by {CODECS[codec.codec_id].name}")
+    CODECS[codec.codec_id] = codec
+    return codec
+
+
+register_codec(JSONCodec())
+if msgpack is not None:
+    register_codec(MsgpackCodec())
+if cbor2 is not None:
+    register_codec(CBORCodec())
+for _name, (_codec_id, _fields) in STRUCT_SCHEMAS.items():
+    register_codec(StructCodec(_name, _codec_id, _fields))
+
+
+def get_codec(name):
+    """Codec by name; falls back to JSON (with a warning) when its package is not installed."""
+    for codec in CODECS.values():
+        if codec.name == name:
+            return codec
+    if name in ("msgpack", "cbor"):
+        logger.warning(f"{name} is not installed, using JSON instead")
+        return CODECS[JSONCodec.codec_id]
+    raise ValueError(f"Unknown codec: {name}")
+
+
+def encode(obj, codec=None):
+    """Encode obj with codec (a Codec or name); without one, plain JSON text as before."""
+    if codec is None:
+        return json.dumps(obj)
+    if isinstance(codec, str):
+        codec = get_codec(codec)
+    return bytes([MARKER, codec.codec_id]) + codec.encode(obj)
+
+
+def decode(data):
+    """Decode a payload from any codec; unmarked payloads are JSON text, or returned as str if not JSON."""
+    if data[:1] == b"\xc1":
+        codec = CODECS.get(data[1])
+        if codec is None:
+            raise ValueError(f"Payload uses unknown codec ID {data[1]:#x}")
+        return codec.decode(bytes(data[2:]))
+    text = data.decode("utf-8") if isinstance(data, (bytes, bytearray)) else data
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text  # Keep as raw string if not JSON
@@ -0,0 +1,131 @@
+"""
+Fixed-capacity ring buffer for numeric time series, kept in a numpy structured
+array, plus decimation for plotting long histories.
+
+Records have the same layout as TimeSeriesStore: a float64 timestamp followed
+by float64 value fields. Appending is O(1), and once the buffer is full the
+oldest records are overwritten. Timestamps are expected to be non-decreasing,
+so window() can binary-search them.
+
+    bucket_stats  min/max/mean per fixed-width time bucket, aligned to multiples
+                  of the width so buckets stay put while the window slides
+    lttb          Largest-Triangle-Three-Buckets, a shape-preserving subset of points
+"""
+import threading
+
+import numpy as np
+
+BUCKET_DTYPE = np.dtype([("timestamp", "<f8"), ("min", "<f8"), ("max", "<f8"), ("mean", "<f8"), ("count", "<i8")])
+
+
+class RingBuffer:
+    def __init__(self, capacity, fields=("value",)):
+        """
+        Args:
+            capacity (int): Records kept before the oldest are overwritten
+            fields (tuple of str): Value columns stored after the timestamp, all float64
+        """
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.dtype = np.dtype([("timestamp", "<f8")] + [(field, "<f8") for field in self.fields])
+        self._data = np.empty(capacity, dtype=self.dtype)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, *values):
+        """Append one record; values are given in the order of fields."""
+        with self._lock:
+            self._data[self._next] = (timestamp, *values)
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def extend(self, records):
+        """Append a structured array (or anything np.asarray converts to self.dtype)."""
+        records = np.asarray(records, dtype=self.dtype)[-self.capacity:]
+        n = len(records)
+        with self._lock:
+            first = min(n, self.capacity - self._next)
+            self._data[self._next:self._next + first] = records[:first]
+            self._data[:n - first] = records[first:]
+            self._next = (self._next + n) % self.capacity
+            self._count = min(self._count + n, self.capacity)
+
+    def _parts(self):
+        # The contents as (older, newer) views of the storage, in time order
+        if self._count < self.capacity:
+            return self._data[:self._count], self._data[:0]
+        return self._data[self._next:], self._data[:self._next]
+
+    def window(self, start=None, end=None):
+        """Copy of every record with start <= timestamp < end, oldest first."""
+        with self._lock:
+            parts = []
+            for part in self._parts():
+                lo = 0 if start is None else np.searchsorted(part["timestamp"], start, side="left")
+                hi = len(part) if end is None else np.searchsorted(part["timestamp"], end, side="left")
+                if hi > lo:
+                    parts.append(part[lo:hi])
+            if not parts:
+                return np.empty(0, dtype=self.dtype)
+            return np.concatenate(parts)
+
+    def last(self):
+        """The newest record, or None when empty."""
+        with self._lock:
+            return self._data[self._next - 1].copy() if self._count else None
+
+
+def bucket_stats(timestamps, values, width):
+    """
+    Min, max and mean of values per time bucket [k * width, (k + 1) * width)
+
+    timestamps must be sorted. Only non-empty buckets are returned, as a
+    BUCKET_DTYPE array whose timestamp is the bucket start.
+    """
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=BUCKET_DTYPE)
+    index = np.floor(np.asarray(timestamps) / width).astype(np.int64)
+    starts = np.flatnonzero(np.diff(index, prepend=index[0] - 1))
+    values = np.asarray(values, dtype=np.float64)
+    buckets = np.empty(len(starts), dtype=BUCKET_DTYPE)
+    buckets["timestamp"] = index[starts] * width
+    buckets["min"] = np.minimum.reduceat(values, starts)
+    buckets["max"] = np.maximum.reduceat(values, starts)
+    buckets["count"] = np.diff(starts, append=len(values))
+    buckets["mean"] = np.add.reduceat(values, starts) / buckets["count"]
+    return buckets
+
+
+def lttb(timestamps, values, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling
+
+    Keeps the first and last point and, from each of threshold - 2 equal-count
+    buckets in between, the point forming the largest triangle with the point
+    kept before it and the mean of the next bucket.
+
+    Returns:
+        np.ndarray: Indices of the kept points
+    """
+    n = len(timestamps)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(timestamps, dtype=np.float64)
+    y = np.asarray(values, dtype=np.float64)
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
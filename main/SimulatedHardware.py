@@ -0,0 +1,487 @@
+"""
+Simulated stand-ins for the bench hardware, so the control stack runs (and can be
+benchmarked) on any machine. Each class duck-types the object the drivers talk to:
+
+    SimulatedResourceManager / SimulatedSCPIInstrument  -> pyvisa, Agilent 33250A on RS-232
+    SimulatedGPIO                                       -> RPi.GPIO
+    SimulatedSpiBus / SimulatedSpiDev / SimulatedAD5260 -> spidev with the AD5260 on it
+    SimulatedRTDSensor                                  -> adafruit_max31865.MAX31865
+    SimulatedMAX31865                                   -> the MAX31865's registers, on a SimulatedSpiBus
+
+Wire-time is modelled (10 bits per byte at the configured baud rate or SPI clock)
+unless model_latency is False, and every hardware action is recorded with a
+perf_counter_ns timestamp so tests and benchmarks can see when it happened.
+"""
+import collections
+import logging
+import math
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HISTORY_LENGTH = 100000
+
+
+class SimulatedGPIO:
+    """In-memory RPi.GPIO: pin levels live in a dict, every write is timestamped."""
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {}
+        self.directions = {}
+        # (perf_counter_ns, pin, level) for every write
+        self.history = collections.deque(maxlen=HISTORY_LENGTH)
+        # Called as listener(perf_counter_ns, {pin: level}) after each output() call
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, initial=None, pull_up_down=None):
+        for pin in _as_list(channel):
+            self.directions[pin] = direction
+            if direction == self.OUT:
+                self.pins[pin] = self.LOW if initial is None else int(bool(initial))
+
+    def output(self, channel, value):
+        channels = _as_list(channel)
+        values = _as_list(value)
+        if len(values) == 1:
+            values = values * len(channels)
+        if len(values) != len(channels):
+            raise RuntimeError("Number of channels != number of values")
+        with self._lock:
+            changed = {}
+            for pin, level in zip(channels, values):
+                if self.directions.get(pin) != self.OUT:
+                    raise RuntimeError(f"GPIO {pin} has not been set up as an output")
+                level = int(bool(level))
+                self.pins[pin] = level
+                changed[pin] = level
+                self.history.append((time.perf_counter_ns(), pin, level))
+        now = time.perf_counter_ns()
+        for listener in list(self.listeners):
+            listener(now, changed)
+
+    def input(self, channel):
+        return self.pins.get(channel, self.LOW)
+
+    def cleanup(self, channel=None):
+        with self._lock:
+            for pin in (_as_list(channel) if channel is not None else list(self.pins)):
+                self.pins.pop(pin, None)
+                self.directions.pop(pin, None)
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class SimulatedAD5260:
+    """The AD5260 as seen on the SPI bus: every byte clocked in becomes the wiper code."""
+    def __init__(self):
+        self.code = 128  # power-on midscale
+        self.writes = 0
+
+    def transfer(self, data):
+        if data:
+            self.code = data[-1] & 0xFF
+            self.writes += 1
+        return [0] * len(data)
+
+
+class SimulatedSpiBus:
+    """
+    A set of SPI devices keyed by (bus, chip select)
+
+    SpiDev() hands out spidev-compatible handles; opening (bus, device) on a
+    handle routes its transfers to the device registered there.
+    """
+    def __init__(self, devices=None, model_latency=True):
+        self.devices = devices if devices is not None else {(0, 0): SimulatedAD5260(), (0, 1): SimulatedAD5260()}
+        self.model_latency = model_latency
+        # (perf_counter_ns, (bus, device), tx bytes) for every transfer
+        self.history = collections.deque(maxlen=HISTORY_LENGTH)
+        # Called as listener(perf_counter_ns, (bus, device), tx bytes) after each transfer
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def SpiDev(self):
+        return SimulatedSpiDev(self)
+
+
+class SimulatedSpiDev:
+    def __init__(self, bus):
+        self._bus = bus
+        self._address = None
+        self.max_speed_hz = 500000
+        self.mode = 0
+        self.bits_per_word = 8
+        self.no_cs = False
+
+    def open(self, bus, device):
+        if (bus, device) not in self._bus.devices:
+            raise FileNotFoundError(f"/dev/spidev{bus}.{device} has no simulated device")
+        self._address = (bus, device)
+
+    def close(self):
+        self._address = None
+
+    def xfer2(self, data, speed_hz=0, delay_usecs=0, bits_per_word=0):
+        if self._address is None:
+            raise OSError("SPI device is not open")
+        data = list(data)
+        if self._bus.model_latency:
+            _busy_wait(8 * len(data) / (speed_hz or self.max_speed_hz))
+        with self._bus._lock:
+            reply = self._bus.devices[self._address].transfer(data)
+            now = time.perf_counter_ns()
+            self._bus.history.append((now, self._address, data))
+        for listener in list(self._bus.listeners):
+            listener(now, self._address, data)
+        return reply
+
+    xfer = xfer2
+
+    def writebytes(self, data):
+        self.xfer2(data)
+
+    writebytes2 = writebytes
+
+    def readbytes(self, n):
+        return self.xfer2([0] * n)
+
+
+class SimulatedRTDSensor:
+    """
+    Synthetic RTD behind a MAX31865, with the adafruit driver's interface
+
+    The temperature follows a slow sinusoidal drift plus Gaussian noise around
+    base_temperature_c; resistance is derived from it with Callendar-Van Dusen.
+    """
+    A = 3.9083e-3
+    B = -5.775e-7
+
+    def __init__(self, base_temperature_c=-242.0, drift_c=0.5, drift_period_s=600.0, noise_c=0.02,
+                 rtd_nominal=1000.0, ref_resistor=4300.0, conversion_time=0.0):
+        self.base_temperature_c = base_temperature_c
+        self.drift_c = drift_c
+        self.drift_period_s = drift_period_s
+        self.noise_c = noise_c
+        self.rtd_nominal = rtd_nominal
+        self.ref_resistor = ref_resistor
+        self.conversion_time = conversion_time
+        self.fault = (False, False, False, False, False, False)
+        self._t0 = time.monotonic()
+        self.reads = 0
+
+    def true_temperature(self):
+        phase = 2 * math.pi * (time.monotonic() - self._t0) / self.drift_period_s
+        return self.base_temperature_c + self.drift_c * math.sin(phase)
+
+    @property
+    def temperature(self):
+        if self.conversion_time:
+            time.sleep(self.conversion_time)
+        self.reads += 1
+        return self.true_temperature() + random.gauss(0.0, self.noise_c)
+
+    @property
+    def resistance(self):
+        t = self.temperature
+        r = self.rtd_nominal * (1 + self.A * t + self.B * t * t)
+        if t < 0:
+            r -= self.rtd_nominal * 4.183e-12 * (t - 100) * t ** 3
+        return r
+
+    def clear_faults(self):
+        self.fault = (False, False, False, False, False, False)
+
+
+class SimulatedMAX31865:
+    """
+    The MAX31865 as seen on the SPI bus: a register file in front of a SimulatedRTDSensor
+
+    A transfer starts with a register address (bit 7 set to write) and then
+    auto-increments. In auto-conversion mode (bias and auto bits set) the RTD
+    registers hold a new conversion every 1/60 s (1/50 s with the 50 Hz
+    filter). inject_fault() raises fault bits until the fault-clear bit is written.
+    """
+    def __init__(self, sensor=None):
+        self.sensor = sensor if sensor is not None else SimulatedRTDSensor()
+        self.registers = [0] * 8
+        self.registers[3:7] = [0xFF, 0xFF, 0x00, 0x00]  # fault thresholds: the full range
+        self.conversions = 0
+        self._converted_at = None
+        self.reads = 0
+
+    def _convert(self):
+        config = self.registers[0]
+        if config & 0xC0 != 0xC0:
+            return
+        period = 1 / 50 if config & 0x01 else 1 / 60
+        now = time.monotonic()
+        if self._converted_at is not None and now - self._converted_at < period:
+            return
+        self._converted_at = now
+        self.conversions += 1
+        code = max(0, min(0x7FFF, round(self.sensor.resistance / self.sensor.ref_resistor * 0x8000)))
+        fault = 1 if self.registers[7] else 0
+        self.registers[1], self.registers[2] = code >> 7, ((code << 1) & 0xFF) | fault
+
+    def inject_fault(self, status):
+        self.registers[7] |= status
+        self.registers[2] |= 0x01
+
+    def transfer(self, data):
+        address = data[0] & 0x7F
+        if data[0] & 0x80:
+            for offset, value in enumerate(data[1:]):
+                register = (address + offset) % 8
+                if register == 0:
+                    if value & 0x02:  # fault clear; the bit itself reads back as 0
+                        self.registers[7] = 0
+                        self.registers[2] &= 0xFE
+                    value &= ~0x02
+                if register not in (1, 2, 7):  # read-only
+                    self.registers[register] = value
+            return [0] * len(data)
+        self._convert()
+        self.reads += 1
+        return [0] + [self.registers[(address + offset) % 8] for offset in range(len(data) - 1)]
+
+
+class SimulatedSCPIInstrument:
+    """
+    An Agilent 33250A on a serial line, as a pyvisa MessageBasedResource
+
+    Parses what the driver writes (';'-joined commands, ':'-rooted and
+    relative headers, definite-length DATA:DAC blocks), keeps the settings in
+    a dict, answers *IDN?, *OPC?, *STB?, SYST:ERR? and "<setting>?" queries,
+    and records every *TRG.
+    """
+    IDN = "Agilent Technologies,33250A,0,SIMULATED"
+    DEFAULTS = {
+        "FUNCTION": "SIN",
+        "FREQUENCY": "1000",
+        "OUTPUT:STATE": "OFF",
+        "BURST:STATE": "OFF",
+        "BURST:NCYCLES": "1",
+        "TRIGGER:SOURCE": "IMM",
+    }
+
+    def __init__(self, resource_name="ASRL/dev/ttyUSB0::INSTR", baud_rate=57600, timeout=5000,
+                 model_latency=True, turnaround=0.002, **kwargs):
+        self.resource_name = resource_name
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.model_latency = model_latency
+        self.turnaround = turnaround
+        self.state = dict(self.DEFAULTS)
+        self.waveforms = {}
+        self.errors = []
+        # (perf_counter_ns, NCYCLES) for every *TRG
+        self.triggers = collections.deque(maxlen=HISTORY_LENGTH)
+        # (perf_counter_ns, line) for every complete line received
+        self.lines = collections.deque(maxlen=HISTORY_LENGTH)
+        # Called as listener(perf_counter_ns) for every *TRG
+        self.trigger_listeners = []
+        self.bytes_written = 0
+        self._buffer = b""
+        self._responses = collections.deque()
+        self._closed = False
+
+    def write_raw(self, data):
+        if self._closed:
+            raise OSError("Simulated instrument is closed")
+        if self.model_latency:
+            _busy_wait(10 * len(data) / self.baud_rate)
+        self.bytes_written += len(data)
+        self._buffer += bytes(data)
+        self._process_buffer()
+        return len(data)
+
+    def write(self, message):
+        return self.write_raw(message.encode())
+
+    def read(self):
+        if not self._responses:
+            _raise_timeout()
+        response = self._responses.popleft() + "\n"
+        if self.model_latency:
+            _busy_wait(self.turnaround + 10 * len(response) / self.baud_rate)
+        return response
+
+    def query(self, message):
+        self.write(message + "\n")
+        return self.read()
+
+    def clear(self):
+        # Device clear: drops the partial input line and any unread replies
+        self._buffer = b""
+        self._responses.clear()
+
+    def close(self):
+        self._closed = True
+
+    def _process_buffer(self):
+        while True:
+            if self._buffer.upper().startswith(b"DATA:DAC"):
+                consumed = self._parse_dac_block()
+                if consumed is None:
+                    return
+                self._buffer = self._buffer[consumed:]
+                continue
+            newline = self._buffer.find(b"\n")
+            if newline < 0:
+                return
+            line = self._buffer[:newline].decode(errors="replace").strip()
+            self._buffer = self._buffer[newline + 1:]
+            if line:
+                self.lines.append((time.perf_counter_ns(), line))
+                self._execute_line(line)
+
+    def _parse_dac_block(self):
+        """Consume 'DATA:DAC <name>, #<n><len><bytes>\\r\\n'; None if it has not all arrived yet."""
+        hash_at = self._buffer.find(b"#")
+        if hash_at < 0 or len(self._buffer) < hash_at + 2:
+            return None
+        digits = int(self._buffer[hash_at + 1:hash_at + 2])
+        length_end = hash_at + 2 + digits
+        if len(self._buffer) < length_end:
+            return None
+        length = int(self._buffer[hash_at + 2:length_end])
+        end = length_end + length
+        newline = self._buffer.find(b"\n", end)
+        if newline < 0:
+            return None
+        name = self._buffer[len(b"DATA:DAC"):hash_at].decode().strip(" ,").upper()
+        payload = self._buffer[length_end:end]
+        self.waveforms[name] = [int.from_bytes(payload[i:i + 2], "big", signed=True)
+                                for i in range(0, len(payload), 2)]
+        self.lines.append((time.perf_counter_ns(), f"DATA:DAC {name}, <{length} bytes>"))
+        return newline + 1
+
+    def _execute_line(self, line):
+        path = ""
+        for command in line.split(";"):
+            command = command.strip()
+            if not command:
+                continue
+            if command.startswith("*"):
+                self._common(command.upper())
+                continue
+            header, _, argument = command.partition(" ")
+            header = header.upper()
+            if header.startswith(":"):
+                full = header[1:]
+            elif path:
+                full = path + ":" + header
+            else:
+                full = header
+            # The next relative header resolves against this one's subsystem
+            path = full.rsplit(":", 1)[0] if ":" in full else ""
+            if full.endswith("?"):
+                self._query(full)
+            else:
+                self._set(full, argument.strip())
+
+    def _common(self, command):
+        if command == "*RST":
+            self.state = dict(self.DEFAULTS)
+        elif command == "*CLS":
+            self.errors.clear()
+        elif command == "*TRG":
+            now = time.perf_counter_ns()
+            self.triggers.append((now, self.state.get("BURST:NCYCLES")))
+            for listener in list(self.trigger_listeners):
+                listener(now)
+        elif command == "*IDN?":
+            self._responses.append(self.IDN)
+        elif command == "*OPC?":
+            self._responses.append("1")
+        elif command == "*STB?":
+            self._responses.append("0")
+        elif command in ("*OPC", "*WAI"):
+            pass
+        else:
+            self.errors.append('-113,"Undefined header"')
+
+    def _query(self, header):
+        header = header[:-1]
+        if header in ("SYST:ERR", "SYSTEM:ERROR"):
+            self._responses.append(self.errors.pop(0) if self.errors else '+0,"No error"')
+        else:
+            self._responses.append(self.state.get(header, "0"))
+
+    def _set(self, header, value):
+        if not value:
+            self.errors.append('-109,"Missing parameter"')
+            return
+        if header == "OUTPUT":
+            header = "OUTPUT:STATE"
+        elif header.startswith("APPLY:"):
+            self.state["FUNCTION"] = header.split(":", 1)[1]
+            parts = [p.strip() for p in value.split(",")]
+            for key, part in zip(("FREQUENCY", "VOLTAGE", "VOLTAGE:OFFSET"), parts):
+                self.state[key] = part
+            self.state["BURST:STATE"] = "OFF"
+            return
+        self.state[header] = value
+
+
+class SimulatedResourceManager:
+    """pyvisa ResourceManager that opens SimulatedSCPIInstrument resources."""
+    def __init__(self, model_latency=True, resources=("ASRL/dev/ttyUSB0::INSTR",)):
+        self.model_latency = model_latency
+        self.resources = tuple(resources)
+        self.opened = []
+
+    def list_resources(self, query="?*::INSTR"):
+        return self.resources
+
+    def open_resource(self, resource_name, **kwargs):
+        if resource_name not in self.resources:
+            raise OSError(f"No simulated instrument at {resource_name}")
+        instrument = SimulatedSCPIInstrument(resource_name=resource_name, model_latency=self.model_latency, **kwargs)
+        self.opened.append(instrument)
+        return instrument
+
+    @property
+    def instrument(self):
+        """The most recently opened instrument."""
+        return self.opened[-1] if self.opened else None
+
+
+def _busy_wait(seconds):
+    # time.sleep cannot resolve the tens of microseconds a short SCPI line or
+    # SPI transfer takes, so short waits spin on perf_counter instead
+    if seconds <= 0:
+        return
+    if seconds > 2e-3:
+        time.sleep(seconds)
+        return
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def _raise_timeout():
+    try:
+        from pyvisa import constants
+        from pyvisa.errors import VisaIOError
+    except ImportError:
+        raise TimeoutError("Simulated instrument has no response queued")
+    raise VisaIOError(constants.StatusCode.error_timeout)
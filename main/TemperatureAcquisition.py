@@ -0,0 +1,262 @@
+"""
+Temperature acquisition pipeline: sampling is decoupled from everything done with the samples.
+
+    sampler thread --> SampleRing --> consumer "storage" (TimeSeriesStore)
+                                  --> consumer "mqtt"    (publish, batched by the outbox)
+                                  --> consumer "alarm"   (TemperatureAlarm)
+
+The sampler reads the sensor on a drift-free perf_counter schedule and only
+writes into the ring. Each consumer thread wakes every `period` seconds and
+takes whatever arrived since its last visit, so a slow disk or broker never
+delays a sample. The interval can be changed while running (set_interval).
+
+SampleRing has a single writer and any number of readers, each with its own
+cursor; it needs no lock. A reader that falls more than `capacity` samples
+behind loses the oldest ones and counts them.
+"""
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+from Metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# One row per sample
+SAMPLE_RECORD = np.dtype([
+    ("timestamp", "<f8"),      # time.time() of the read
+    ("temperature_k", "<f8"),
+    ("late_s", "<f8"),         # how far behind its deadline the read started
+    ("perf_counter_ns", "<i8"),  # when the read returned, for the EventBus timeline
+])
+
+
+class SampleRing:
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=SAMPLE_RECORD)
+        # Total samples written; only the sampler thread assigns it, after the slot is filled
+        self.written = 0
+
+    def put(self, timestamp, temperature_k, late_s=0.0, perf_counter_ns=0):
+        self._data[self.written % self.capacity] = (timestamp, temperature_k, late_s, perf_counter_ns)
+        self.written += 1
+
+    def read(self, cursor):
+        """
+        Samples from cursor (a count of samples written) up to the newest
+
+        Returns:
+            tuple: (records, new cursor, samples lost because they were overwritten)
+        """
+        end = self.written
+        start = max(cursor, end - self.capacity)
+        records = self._data[np.arange(start, end) % self.capacity]
+        # Slots the sampler reused while they were being copied are torn; drop them
+        torn = min(self.written - self.capacity - start, len(records))
+        if torn > 0:
+            records = records[torn:]
+        return records, end, (start - cursor) + max(torn, 0)
+
+
+class TemperatureSampler:
+    def __init__(self, read, ring, interval=5.0, min_interval=0.01):
+        """
+        Args:
+            read (callable): Returns one temperature in K
+            ring (SampleRing): Where samples go
+            interval (float): Seconds between samples
+            min_interval (float): Smallest interval set_interval() accepts
+        """
+        self.read = read
+        self.ring = ring
+        self.min_interval = min_interval
+        self.interval = self._check_interval(interval)
+        self.samples = 0
+        self.errors = 0
+        self.overruns = 0  # deadlines skipped because a read ran past them
+        self.read_time = LatencyHistogram()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _check_interval(self, interval):
+        interval = float(interval)
+        if not interval >= self.min_interval:
+            raise ValueError(f"Sampling interval must be at least {self.min_interval} s, got {interval}")
+        return interval
+
+    def set_interval(self, interval):
+        """Change the interval; the new schedule starts with an immediate sample."""
+        self.interval = self._check_interval(interval)
+        self._wake.set()
+        logger.info(f"Temperature sampling interval set to {self.interval} s")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="temperature-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        interval = self.interval
+        start = time.perf_counter()
+        k = 0
+        while not self._stop.is_set():
+            if self.interval != interval:
+                interval = self.interval
+                start = time.perf_counter()
+                k = 0
+            deadline = start + k * interval
+            remaining = deadline - time.perf_counter()
+            if remaining > 0 and self._wake.wait(remaining):
+                self._wake.clear()
+                continue
+            began = time.perf_counter()
+            try:
+                temperature_k = float(self.read())
+                self.ring.put(time.time(), temperature_k, began - deadline, time.perf_counter_ns())
+                self.samples += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[MAX31865] Read error: {e}")
+            now = time.perf_counter()
+            self.read_time.record(now - began)
+            # Deadlines the read ran past are skipped rather than made up in a burst
+            next_k = max(k + 1, math.floor((now - start) / interval) + 1)
+            self.overruns += next_k - (k + 1)
+            k = next_k
+
+    def stats(self):
+        return {
+            "interval_s": self.interval,
+            "samples": self.samples,
+            "errors": self.errors,
+            "overruns": self.overruns,
+            "read_time": self.read_time.summary(),
+        }
+
+
+class RingConsumer:
+    def __init__(self, name, ring, handle, period=0.5):
+        """
+        Args:
+            name (str): For logs and stats
+            ring (SampleRing): Ring to read; samples written before the consumer existed are skipped
+            handle (callable): Called with a SAMPLE_RECORD array of the new samples
+            period (float): Seconds between visits to the ring
+        """
+        self.name = name
+        self.ring = ring
+        self.handle = handle
+        self.period = period
+        self.cursor = ring.written
+        self.consumed = 0
+        self.lost = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"temperature-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self.poll()
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.poll()
+
+    def poll(self):
+        records, self.cursor, lost = self.ring.read(self.cursor)
+        if lost:
+            self.lost += lost
+            logger.warning(f"Temperature consumer {self.name} fell behind and lost {lost} samples")
+        if len(records):
+            try:
+                self.handle(records)
+                self.consumed += len(records)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Temperature consumer {self.name} failed: {str(e)}")
+
+    def stats(self):
+        return {"consumed": self.consumed, "lost": self.lost, "errors": self.errors,
+                "backlog": self.ring.written - self.cursor}
+
+
+class TemperatureAlarm:
+    def __init__(self, notify, high_k=None, low_k=None, hysteresis_k=0.5):
+        """
+        Calls notify(event) once when the temperature crosses a limit and once when it is back
+
+        The alarm clears only hysteresis_k inside the limit, so noise around a
+        limit does not raise it over and over.
+        """
+        self.notify = notify
+        self.high_k = high_k
+        self.low_k = low_k
+        self.hysteresis_k = hysteresis_k
+        self.state = "ok"
+
+    def __call__(self, records):
+        for timestamp, temperature_k in zip(records["timestamp"].tolist(), records["temperature_k"].tolist()):
+            state = self.state
+            if self.high_k is not None and temperature_k > self.high_k:
+                state = "high"
+            elif self.low_k is not None and temperature_k < self.low_k:
+                state = "low"
+            elif state == "high" and temperature_k < self.high_k - self.hysteresis_k:
+                state = "ok"
+            elif state == "low" and temperature_k > self.low_k + self.hysteresis_k:
+                state = "ok"
+            if state != self.state:
+                self.state = state
+                logger.warning(f"Temperature alarm {state}: {temperature_k:.3f} K")
+                self.notify({"event": "temperature_alarm", "state": state, "temperature_k": temperature_k,
+                             "timestamp": timestamp, "high_k": self.high_k, "low_k": self.low_k})
+
+
+class TemperatureAcquisition:
+    def __init__(self, read, interval=5.0, min_interval=0.01, ring_capacity=4096):
+        self.ring = SampleRing(ring_capacity)
+        self.sampler = TemperatureSampler(read, self.ring, interval=interval, min_interval=min_interval)
+        self.consumers = {}
+
+    def add_consumer(self, name, handle, period=0.5):
+        consumer = RingConsumer(name, self.ring, handle, period)
+        self.consumers[name] = consumer
+        return consumer
+
+    def set_interval(self, interval):
+        self.sampler.set_interval(interval)
+
+    def start(self):
+        for consumer in self.consumers.values():
+            consumer.start()
+        self.sampler.start()
+        logger.info(f"Temperature acquisition started at {self.sampler.interval} s "
+                    f"with consumers {list(self.consumers)}")
+
+    def stop(self):
+        """Stop sampling, then let every consumer take what is left."""
+        self.sampler.stop()
+        for consumer in self.consumers.values():
+            consumer.stop()
+
+    def stats(self):
+        return {"sampler": self.sampler.stats(),
+                "consumers": {name: consumer.stats() for name, consumer in self.consumers.items()}}
@@ -0,0 +1,184 @@
+"""
+Append-only store for fixed-schema numeric time series (temperature samples).
+Records are packed little-endian float64 structs, one per sample, written to
+segment files "<name>.<first timestamp>.bin" in a directory. Appending is O(1)
+regardless of how much history exists, fsync is batched, and a segment is
+rotated when it reaches max_segment_bytes. Segments are plain arrays of the
+record dtype, so readers memory-map them straight into numpy.
+
+Migrate the old JSON log with:
+    python TimeSeriesStore.py migrate logs/Temperature_measurements.json logs/temperature
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TimeSeriesStore:
+    def __init__(self, directory, name="temperature", fields=("temperature_k",),
+                 max_segment_bytes=16 * 1024 * 1024, fsync_every=60, fsync_interval=30.0):
+        """
+        Args:
+            directory (str): Where the segment files live (created if missing)
+            name (str): Series name, used as the segment file prefix
+            fields (tuple of str): Value columns stored after the timestamp, all float64
+            max_segment_bytes (int): Size at which the current segment is closed and a new one started
+            fsync_every (int): fsync after this many appended records...
+            fsync_interval (float): ...or this many seconds, whichever comes first
+        """
+        self.directory = directory
+        self.name = name
+        self.fields = tuple(fields)
+        self.dtype = np.dtype([("timestamp", "<f8")] + [(field, "<f8") for field in self.fields])
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, first_timestamp):
+        return os.path.join(self.directory, f"{self.name}.{first_timestamp:017.6f}.bin")
+
+    def segments(self):
+        """Segment paths in time order."""
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.name}.*.bin")))
+
+    def _open_segment(self, first_timestamp):
+        segments = self.segments()
+        path = segments[-1] if segments else None
+        if path is None or os.path.getsize(path) >= self.max_segment_bytes:
+            path = self._segment_path(first_timestamp)
+        self._file = open(path, "ab")
+        # Drop a torn record left by a crash mid-write
+        size = self._file.tell()
+        if size % self.dtype.itemsize:
+            self._file.truncate(size - size % self.dtype.itemsize)
+            self._file.seek(0, os.SEEK_END)
+        logger.info(f"[{self.name}] Writing to segment {path}")
+
+    def append(self, timestamp, *values):
+        """Append one record; values are given in the order of fields."""
+        record = np.array([(timestamp, *values)], dtype=self.dtype).tobytes()
+        self.append_bytes(record, timestamp)
+
+    def append_many(self, records):
+        """Append a structured array (or anything np.asarray converts to self.dtype) in one write."""
+        records = np.asarray(records, dtype=self.dtype)
+        if len(records):
+            self.append_bytes(records.tobytes(), float(records["timestamp"][0]), count=len(records))
+
+    def append_bytes(self, data, first_timestamp, count=1):
+        with self._lock:
+            if self._file is None:
+                self._open_segment(first_timestamp)
+            elif self._file.tell() >= self.max_segment_bytes:
+                self._close_segment()
+                self._file = open(self._segment_path(first_timestamp), "ab")
+                logger.info(f"[{self.name}] Rotated to segment {self._file.name}")
+            self._file.write(data)
+            self._unsynced += count
+            now = time.monotonic()
+            if self._unsynced >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                self._sync(now)
+
+    def _sync(self, now=None):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = now if now is not None else time.monotonic()
+
+    def flush(self):
+        """Force buffered records to disk."""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def read(self, start=None, end=None):
+        """
+        Return every record with start <= timestamp < end as a structured numpy array
+
+        Segments entirely outside the range are not opened; the others are
+        memory-mapped and sliced with a binary search on the timestamp column.
+        """
+        self.flush()
+        segments = self.segments()
+        starts = [float(os.path.basename(p)[len(self.name) + 1:-4]) for p in segments]
+        parts = []
+        for i, path in enumerate(segments):
+            if end is not None and starts[i] >= end:
+                break
+            if start is not None and i + 1 < len(segments) and starts[i + 1] <= start:
+                continue
+            n = os.path.getsize(path) // self.dtype.itemsize
+            if n == 0:
+                continue
+            records = np.memmap(path, dtype=self.dtype, mode="r", shape=(n,))
+            lo = 0 if start is None else np.searchsorted(records["timestamp"], start, side="left")
+            hi = n if end is None else np.searchsorted(records["timestamp"], end, side="left")
+            if hi > lo:
+                parts.append(np.array(records[lo:hi]))
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(parts)
+
+    def read_arrays(self, start=None, end=None):
+        """Like read(), but returns (timestamps, {field: values}) as plain float arrays."""
+        records = self.read(start, end)
+        return records["timestamp"].copy(), {field: records[field].copy() for field in self.fields}
+
+
+def migrate_json(json_path, store, timestamp_key="timestamp"):
+    """
+    Copy a JSON array of measurement dicts (the old Temperature_measurements.json format) into a store
+
+    Returns:
+        int: Number of records written
+    """
+    with open(json_path) as f:
+        data = json.load(f)
+    records = np.array(
+        [(m[timestamp_key], *(m[field] for field in store.fields)) for m in data],
+        dtype=store.dtype
+    )
+    records.sort(order="timestamp")
+    store.append_many(records)
+    store.flush()
+    logger.info(f"Migrated {len(records)} records from {json_path} into {store.directory}")
+    return len(records)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Time-series store utilities")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Convert a JSON measurement array into a store")
+    migrate.add_argument("json_path")
+    migrate.add_argument("directory")
+    migrate.add_argument("--name", default="temperature")
+    migrate.add_argument("--fields", nargs="+", default=["temperature_k"])
+    args = parser.parse_args()
+    if args.command == "migrate":
+        store = TimeSeriesStore(args.directory, name=args.name, fields=args.fields)
+        migrate_json(args.json_path, store)
+        store.close()
@@ -0,0 +1,199 @@
+"""
+Topic-trie message router for MQTTHandler.
+Handlers are registered on MQTT topic filters, wildcards included ('+' for one
+level, '#' for the rest of the topic), and several handlers may share a filter.
+Each handler chooses where it runs:
+
+    "inline"        on the network thread (only for handlers that return at once)
+    "thread"        on the router's thread pool
+    an Executor     on any concurrent.futures executor
+    an event loop   scheduled on a running asyncio loop; coroutine functions are awaited there
+
+Per handler, the router measures the dispatch delay (message received ->
+handler starts) and the run time.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+
+from Metrics import LatencyHistograms
+
+logger = logging.getLogger(__name__)
+
+# Topics whose matching handlers are remembered; cleared whenever handlers change
+MATCH_CACHE_SIZE = 1024
+
+
+class _Node:
+    __slots__ = ("children", "registrations")
+
+    def __init__(self):
+        self.children = {}
+        self.registrations = []
+
+
+class Registration:
+    def __init__(self, topic_filter, handler, executor, name):
+        self.topic_filter = topic_filter
+        self.handler = handler
+        self.executor = executor
+        self.name = name
+        self.is_coroutine = asyncio.iscoroutinefunction(handler)
+
+
+class TopicRouter:
+    def __init__(self, max_workers=4):
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._match_cache = {}
+        self._ids = itertools.count(1)
+        self._max_workers = max_workers
+        self._pool = None
+        self.dispatch_latency = LatencyHistograms()
+        self.run_time = LatencyHistograms()
+        self.errors = {}
+
+    def add(self, topic_filter, handler, executor="inline", name=None):
+        """
+        Register handler(payload) for a topic filter
+
+        Returns:
+            Registration: Pass to remove() to unregister
+        """
+        if executor not in ("inline", "thread") and not isinstance(
+                executor, (concurrent.futures.Executor, asyncio.AbstractEventLoop)):
+            raise ValueError(f"Unknown executor: {executor!r}")
+        name = name or f"{topic_filter}:{getattr(handler, '__name__', 'handler')}#{next(self._ids)}"
+        registration = Registration(topic_filter, handler, executor, name)
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                node = node.children.setdefault(level, _Node())
+            node.registrations.append(registration)
+            self._match_cache.clear()
+        return registration
+
+    def remove(self, registration):
+        """Unregister; returns True if no handler is left on its filter."""
+        with self._lock:
+            node = self._root
+            for level in registration.topic_filter.split("/"):
+                node = node.children.get(level)
+                if node is None:
+                    return True
+            if registration in node.registrations:
+                node.registrations.remove(registration)
+            self._match_cache.clear()
+            return not node.registrations
+
+    def filters(self):
+        """Every topic filter that has at least one handler."""
+        found = []
+
+        def walk(node, levels):
+            if node.registrations:
+                found.append("/".join(levels))
+            for level, child in node.children.items():
+                walk(child, levels + [level])
+
+        with self._lock:
+            for level, child in self._root.children.items():
+                walk(child, [level])
+        return found
+
+    def match(self, topic):
+        """Registrations whose filter matches topic, in registration order per filter."""
+        cached = self._match_cache.get(topic)
+        if cached is not None:
+            return cached
+        levels = topic.split("/")
+        matches = []
+        with self._lock:
+            self._collect(self._root, levels, 0, matches, system=topic.startswith("$"))
+            if len(self._match_cache) >= MATCH_CACHE_SIZE:
+                self._match_cache.clear()
+            self._match_cache[topic] = matches
+        return matches
+
+    def _collect(self, node, levels, depth, matches, system):
+        # Wildcards at the first level never match $SYS-style topics
+        wildcards = not (system and depth == 0)
+        if wildcards and "#" in node.children:
+            matches.extend(node.children["#"].registrations)
+        if depth == len(levels):
+            matches.extend(node.registrations)
+            return
+        child = node.children.get(levels[depth])
+        if child is not None:
+            self._collect(child, levels, depth + 1, matches, system)
+        if wildcards and "+" in node.children:
+            self._collect(node.children["+"], levels, depth + 1, matches, system)
+
+    def dispatch(self, topic, payload, received=None):
+        """
+        Hand payload to every handler matching topic
+
+        Returns:
+            int: Number of handlers it was dispatched to
+        """
+        received = time.perf_counter() if received is None else received
+        registrations = self.match(topic)
+        for registration in registrations:
+            executor = registration.executor
+            if executor == "inline":
+                self._run(registration, payload, received)
+            elif isinstance(executor, asyncio.AbstractEventLoop):
+                if registration.is_coroutine:
+                    asyncio.run_coroutine_threadsafe(self._run_async(registration, payload, received), executor)
+                else:
+                    executor.call_soon_threadsafe(self._run, registration, payload, received)
+            else:
+                pool = self._thread_pool() if executor == "thread" else executor
+                pool.submit(self._run, registration, payload, received)
+        return len(registrations)
+
+    def _thread_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(self._max_workers,
+                                                                       thread_name_prefix="mqtt-handler")
+        return self._pool
+
+    def _run(self, registration, payload, received):
+        start = time.perf_counter()
+        self.dispatch_latency.record(registration.name, start - received)
+        try:
+            registration.handler(payload)
+        except Exception as e:
+            self._failed(registration, e)
+        self.run_time.record(registration.name, time.perf_counter() - start)
+
+    async def _run_async(self, registration, payload, received):
+        start = time.perf_counter()
+        self.dispatch_latency.record(registration.name, start - received)
+        try:
+            await registration.handler(payload)
+        except Exception as e:
+            self._failed(registration, e)
+        self.run_time.record(registration.name, time.perf_counter() - start)
+
+    def _failed(self, registration, error):
+        self.errors[registration.name] = self.errors.get(registration.name, 0) + 1
+        logger.error(f"Handler {registration.name} failed: {str(error)}")
+
+    def stats(self):
+        """Per handler: dispatch delay and run time summaries, and error count."""
+        dispatch = self.dispatch_latency.summary()
+        run = self.run_time.summary()
+        return {
+            name: {"dispatch": dispatch[name], "run": run.get(name), "errors": self.errors.get(name, 0)}
+            for name in dispatch
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
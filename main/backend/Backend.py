@@ -1,16 +1,22 @@
 from Agilent_Controller_RS232 import Agilent33250A
 from GPIOController import Multiplexer, AD5260Controller, MAX31865Controller
+from ChannelPresets import ChannelPresets
 import logging
 import sys
 import os
-import serial
-import RPi.GPIO as GPIO
+import copy
 import time
 import numpy as np
 import json
 import paho.mqtt.client as mqtt
 from MQTTHandler import MQTTHandler
+from CommandExecutor import CommandExecutor, NULL_JOB
+from TimeSeriesStore import TimeSeriesStore, migrate_json
+from TemperatureAcquisition import TemperatureAcquisition, TemperatureAlarm
+from EventBus import EventBus
+from CalibrationPlan import CalibrationPlan, CalibrationRun, load_plan
 import threading
+import queue
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,11 +28,105 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Executor lane for every UI command type: commands on the same lane run one
+# after another, the two lanes run concurrently
+COMMAND_LANES = {
+    "signal_config": "agilent",
+    "burst": "agilent",
+    "connect_generator": "agilent",
+    "disconnect_generator": "agilent",
+    "trigger_burst": "agilent",
+    "pulse_train_sweep": "agilent",
+    "calibration_run": "agilent",  # also drives channels and wiper; spi_gpio commands are refused meanwhile
+    "channel_select": "spi_gpio",
+    "potentiometer_voltage_sweep": "spi_gpio",
+    "potentiometer_set_percent": "spi_gpio",
+    "channel_scan": "spi_gpio",
+}
+
+# BCM pins of the AD5260: CLK, SDO, SDI, PR*, CS*. CS* on BCM 8 puts it on CE0
+AD5260_PINS = [14, 9, 10, 25, 8]
+
+# "hardware" drives the real device, "simulated" uses the stand-in from
+# SimulatedHardware. Override per device in control_config.json, or set
+# UV_CONTROL_BACKEND=simulated to simulate everything.
+DEFAULT_CONFIG = {
+    "backends": {
+        "agilent": "hardware",
+        "gpio": "hardware",
+        "spi": "hardware",
+        "temperature": "hardware",
+    },
+    "simulation": {
+        "model_latency": True,
+    },
+    "agilent": {
+        "port": "/dev/ttyUSB0",
+        "baud_rate": 57600,
+        "timeout": 5000,
+    },
+    "potentiometer": {
+        "hardware_cs": False,  # True when CS* is wired to CE0 (BCM 8) and the SPI driver should assert it
+        "calibration_file": "ad5260_calibration.json",  # used when it exists
+        "presets_file": "channel_presets.json",  # wiper code per channel
+    },
+    "temperature": {
+        "driver": "adafruit",  # or "registers": auto-conversion mode read over spidev, for fast sampling
+        "spi_device": 1,  # CE line of the MAX31865 (registers driver); CE0 belongs to the AD5260
+        "filter_hz": 60,
+        "interval_s": 5.0,  # changeable at runtime with the "temperature_interval" command
+        "min_interval_s": 0.02,
+        "alarm_high_k": None,  # publish a temperature_alarm status event beyond these limits
+        "alarm_low_k": None,
+        "alarm_hysteresis_k": 0.5,
+    },
+    "events": {
+        "directory": "event_segments",  # triggers, channel, wiper and temperature on one timeline
+        "segment_interval_s": 300.0,
+    },
+    "calibration": {
+        "runs_directory": "calibration_runs",  # one <run_id>.ndjson of step results per plan
+    },
+    "mqtt": {
+        "broker": "172.17.0.1",
+        "port": 1883,
+        "transport": "paho",  # or "loopback" for the in-process broker in LoopbackMQTT
+        "keepalive": 60,
+        "offline_queue": "mqtt_offline_backend.sqlite",  # publishes made while the broker is unreachable
+    },
+}
+
+
+def load_config(path=None):
+    """
+    Build the backend configuration: DEFAULT_CONFIG, updated from a JSON file
+    (path, $UV_CONTROL_CONFIG or ./control_config.json) and $UV_CONTROL_BACKEND.
+    """
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    path = path or os.environ.get("UV_CONTROL_CONFIG", "control_config.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            overrides = json.load(f)
+        for section, values in overrides.items():
+            if isinstance(values, dict):
+                config.setdefault(section, {}).update(values)
+            else:
+                config[section] = values
+        logger.info(f"Loaded configuration from {path}")
+    backend = os.environ.get("UV_CONTROL_BACKEND")
+    if backend:
+        config["backends"] = {device: backend for device in config["backends"]}
+    return config
+
+
 class HighLevelControl():
-    def __init__(self):
+    def __init__(self, config=None):
+        self.config = config if config is not None else load_config()
         self.initialize_hardware()
         logger.info("hardware initialization worked in the _init_")
         self.system_status = "idle"
+        self.current_channel = None
+        self.calibration_job = None
         topics = {
             'temperature': f"/temperature",
             'operation_status': f"/status",
@@ -35,23 +135,107 @@ class HighLevelControl():
         }
         self.mqtt = MQTTHandler(
             client_id="backend_controller", 
-            broker="172.17.0.1", 
-            port=1883, 
-            topics=topics
+            broker=self.config["mqtt"]["broker"], 
+            port=self.config["mqtt"]["port"], 
+            topics=topics,
+            client_factory=self.mqtt_client_factory(),
+            keepalive=self.config["mqtt"]["keepalive"],
+            offline_queue_path=self.config["mqtt"]["offline_queue"]
             )
+        self.executor = CommandExecutor(self.mqtt.update_status, lanes=("agilent", "spi_gpio"), max_queue=16)
         self.setup_mqtt_handlers()
         self.mqtt.connect()
-        self.start_temp_loop(interval = 5)
+        self.start_temperature_acquisition()
+
+    def mqtt_client_factory(self):
+        if self.config["mqtt"].get("transport", "paho") == "loopback":
+            import LoopbackMQTT
+            return LoopbackMQTT.client_factory
+        return None
+
+    def create_backends(self):
+        """
+        Instantiate the simulated backends selected in the configuration
+
+        Returns a dict with "resource_manager", "gpio", "spi", "sensor" and "sensor_spi";
+        None entries mean the driver uses the real hardware library.
+        """
+        backends = self.config["backends"]
+        created = {"resource_manager": None, "gpio": None, "spi": None, "sensor": None, "sensor_spi": None}
+        if "simulated" not in backends.values():
+            return created
+        import SimulatedHardware
+        model_latency = self.config["simulation"]["model_latency"]
+        if backends["agilent"] == "simulated":
+            created["resource_manager"] = SimulatedHardware.SimulatedResourceManager(
+                model_latency=model_latency,
+                resources=(f"ASRL{self.config['agilent']['port']}::INSTR",)
+            )
+        if backends["gpio"] == "simulated":
+            created["gpio"] = SimulatedHardware.SimulatedGPIO()
+        if backends["spi"] == "simulated":
+            ad5260 = (0, AD5260Controller.chip_select_device(AD5260_PINS[4]))
+            self.spi_bus = SimulatedHardware.SimulatedSpiBus(devices={ad5260: SimulatedHardware.SimulatedAD5260()},
+                                                             model_latency=model_latency)
+            created["spi"] = self.spi_bus.SpiDev()
+        if backends["temperature"] == "simulated":
+            if self.config["temperature"]["driver"] == "registers":
+                # The MAX31865 on its CE line, next to the AD5260 when the SPI bus is simulated too
+                bus = getattr(self, "spi_bus", None) or SimulatedHardware.SimulatedSpiBus(
+                    devices={}, model_latency=model_latency)
+                address = (0, self.config["temperature"]["spi_device"])
+                if address in bus.devices:
+                    raise ValueError(f"SPI {address} is already taken by a simulated "
+                                     f"{type(bus.devices[address]).__name__}")
+                bus.devices[address] = SimulatedHardware.SimulatedMAX31865()
+                created["sensor_spi"] = bus.SpiDev()
+            else:
+                created["sensor"] = SimulatedHardware.SimulatedRTDSensor()
+        logger.info(f"Hardware backends: {backends}")
+        return created
+
+    def check_chip_selects(self):
+        """Refuse a configuration that puts the MAX31865 on the AD5260's CE line."""
+        temperature_config = self.config["temperature"]
+        ad5260_device = AD5260Controller.chip_select_device(AD5260_PINS[4])
+        if temperature_config["driver"] == "registers" and temperature_config["spi_device"] == ad5260_device:
+            raise ValueError(f"temperature.spi_device {ad5260_device} is the AD5260's chip select (CE{ad5260_device}); "
+                             f"wire the MAX31865 to the other CE line")
 
     def initialize_hardware(self):
         try:
-            self.agilent = Agilent33250A(port="/dev/ttyUSB0", baud_rate=57600, timeout=5000)
+            self.check_chip_selects()
+            self.backends = self.create_backends()
+            # Every driver stamps its hardware actions onto this one timeline
+            self.events = EventBus(self.config["events"]["directory"],
+                                   segment_interval=self.config["events"]["segment_interval_s"])
+            agilent_config = self.config["agilent"]
+            self.agilent = Agilent33250A(
+                port=agilent_config["port"],
+                baud_rate=agilent_config["baud_rate"],
+                timeout=agilent_config["timeout"],
+                resource_manager=self.backends["resource_manager"],
+                events=self.events
+            )
             logger.info("agilent intialized")
-            self.GPIOController = Multiplexer(pins=[17, 18, 22, 27])
+            self.GPIOController = Multiplexer(pins=[17, 18, 22, 27], gpio=self.backends["gpio"], events=self.events)
             logger.info("GPIO intialized")
-            self.AD5260Controller = AD5260Controller(pins=[14, 9, 10, 25, 8], rab=20000, vdd=5.0, vss=0.0)
+            self.AD5260Controller = AD5260Controller(pins=AD5260_PINS, rab=20000, vdd=5.0, vss=0.0,
+                                                     gpio=self.backends["gpio"], spi=self.backends["spi"],
+                                                     hardware_cs=self.config["potentiometer"]["hardware_cs"],
+                                                     events=self.events)
+            self.channel_presets = ChannelPresets(self.config["potentiometer"]["presets_file"])
+            calibration_file = self.config["potentiometer"].get("calibration_file")
+            if calibration_file and os.path.exists(calibration_file):
+                self.AD5260Controller.load_calibration(calibration_file)
             logger.info("potentiometer intialized")
-            self.MAX31865Controller = MAX31865Controller(cs_pin=11, wires=3, rtd_nominal=1000.0, ref_resistor=4300.0)
+            temperature_config = self.config["temperature"]
+            self.MAX31865Controller = MAX31865Controller(cs_pin=11, wires=3, rtd_nominal=1000.0, ref_resistor=4300.0,
+                                                         sensor=self.backends["sensor"],
+                                                         driver=temperature_config["driver"],
+                                                         spi=self.backends["sensor_spi"],
+                                                         spi_device=temperature_config["spi_device"],
+                                                         filter_hz=temperature_config["filter_hz"])
             logger.info("temperature measurer intialized")
             logger.info("All hardware initialized successfully")
         except Exception as e:
@@ -62,83 +246,135 @@ class HighLevelControl():
         self.mqtt.on_ui_command(self.handle_ui_command)
         logger.info("MQTT handlers configured")
 
-    def start_temp_loop(self, interval):
-        temp_thread = threading.Thread(target=self.update_temp_loop, args=(interval,), daemon=True)
-        temp_thread.start()
-        logger.info("Temperature loop started in background thread")
-
-    def update_temp_loop(self, interval):
-        file_path = "Temperature_measurements.json"
-        if not os.path.exists(file_path):
-            with open(file_path, "w") as f:
-                json.dump([], f)
-        while True:
+    def start_temperature_acquisition(self):
+        """Sample on its own thread; storage, MQTT and alarms each consume the samples on theirs."""
+        config = self.config["temperature"]
+        self.temperature_store = self.open_temperature_store()
+        self.temperature = TemperatureAcquisition(self.MAX31865Controller.read_temperature_k,
+                                                  interval=config["interval_s"],
+                                                  min_interval=config["min_interval_s"])
+        self.temperature.add_consumer("storage", self.store_temperature, period=1.0)
+        # The outbox batches these into array payloads (see default_topic_policies)
+        self.temperature.add_consumer("mqtt", self.publish_temperature, period=0.1)
+        self.temperature.add_consumer("events", self.record_temperature_events, period=1.0)
+        if config["alarm_high_k"] is not None or config["alarm_low_k"] is not None:
+            alarm = TemperatureAlarm(self.mqtt.update_status, high_k=config["alarm_high_k"],
+                                     low_k=config["alarm_low_k"], hysteresis_k=config["alarm_hysteresis_k"])
+            self.temperature.add_consumer("alarm", alarm, period=0.1)
+        self.temperature.start()
+
+    def open_temperature_store(self, directory="Temperature_measurements", legacy_file="Temperature_measurements.json"):
+        """Open the temperature time-series store, importing the old JSON log on first use."""
+        store = TimeSeriesStore(directory, name="temperature", fields=("temperature_k",))
+        if os.path.exists(legacy_file) and not store.segments():
             try:
-                temp_k = float(self.MAX31865Controller.read_temperature_k())
-                timestamp = time.time()
-                measurement = {
-                    "timestamp": timestamp,
-                    "temperature_k": temp_k
-                }
-                payload = json.dumps(measurement)
-                self.mqtt.publish("/temperature", payload, qos=1)
-                logging.info(f"[MAX31865] Published {temp_k:.2f} K to /temperature")
-                with open(file_path, "r+") as f:
-                    data = json.load(f)
-                    data.append(measurement)
-                    f.seek(0)
-                    json.dump(data, f, indent=2)
-
+                migrate_json(legacy_file, store)
+                os.replace(legacy_file, legacy_file + ".migrated")
             except Exception as e:
-                logging.error(f"[MAX31865] Read error: {e}")
-            time.sleep(interval)
+                logger.error(f"Could not migrate {legacy_file}: {str(e)}")
+        return store
+
+    def store_temperature(self, records):
+        rows = np.empty(len(records), dtype=self.temperature_store.dtype)
+        rows["timestamp"] = records["timestamp"]
+        rows["temperature_k"] = records["temperature_k"]
+        self.temperature_store.append_many(rows)
+
+    def record_temperature_events(self, records):
+        self.events.record_many("temperature", records["perf_counter_ns"], value=records["temperature_k"])
+
+    def publish_temperature(self, records):
+        for timestamp, temp_k in zip(records["timestamp"].tolist(), records["temperature_k"].tolist()):
+            self.mqtt.publish("/temperature", {"timestamp": timestamp, "temperature_k": temp_k})
+
+    def set_temperature_interval(self, command):
+        interval = float(command.get("interval_s"))
+        self.temperature.set_interval(interval)
+        self.mqtt.send_response({"type": "temperature_interval", "interval_s": interval, "command": command})
+
+    def send_channel_presets(self, command):
+        """Answer with the stored wiper preset of every channel, as codes and as percent."""
+        codes = {str(channel): code for channel, code in self.channel_presets.codes.items()}
+        percent = {channel: round(code / 255 * 100, 1) for channel, code in codes.items()}
+        self.mqtt.send_response({"type": "channel_presets", "codes": codes, "percent": percent, "command": command})
 
     def connect_to_generator(self):
+        """
+        Reconnect the existing driver, trying every USB serial port, and reset the instrument
+
+        The driver object is kept, so its trigger journal, SCPI statistics and
+        EventBus hook carry over instead of a second journal writer opening
+        trigger_log.ndjson.
+        """
+        if self.backends["resource_manager"] is not None:
+            self.agilent.connect()
+            return
+        self.agilent.disconnect()
         for port in Agilent33250A.find_usb_serial_ports():
             try:
-                self.agilent = Agilent33250A(port=port)
+                self.agilent.port = port
+                self.agilent.connect()
+                self.agilent.reset()
                 return
             except Exception as e:
+                self.agilent.disconnect()
                 continue
         raise RuntimeError("No Agilent 33250A device found on available ports")
 
 
     def handle_ui_command(self, command):
+        """
+        Entry point for /ui_command, called on the MQTT network thread
+        
+        Only parses the command and hands it to its executor lane, so the
+        network thread is free again within microseconds. "cancel" (optionally
+        with an "id"), "all_off", "temperature_interval" and "channel_presets" are
+        handled immediately.
+        """
         try:
             command = json.loads(command) if isinstance(command, str) else command
             logger.info(f"Received command: {command}")
 
             command_type = command.get("type")
 
-            if command_type == "channel_select":
-                self.handle_channel_selection(command)
-
-            elif command_type == "burst":
-                self.handle_burst_command(command)
-
-            elif command_type == "signal_config":
-                self.handle_signal_config(command)
-            
-            elif command_type == "connect_generator":
-                self.connect_to_generator()
-            
-            elif command_type == "disconnect_generator":
-                self.agilent.disconnect()
+            if command_type == "cancel":
+                cancelled = self.executor.cancel(command.get("id"))
+                self.mqtt.send_response({"type": "cancel", "cancelled": cancelled})
 
             elif command_type == "all_off":
                 self.all_off()
-            
-            elif command_type == "trigger_burst":
-                self.agilent.send_trigger(command)
+                self.mqtt.send_response({"type": "all_off", "command": command})
 
-            elif command_type == "pulse_train_sweep":
-                self.sweeping_pulse_train()
+            elif command_type == "temperature_interval":
+                self.set_temperature_interval(command)
 
-            elif command_type == "potentiometer_voltage_sweep":
-                self.voltage_sweep(command)
+            elif command_type == "channel_presets":
+                self.send_channel_presets(command)
+
+            elif COMMAND_LANES.get(command_type) == "spi_gpio" and self.calibration_owner() is not None:
+                self.mqtt.send_response({
+                    "error": f"Busy: calibration run {self.calibration_owner().id} owns the channels",
+                    "command": command
+                })
 
-            elif command_type == "potentiometer_set_percent":
-                self.handle_channel_selection(command)
+            elif command_type in COMMAND_LANES:
+                try:
+                    job = self.executor.submit(
+                        COMMAND_LANES[command_type],
+                        command_type,
+                        lambda job: self.execute_command(command, job),
+                        command_id=command.get("id")
+                    )
+                    if command_type == "calibration_run":
+                        # The run owns the channels from now on, not only once it starts on its lane
+                        self.calibration_job = job
+                    logger.info(f"Command {job.id} ({command_type}) queued on lane {job.lane}")
+                except queue.Full:
+                    logger.warning(f"Lane {COMMAND_LANES[command_type]} is full, rejected {command_type}")
+                    self.mqtt.send_response({
+                        "error": f"Busy: too many queued {COMMAND_LANES[command_type]} commands",
+                        "command": command
+                    })
 
             else:
                 logger.warning(f"Unknown command type: {command_type}")
@@ -154,105 +390,328 @@ class HighLevelControl():
                 "command": command
             })
 
+    def execute_command(self, command, job=NULL_JOB):
+        """
+        Run one UI command to completion; called on the command's executor lane.
 
-    def handle_signal_config(self, command):
-        try:
-            frequency = float(command.get("frequency", 1000))                   # Default 1 kHz
-            burst_count = int(command.get("bursts", 10))                        # Default 10 bursts
-            duty_cycle = float(command.get("duty_cycle", 50.0))                 # Default 50%
-            amplitude = float(command.get("amplitude", 3.0))                    # Default 3 V
-            inter_block_delay = float(command.get("inter_burst_wait", 0.5))     # Default 0.5s wait between blocks
+        Errors propagate, so the executor publishes the failed status of the job.
+        """
+        command_type = command.get("type")
 
-            logger.info(f"handle_signal_config reaches at least up to the config transmittance to the agilent {self.configure_signal}")
-            self.configure_signal(frequency=frequency, burst_count=burst_count, duty_cycle=duty_cycle, amplitude=amplitude, inter_block_delay=inter_block_delay)
-            logger.info("Signal configuration handled successfully.")
-            self.mqtt.send_response({"status": "Signal configuration applied."})
+        if command_type == "channel_select":
+            self.handle_channel_selection(command)
 
-        except Exception as e:
-            logger.error(f"Error in handle_signal_config: {str(e)}")
-            self.mqtt.send_response({"error": f"Signal config failed: {str(e)}"})
+        elif command_type == "burst":
+            self.handle_burst_command(command, job=job)
 
-    def configure_signal(self, frequency, burst_count, duty_cycle, amplitude, inter_block_delay):
+        elif command_type == "signal_config":
+            self.handle_signal_config(command)
+        
+        elif command_type == "connect_generator":
+            self.connect_to_generator()
+        
+        elif command_type == "disconnect_generator":
+            self.agilent.disconnect()
+        
+        elif command_type == "trigger_burst":
+            self.agilent.send_trigger(command)
+
+        elif command_type == "pulse_train_sweep":
+            self.sweeping_pulse_train(
+                max_pulses=int(command.get("max_pulses", 20)),
+                min_pulses=int(command.get("min_pulses", 1)),
+                inter_train_wait=float(command.get("inter_train_wait", 0.1)),
+                mode=command.get("mode", "auto"),
+                job=job
+            )
+
+        elif command_type == "potentiometer_voltage_sweep":
+            self.voltage_sweep(command, job=job)
+
+        elif command_type == "potentiometer_set_percent":
+            self.handle_channel_selection(command)
+
+        elif command_type == "channel_scan":
+            self.channel_scan(command, job=job)
+
+        elif command_type == "calibration_run":
+            return self.calibration_run(command, job=job)
+
+    def handle_signal_config(self, command):
+        frequency = float(command.get("frequency", 1000))                   # Default 1 kHz
+        burst_count = int(command.get("bursts", 10))                        # Default 10 bursts
+        duty_cycle = float(command.get("duty_cycle", 50.0))                 # Default 50%
+        amplitude = float(command.get("amplitude", 3.0))                    # Default 3 V
+        inter_block_delay = float(command.get("inter_burst_wait", 0.5))     # Default 0.5s wait between blocks
+        force = bool(command.get("force", False))                           # Re-send everything, ignoring the SCPI cache
+
+        logger.info(f"handle_signal_config reaches at least up to the config transmittance to the agilent {self.configure_signal}")
+        self.configure_signal(frequency=frequency, burst_count=burst_count, duty_cycle=duty_cycle, amplitude=amplitude, inter_block_delay=inter_block_delay, force=force)
+        logger.info("Signal configuration handled successfully.")
+        self.mqtt.send_response({"status": "Signal configuration applied."})
+
+    def configure_signal(self, frequency, burst_count, duty_cycle, amplitude, inter_block_delay, force=False):
         try:
             period = 1.0 / frequency
             width = period * (duty_cycle / 100.0)
             edge_time = min(1e-6, 0.1 * width)
 
-            self.agilent.configure_pulse(
-                frequency=frequency,
-                width=width,
-                edge_time=edge_time
-            )
-            self.agilent.send("OUTPUT ON")
-            self.agilent.set_burst_mode(
-                cycles=burst_count,
-                trigger_source="BUS",
-                enable=True
-            )
+            with self.agilent.batch():
+                self.agilent.configure_pulse(
+                    frequency=frequency,
+                    width=width,
+                    edge_time=edge_time,
+                    force=force
+                )
+                self.agilent.set_param("OUTPUT:STATE", "ON", force=force)
+                self.agilent.set_burst_mode(
+                    cycles=burst_count,
+                    trigger_source="BUS",
+                    enable=True,
+                    force=force
+                )
 
             self.inter_block_delay = inter_block_delay
 
             logger.info(f"Signal configured: frequency={frequency}, period={period}, width={width}, duty_cycle={duty_cycle}, bursts={burst_count}, inter_block_delay={inter_block_delay}")
+            logger.info(f"SCPI cache: {self.agilent.cache_stats()}")
 
         except Exception as e:
             logger.error(f"Failed to configure signal: {str(e)}")
             raise
     
-    def voltage_sweep(self, command):
+    def voltage_sweep(self, command, job=NULL_JOB):
         #very similarly to the "handle config" function, getting the info from the command JSON sent through and then just passing it on to the backend
-        voltage_start_v = float(command.get("start_v", 0))
-        voltage_end_v = float(command.get("end_v", 10))
-        voltage_sweep_steps = float(command.get("sweep_steps", 256))
-        voltage_sweep_duration = float(command.get("sweep_duration", 5))
-        self.AD5260Controller.voltage_sweep(start_v= voltage_start_v, end_v= voltage_end_v, steps = voltage_sweep_steps, duration= voltage_sweep_duration)
+        #the frontend sends the voltage_* keys; the short names are accepted too
+        def setting(name, default):
+            return command.get(f"voltage_{name}", command.get(name, default))
+
+        results = self.AD5260Controller.voltage_sweep(
+            start_v=float(setting("start_v", 0)),
+            end_v=float(setting("end_v", 5)),
+            steps=int(setting("sweep_steps", 255)),
+            duration=float(setting("sweep_duration", 5)),
+            profile=command.get("profile", "linear"),
+            voltages=command.get("voltages"),
+            job=job
+        )
+        job.publish(
+            "sweep_summary",
+            points=len(results),
+            first_code=int(results["code"][0]),
+            last_code=int(results["code"][-1]),
+            max_late_ms=float(results["late_s"].max() * 1e3)
+        )
+        return results
 
     def handle_channel_selection(self, command):
+        """
+        Route a channel and set its wiper level
+
+        A "voltage" (calibrated) or "percent" in the command becomes the channel's
+        stored preset; without either, the stored preset is applied. Without a
+        "channel" the currently routed one is used.
+        """
         try:
             channel = command.get("channel", self.current_channel)  # Default to current if not given
-            if channel is not None and (1 <= channel <= 8) and channel != self.current_channel:
-                self.activate_channel(channel)
-                self.current_channel = channel
-
-            percent = command.get("percent", 50)
-            if not (0 <= percent <= 100):
-                raise ValueError("Percent must be between 0 and 100")
-            code = int((percent / 100) * 255)
-            self.AD5260Controller.set_resistance(code)
-            logger.info(f"[Backend] Potentiometer for channel {channel} set to {percent:.1f}% (code {code})")
+            if channel is not None and not (1 <= channel <= 8):
+                raise ValueError("Channel must be between 1 and 8")
+
+            code = None
+            if command.get("voltage") is not None:
+                # Calibrated voltage -> code lookup, so the target is hit in one write
+                code = int(self.AD5260Controller.voltage_to_code(float(command["voltage"])))
+            elif command.get("percent") is not None:
+                percent = command["percent"]
+                if not (0 <= percent <= 100):
+                    raise ValueError("Percent must be between 0 and 100")
+                code = int((percent / 100) * 255)
+
+            if channel is None:
+                # Nothing routed yet: only the wiper can be set
+                self.AD5260Controller.set_resistance(127 if code is None else code)
+                return
+            if code is not None:
+                self.channel_presets.set(channel, code)
+            code = self.select_channel(channel)
+            logger.info(f"[Backend] Channel {channel} active with potentiometer code {code} "
+                        f"({self.AD5260Controller.calculate_voltage(code):.3f} V)")
 
         except Exception as e:
             logger.error(f"Channel selection error: {str(e)}")
             raise
 
+    def select_channel(self, channel, code=None):
+        """
+        Route channel and set the wiper to code (default: the channel's preset) as one operation
+
+        The wiper is shared by all channels, so when both change the output is
+        disabled while the wiper moves and the new channel is enabled last: no
+        channel ever runs at another channel's level. An unchanged code costs
+        no SPI write, an unchanged channel no GPIO write.
+
+        Returns:
+            int: The wiper code applied
+        """
+        code = self.channel_presets.code(channel) if code is None else code
+        pot = self.AD5260Controller
+        if channel == self.current_channel:
+            pot.set_resistance(code)
+        elif code == pot.code:
+            self.activate_channel(channel)
+        else:
+            self.GPIOController.off()
+            pot.set_resistance(code)
+            self.activate_channel(channel)
+        self.current_channel = channel
+        return code
+
+    def channel_scan(self, command, job=NULL_JOB):
+        """
+        Step through channels with their presets, holding each for a dwell time
+
+        Runs entirely on the spi_gpio lane: one command, no MQTT round-trip per step.
+        Dwell times are scheduled from the scan start, so switching cost does not add up.
+        Command keys: "channels" (default 1-8), "dwell_s" (seconds, or one per channel),
+        "repeat" (passes, default 1), "off_after" (default true).
+        """
+        channels = [int(c) for c in command.get("channels", range(1, 9))]
+        dwell = command.get("dwell_s", 1.0)
+        dwells = [float(d) for d in dwell] if isinstance(dwell, list) else [float(dwell)] * len(channels)
+        if len(dwells) != len(channels):
+            raise ValueError("dwell_s needs one entry per channel")
+        repeat = int(command.get("repeat", 1))
+        total = len(channels) * repeat
+
+        logger.info(f"[Backend] Scanning channels {channels} x{repeat}")
+        deadline = time.perf_counter()
+        try:
+            for step in range(total):
+                job.check()
+                channel = channels[step % len(channels)]
+                code = self.select_channel(channel)
+                job.progress(step + 1, total, channel=channel, code=code)
+                deadline += dwells[step % len(channels)]
+                job.sleep(deadline - time.perf_counter())
+        finally:
+            if command.get("off_after", True):
+                self.all_off()
+
+    def calibration_run(self, command, job=NULL_JOB):
+        """
+        Run every step of a calibration plan (see CalibrationPlan) as one job
+
+        Command keys: "plan" (the plan itself) or "plan_file" (JSON/YAML path),
+        "restart" (default false: a plan with results on disk continues after
+        the steps already done). Each finished step is appended to the run's
+        results file before it is published as a "calibration_step" event, so
+        a crash or a cancel loses at most the step in progress. Channel and
+        wiper commands still queued or running when it starts are cancelled.
+        """
+        plan = CalibrationPlan(command["plan"] if "plan" in command else load_plan(command["plan_file"]))
+        steps = plan.steps(self.AD5260Controller.voltage_to_code)
+        run = CalibrationRun(plan, self.config["calibration"]["runs_directory"],
+                             restart=bool(command.get("restart", False)))
+        pending = run.pending(steps)
+        logger.info(f"[Backend] Calibration run {plan.run_id}: {len(pending)} of {len(steps)} steps to go")
+
+        self.calibration_job = job
+        configured = None
+        try:
+            # Channel and wiper commands accepted before the run was submitted must not run alongside it
+            cancelled = self.executor.cancel_lane("spi_gpio")
+            if cancelled:
+                logger.info(f"[Backend] Calibration run {plan.run_id} cancelled spi_gpio commands {cancelled}")
+            while not self.executor.wait_idle("spi_gpio", timeout=0.1):
+                job.check()
+            for step, signal_index, channel, code in pending.tolist():
+                job.check()
+                signal = plan.signals[signal_index]
+                if "pulse_train_sweep" not in signal and signal_index != configured:
+                    # The first configuration of a run may follow a crash or a sweep's *RST: send everything
+                    self.configure_signal(frequency=float(signal["frequency"]), burst_count=int(signal["bursts"]),
+                                          duty_cycle=float(signal["duty_cycle"]), amplitude=float(signal["amplitude"]),
+                                          inter_block_delay=float(signal["inter_burst_wait"]),
+                                          force=configured is None)
+                    configured = signal_index
+                self.select_channel(channel, code)
+                job.sleep(plan.settle_s)
+
+                # The newest sample before firing opens the step's temperature record
+                cursor = max(self.temperature.ring.written - 1, 0)
+                started = time.time()
+                if "pulse_train_sweep" in signal:
+                    sweep = signal["pulse_train_sweep"]
+                    self.sweeping_pulse_train(max_pulses=int(sweep.get("max_pulses", 20)),
+                                              min_pulses=int(sweep.get("min_pulses", 1)),
+                                              inter_train_wait=float(sweep.get("inter_train_wait", 0.1)),
+                                              mode=sweep.get("mode", "auto"), job=job)
+                    configured = None
+                else:
+                    for trigger in range(int(signal["triggers"])):
+                        if trigger:
+                            job.sleep(float(signal["inter_burst_wait"]))
+                        # The step number is the trigger's burst label on the EventBus timeline
+                        self.agilent.send_trigger(step)
+                samples, _, _ = self.temperature.ring.read(cursor)
+
+                result = {
+                    "run_id": plan.run_id,
+                    "step": step,
+                    "signal": signal_index,
+                    "channel": channel,
+                    "code": code,
+                    "voltage": float(self.AD5260Controller.calculate_voltage(code)),
+                    "timestamp_unix": started,
+                    "duration_s": time.time() - started,
+                    "temperature_start_k": float(samples["temperature_k"][0]) if len(samples) else None,
+                    "temperature_end_k": float(samples["temperature_k"][-1]) if len(samples) else None,
+                }
+                run.record(result)
+                job.publish("calibration_step", **result)
+                job.progress(len(run.completed), len(steps), step=step, channel=channel, code=code)
+        finally:
+            if self.calibration_job is job:
+                self.calibration_job = None
+            self.all_off()
+            run.close()
+
+        logger.info(f"[Backend] Calibration run {plan.run_id} complete, results in {run.path}")
+        return {"run_id": plan.run_id, "steps": len(steps), "resumed_after": len(steps) - len(pending),
+                "results": run.path}
+
+    def calibration_owner(self):
+        """The calibration run that owns channels and wiper (queued or running), or None."""
+        job = self.calibration_job
+        # NULL_JOB (a direct call) has no state; it owns them for as long as the call runs
+        return job if job is not None and getattr(job, "state", "running") in ("queued", "running") else None
+
     def activate_channel(self, channel: int):
-        channel_methods = {
-            1: self.GPIOController.Switch_1,
-            2: self.GPIOController.Switch_2,
-            3: self.GPIOController.Switch_3,
-            4: self.GPIOController.Switch_4,
-            5: self.GPIOController.Switch_5,
-            6: self.GPIOController.Switch_6,
-            7: self.GPIOController.Switch_7,
-            8: self.GPIOController.Switch_8
-        }
-        
-        channel_methods[channel]()
-        logger.info(f"Activated UV channel {channel}")
+        elapsed = self.GPIOController.switch(channel)
+        logger.info(f"Activated UV channel {channel} (switch took {elapsed * 1e6:.1f} µs)")
 
     def all_off(self):
-        self.GPIOController.set_all_pins(False)
+        self.GPIOController.off()
+        self.current_channel = None
 
     def cleanup(self):
         logger.info("Starting system cleanup")
         self.all_off()
+        if getattr(self, "temperature", None) is not None:
+            self.temperature.stop()
+        self.MAX31865Controller.cleanup()
+        if getattr(self, "temperature_store", None) is not None:
+            self.temperature_store.close()
         self.agilent.close()
+        self.events.close()
         self.mqtt.disconnect()
         logger.info("Cleanup completed")
     
-    def handle_burst_command(self, command):
+    def handle_burst_command(self, command, job=NULL_JOB):
         try:
             cycles = command.get("cycles")
-            self.n_burst_series(cycles)
+            mode = command.get("mode", "auto")
+            self.n_burst_series(cycles, mode=mode, job=job)
             self.mqtt.send_response({
                 "type": "burst_status",
                 "cycles": cycles,
@@ -262,16 +721,55 @@ class HighLevelControl():
             logger.error(f"Burst command error: {str(e)}")
             raise
 
-    def n_burst_series(self, n: int):
+    def compile_sweep(self, counts, pulse_frequency, duty_cycle, gap, mode="auto", job=NULL_JOB):
+        """
+        Compile a pulse-train sweep for hardware-timed playback
+        
+        mode "compiled" requires the sweep to fit the arbitrary waveform memory,
+        "auto" returns None when it does not (the caller falls back to the
+        software loop) and "software" always returns None. Every sample of a
+        gap costs a waveform point, so long gaps between fast trains do not
+        fit: 5 MHz trains 0.1 s apart would need about 10^6 points per gap,
+        while the memory holds 65536. The reason (with the longest gap that
+        would fit) is raised for "compiled" before the instrument is touched,
+        and published as a "sweep_mode" event for "auto".
+        """
+        if mode not in ("auto", "compiled", "software"):
+            raise ValueError(f"Unknown sweep mode: {mode}")
+        if mode == "software":
+            return None
         try:
+            return Agilent33250A.compile_pulse_trains(counts, pulse_frequency, duty_cycle=duty_cycle, gap=gap)
+        except ValueError as e:
+            if mode == "compiled":
+                raise ValueError(f"Sweep cannot be compiled: {str(e)}") from e
+            logger.warning(f"Sweep cannot be compiled, using the software loop: {str(e)}")
+            job.publish("sweep_mode", mode="software", reason=str(e))
+            return None
+
+    def n_burst_series(self, n: int, mode="auto", job=NULL_JOB):
+        try:
+            compiled = self.compile_sweep(range(n, 0, -1), pulse_frequency=10000, duty_cycle=20, gap=0.1, mode=mode,
+                                          job=job)
+            if compiled is not None:
+                self.agilent.set_param("OUTPUT:STATE", "ON")
+                self.agilent.play_compiled_pulse_trains(compiled)
+                logger.info(f"Completed {n} burst cycles (compiled)")
+                return
+
             period = 1.0 / 10000
             width = period * 0.2  # 20% duty cycle
             self.agilent.configure_pulse(frequency=10000, width=width, edge_time=1e-6)
 
-            for cycle_count in range(n, 0, -1):
-                self.agilent.set_burst_mode(cycles=cycle_count, trigger_source="BUS", enable=True)
-                self.agilent.send_trigger(cycle_count)
-                time.sleep(0.1)
+            # Only BURST:NCYCLES changes between iterations, the SCPI cache skips the rest
+            # and the batch puts it on the same line as the *TRG
+            for i, cycle_count in enumerate(range(n, 0, -1)):
+                job.check()
+                with self.agilent.batch():
+                    self.agilent.set_burst_mode(cycles=cycle_count, trigger_source="BUS", enable=True)
+                    self.agilent.send_trigger(cycle_count)
+                job.progress(i + 1, n, cycles=cycle_count)
+                job.sleep(0.1)
 
             logger.info(f"Completed {n} burst cycles")
 
@@ -279,24 +777,47 @@ class HighLevelControl():
             logger.error(f"Burst operation failed: {str(e)}")
             raise
     
-    def sweeping_pulse_train(self, max_pulses=20, min_pulses=1, inter_train_wait=0.1):
+    def sweeping_pulse_train(self, max_pulses=20, min_pulses=1, inter_train_wait=0.1, mode="auto", job=NULL_JOB):
+        """
+        Fire pulse trains of max_pulses down to min_pulses 100 ns pulses (5 MHz square)
+        
+        mode "compiled" renders the whole sweep into one arbitrary waveform and
+        plays it with a single trigger, "software" steps BURST:NCYCLES and
+        triggers each train from Python, "auto" compiles when the sweep fits.
+        """
         try:
-            self.agilent.send("*RST")
-            self.agilent.send("*CLS")
-            self.agilent.send("FUNCTION SQUARE")
-            self.agilent.send("FREQUENCY 5E6")  # 5 MHz
-            self.agilent.send("OUTPUT ON")
-            self.agilent.send("BURST:MODE TRIG")
-            self.agilent.send("BURST:PHASE 0")
-            self.agilent.send("TRIGGER:SOURCE BUS")
-            self.agilent.send("BURST:STATE ON")
+            counts = range(max_pulses, min_pulses - 1, -1)
+            compiled = self.compile_sweep(counts, pulse_frequency=5e6, duty_cycle=50, gap=inter_train_wait, mode=mode,
+                                          job=job)
+            if compiled is not None:
+                self.agilent.reset()
+                self.agilent.set_param("OUTPUT:STATE", "ON")
+                logger.info("Starting compiled pulse train sweep")
+                self.agilent.play_compiled_pulse_trains(compiled)
+                logger.info(f"Pulse train sweep complete, train offsets: {compiled.train_starts.tolist()}")
+                return
+
+            self.agilent.send_many([
+                "*RST",
+                "*CLS",
+                "FUNCTION SQUARE",
+                "FREQUENCY 5E6",  # 5 MHz
+                "OUTPUT ON",
+                "BURST:MODE TRIG",
+                "BURST:PHASE 0",
+                "TRIGGER:SOURCE BUS",
+                "BURST:STATE ON",
+            ])
 
             logger.info("Starting pulse train sweep")
 
-            for n in range(max_pulses, min_pulses - 1, -1):
-                self.agilent.send(f"BURST:NCYCLES {n}")
-                self.agilent.send_trigger(n)
-                time.sleep(inter_train_wait)  # Wait 100 ms or as needed
+            for i, n in enumerate(counts):
+                job.check()
+                with self.agilent.batch():
+                    self.agilent.set_param("BURST:NCYCLES", n)
+                    self.agilent.send_trigger(n)
+                job.progress(i + 1, len(counts), pulses=n)
+                job.sleep(inter_train_wait)  # Wait 100 ms or as needed
 
             logger.info("Pulse train sweep complete.")
 
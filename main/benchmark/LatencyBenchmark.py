@@ -0,0 +1,232 @@
+"""
+End-to-end latency benchmark: UI command publish -> backend -> hardware I/O.
+
+Runs HighLevelControl on simulated hardware, with a UI-side MQTTHandler that
+publishes commands on /ui_command. Both sides share an in-process loopback
+broker unless --broker is given. For each command type the benchmark reports:
+
+    hardware    publish -> first matching hardware action (mux pins, SPI write, *TRG)
+    completion  publish -> "completed" event for the command on /status
+    throughput  commands/s when a burst of commands is queued back to back
+
+as p50/p95/p99 JSON, so runs can be compared over time (--append keeps a history).
+
+    python main/benchmark/LatencyBenchmark.py --iterations 200 --output bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+MAIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_DIR)
+
+from Metrics import LatencyHistogram
+
+# command type -> (command for iteration i, hardware action that marks its arrival)
+SCENARIOS = {
+    "channel_select": (lambda i: {"type": "channel_select", "channel": 1 + i % 8, "percent": 50}, "gpio"),
+    "potentiometer_set_percent": (lambda i: {"type": "potentiometer_set_percent", "percent": 20 + 40 * (i % 2)}, "spi"),
+    "trigger_burst": (lambda i: {"type": "trigger_burst"}, "trigger"),
+    "signal_config": (lambda i: {"type": "signal_config", "frequency": 1000 + 1000 * (i % 2), "bursts": 5}, None),
+}
+
+
+class HardwareProbe:
+    """Timestamps the first hardware action of an expected kind after arm()."""
+    def __init__(self, backends, mux_pins):
+        self._kind = None
+        self._ns = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        mux_pins = set(mux_pins)
+        backends["gpio"].listeners.append(
+            lambda ns, changed: self._hit("gpio", ns) if mux_pins & set(changed) else None)
+        # Only the potentiometer; the MAX31865 may share the bus (register driver)
+        pot_addresses = {address for address, device in backends["spi_bus"].devices.items()
+                         if type(device).__name__ == "SimulatedAD5260"}
+        backends["spi_bus"].listeners.append(
+            lambda ns, address, data: self._hit("spi", ns) if address in pot_addresses else None)
+        backends["instrument"].trigger_listeners.append(lambda ns: self._hit("trigger", ns))
+
+    def arm(self, kind):
+        with self._lock:
+            self._kind = kind
+            self._ns = None
+            self._event.clear()
+
+    def _hit(self, kind, ns):
+        with self._lock:
+            if kind == self._kind and self._ns is None:
+                self._ns = ns
+                self._event.set()
+
+    def wait(self, timeout):
+        return self._ns if self._event.wait(timeout) else None
+
+
+class CompletionTracker:
+    """Collects the /status completion events of the commands the benchmark sent."""
+    def __init__(self):
+        self._done = {}
+        self._cond = threading.Condition()
+
+    def on_status(self, payload):
+        if isinstance(payload, dict) and payload.get("event") in ("completed", "failed", "cancelled"):
+            now = time.perf_counter_ns()
+            with self._cond:
+                self._done[payload.get("id")] = (now, payload["event"])
+                self._cond.notify_all()
+
+    def wait(self, command_ids, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not all(c in self._done for c in command_ids):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+            return {c: self._done.get(c) for c in command_ids}
+
+
+def run_scenario(name, ui, probe, tracker, iterations, burst, timeout):
+    make_command, hardware_kind = SCENARIOS[name]
+    hardware = LatencyHistogram()
+    completion = LatencyHistogram()
+    failures = 0
+
+    for i in range(iterations):
+        command = dict(make_command(i), id=f"{name}-{i}")
+        if hardware_kind:
+            probe.arm(hardware_kind)
+        t0 = time.perf_counter_ns()
+        ui.publish("/ui_command", command, qos=1)
+        done = tracker.wait([command["id"]], timeout)[command["id"]]
+        if done is None or done[1] != "completed":
+            failures += 1
+            continue
+        completion.record((done[0] - t0) / 1e9)
+        if hardware_kind:
+            hit = probe.wait(timeout)
+            if hit is not None:
+                hardware.record((hit - t0) / 1e9)
+
+    # Throughput: queue a burst back to back, stay under the executor's queue bound
+    ids = []
+    t0 = time.perf_counter_ns()
+    for i in range(burst):
+        command = dict(make_command(i), id=f"{name}-burst-{i}")
+        ids.append(command["id"])
+        ui.publish("/ui_command", command, qos=1)
+    done = tracker.wait(ids, timeout * burst)
+    finished = [d[0] for d in done.values() if d is not None and d[1] == "completed"]
+    throughput = len(finished) / ((max(finished) - t0) / 1e9) if finished else 0.0
+
+    result = {
+        "completion": completion.summary(),
+        "throughput_per_s": throughput,
+        "failures": failures + burst - len(finished),
+    }
+    if hardware_kind:
+        result["hardware"] = hardware.summary()
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=MAIN_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UI command -> hardware latency benchmark")
+    parser.add_argument("--iterations", type=int, default=200, help="Sequential commands per type")
+    parser.add_argument("--burst", type=int, default=12, help="Back-to-back commands for the throughput run")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--broker", help="host[:port] of a real MQTT broker instead of the in-process loopback")
+    parser.add_argument("--no-latency-model", action="store_true", help="Do not model serial/SPI wire time")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for each command")
+    parser.add_argument("--workdir", help="Where the backend writes its logs (default: a temp directory)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--append", help="Also append the report as one line to this JSONL history file")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    history = os.path.abspath(args.append) if args.append else None
+    # The backend modules open their log files in the working directory on import
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="uv_bench_"))
+
+    from MQTTHandler import MQTTHandler
+    from backend.Backend import HighLevelControl, load_config
+    import LoopbackMQTT
+    logging.getLogger().setLevel(args.log_level)
+
+    config = load_config()
+    config["backends"] = {device: "simulated" for device in config["backends"]}
+    config["simulation"]["model_latency"] = not args.no_latency_model
+    client_factory = LoopbackMQTT.client_factory
+    if args.broker:
+        host, _, port = args.broker.partition(":")
+        config["mqtt"].update(broker=host, port=int(port or 1883), transport="paho")
+        client_factory = None
+    else:
+        config["mqtt"]["transport"] = "loopback"
+
+    backend = HighLevelControl(config=config)
+    probe = HardwareProbe({
+        "gpio": backend.backends["gpio"],
+        "spi_bus": backend.spi_bus,
+        "instrument": backend.backends["resource_manager"].instrument,
+    }, mux_pins=backend.GPIOController.pins)
+
+    tracker = CompletionTracker()
+    ui = MQTTHandler(client_id="benchmark_ui", broker=config["mqtt"]["broker"], port=config["mqtt"]["port"],
+                     topics={"operation_status": "/status"}, client_factory=client_factory)
+    ui.on_status_update(tracker.on_status)
+    ui.connect()
+    deadline = time.monotonic() + args.timeout
+    while not (ui.connected and backend.mqtt.connected) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(name, ui, probe, tracker, args.iterations, args.burst, args.timeout)
+
+    report = {
+        "benchmark": "ui_command_latency",
+        "timestamp": time.time(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "transport": "paho" if args.broker else "loopback",
+        "model_latency": not args.no_latency_model,
+        "iterations": args.iterations,
+        "results": results,
+        "scpi_cache": backend.agilent.cache_stats(),
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if history:
+        with open(history, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+    ui.disconnect()
+    backend.executor.shutdown()
+    # Stops temperature acquisition and flushes the journals, store and event segments
+    backend.cleanup()
+
+
+if __name__ == "__main__":
+    main()
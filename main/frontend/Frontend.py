@@ -1,34 +1,130 @@
 import logging
 import time
-import RPi.GPIO as GPIO
-from nicegui import ui
+from nicegui import app, ui
 import paho.mqtt.client as mqtt
 import json
 from pathlib import Path
-from MQTTHandler import MQTTHandler
+from AsyncMQTT import AsyncMQTTHandler
+from RingBuffer import RingBuffer, bucket_stats
+import asyncio
 import threading
+import numpy as np
+
+# Temperature samples kept for the chart (~29 days at the default 5 s interval, ~2.8 h at 50 Hz)
+TEMPERATURE_HISTORY = 500000
+# Chart zoom levels in seconds, and the points per series each one is decimated to
+CHART_WINDOWS = {600: '10 min', 3600: '1 h', 21600: '6 h', 86400: '24 h'}
+CHART_POINTS = 600
+
+# Upserts chart points by x: moves the window start, drops what fell out and
+# replaces the still-open last bucket instead of appending a duplicate
+CHART_UPSERT_JS = '''
+<script>
+function uvChartUpsert(id, xMin, points) {
+    const element = getElement(id);
+    if (!element || !element.chart) return;
+    const series = element.chart.getOption().series.map((s, i) => {
+        const data = s.data.filter(p => p[0] >= xMin);
+        for (const p of points[i]) {
+            if (data.length && data[data.length - 1][0] === p[0]) data[data.length - 1] = p;
+            else data.push(p);
+        }
+        return {data: data};
+    });
+    element.chart.setOption({xAxis: {min: xMin}, series: series});
+}
+</script>
+'''
 
 class Frontend():
     def __init__(self):
         self.notes_file = Path('channel_notes.json')
         self.channel_notes_store = {} 
         self.load_notes()
-        self.pot_settings_file = Path('potentiometer_settings.json')
-        self.channel_pot_settings = {}
-        self.load_pot_settings()
+        # The backend stores the wiper presets; this is the level last read from it
+        self.preset_percent = None
         topics = {
             'temperature': f"/temperature",
             'operation_status': f"/status",
             'UI_command': f"/ui_command",
             'control_response': f"/control_response",
         }
-        self.mqtt = MQTTHandler(
+        # Lives on NiceGUI's event loop; connected by start() once the loop runs
+        self.mqtt = AsyncMQTTHandler(
             client_id="web_ui",
             broker="172.17.0.1",
             port=1883,
-            topics=topics
+            topics=topics,
+            offline_queue_path="mqtt_offline_web_ui.sqlite",
+            max_offline_age=30.0  # a command clicked long ago should not fire after a reconnect
         )
-        self.mqtt.connect()
+        self.temperature_history = RingBuffer(TEMPERATURE_HISTORY, fields=("temperature_k",))
+        self.chart_window = 3600
+        self.temp_chart = None
+        self.calibration_label = None
+
+    async def start(self):
+        """Connect MQTT on the running loop and follow the temperature stream (app.on_startup)."""
+        await self.mqtt.start()
+        self._temperature_task = asyncio.create_task(self.follow_temperature())
+        self._calibration_task = asyncio.create_task(self.follow_calibration())
+
+    async def follow_temperature(self):
+        async with self.mqtt.subscribe("/temperature") as samples:
+            async for payload in samples:
+                # The backend batches samples, so a message may carry a list of them
+                first = None
+                for measurement in (payload if isinstance(payload, list) else [payload]):
+                    if isinstance(measurement, dict) and "temperature_k" in measurement:
+                        self.temperature_history.append(measurement["timestamp"], measurement["temperature_k"])
+                        first = measurement["timestamp"] if first is None else first
+                if first is not None:
+                    self.push_temperature(first)
+
+    async def follow_calibration(self):
+        async with self.mqtt.subscribe("/status") as events:
+            async for event in events:
+                if not isinstance(event, dict) or event.get("type") != "calibration_run" or self.calibration_label is None:
+                    continue
+                if event.get("event") == "progress" and "pulses" in event:
+                    # Progress of the pulse-train sweep within the current step
+                    self.calibration_label.text = f"Sweep train {event['done']}/{event['total']}: {event['pulses']} pulses"
+                elif event.get("event") == "progress":
+                    self.calibration_label.text = (f"Step {event['done']}/{event['total']}: "
+                                                   f"channel {event['channel']}, code {event['code']}")
+                elif event.get("event") in ("completed", "failed", "cancelled"):
+                    self.calibration_label.text = f"Calibration run {event['event']}"
+
+    def _chart_series(self, start):
+        # Decimated (min, mean, max) series of the samples from start on, as [ms, K] pairs
+        width = self.chart_window / CHART_POINTS
+        records = self.temperature_history.window(start // width * width)
+        buckets = bucket_stats(records["timestamp"], records["temperature_k"], width)
+        x = buckets["timestamp"] * 1000
+        return [np.column_stack((x, np.round(buckets[column], 3))).tolist() for column in ("min", "mean", "max")]
+
+    def _chart_start(self):
+        last = self.temperature_history.last()
+        return (last["timestamp"] if last is not None else time.time()) - self.chart_window
+
+    def redraw_temperature_chart(self):
+        """Send the whole decimated window, e.g. after a zoom change or to a newly opened page."""
+        if self.temp_chart is None:
+            return
+        start = self._chart_start()
+        for series, data in zip(self.temp_chart.options["series"], self._chart_series(start)):
+            series["data"] = data
+        self.temp_chart.options["xAxis"]["min"] = start * 1000
+        self.temp_chart.update()
+
+    def push_temperature(self, since):
+        """Send only the buckets touched by samples from since on; the browser merges them."""
+        if self.temp_chart is None:
+            return
+        start = self._chart_start()
+        points = self._chart_series(max(since, start))
+        self.temp_chart.client.run_javascript(
+            f"uvChartUpsert({self.temp_chart.id}, {start * 1000}, {json.dumps(points)})")
 
     def create_ui(self):
         with ui.row().classes("w-full justify-start"):
@@ -55,12 +151,9 @@ class Frontend():
 
                 ui.separator()
                 ui.label('Set Potentiometer Level').classes('text-h6')
-                current_channel = self.switch_dropdown.value
-                initial_percent = self.channel_pot_settings.get(current_channel, 50)
-
                 self.pot_percent_input = ui.number(
                     label='Potentiometer level (%)',
-                    value=initial_percent,
+                    value=None,
                     min=0,
                     max=100,
                     step=1
@@ -77,16 +170,27 @@ class Frontend():
                     note = self.channel_notes_store.get(channel, '')
                     self.channel_notes.value = note
 
-                def update_pot_input():
-                    channel = self.switch_dropdown.value
-                    self.pot_percent_input.value = self.channel_pot_settings.get(channel, 50)
-
-
-                self.switch_dropdown.on('update:model-value', update_pot_input)
+                self.switch_dropdown.on('update:model-value', self.load_pot_input)
+                app.on_connect(self.load_pot_input)
                 self.switch_dropdown.on('update:model-value', update_notes_field)
                 ui.button('Save Notes', on_click=save_notes_for_channel).classes('mt-2 bg-green-600')
                 ui.button('Activate Channel', on_click=self.execute_switch).classes('mt-2 w-full bg-blue-700')
 
+                scan_dwell_input = ui.number(label='Scan dwell per channel (s)', value=1.0, min=0, step=0.1).classes('w-full')
+
+                def scan_channels():
+                    try:
+                        self.mqtt.publish(
+                            topic="/ui_command",
+                            payload=json.dumps({"type": "channel_scan", "dwell_s": float(scan_dwell_input.value)}),
+                            qos=1
+                        )
+                        ui.notify('Channel scan started', color='positive')
+                    except Exception as e:
+                        ui.notify(f'Error sending scan command: {str(e)}', color='negative')
+
+                ui.button('Scan Channels 1-8', on_click=scan_channels).classes('mt-2 w-full bg-blue-500')
+
             with ui.card().classes("w-1/3"):
                 ui.label('Signal Configuration').classes('text-h6')
 
@@ -165,6 +269,24 @@ class Frontend():
                         on_click=send_pulse_train_sweep
                     ).classes('mt-2 w-full bg-orange-600')
 
+                    def send_cancel():
+                        try:
+                            self.mqtt.publish(
+                                topic="/ui_command",
+                                payload=json.dumps({
+                                    "type": "cancel"
+                                }),
+                                qos=1
+                            )
+                            ui.notify("Cancel sent for running commands", color='warning')
+                        except Exception as e:
+                            ui.notify(f"Cancel failed: {str(e)}", color='negative')
+
+                    ui.button(
+                        "Stop Running Sweeps",
+                        on_click=send_cancel
+                    ).classes('mt-2 w-full bg-red-700')
+
                 ui.separator()
                 ui.label('Signal Generator').classes('text-h6')
                 #status_label = ui.label('Status: Disconnected').classes('mt-2')
@@ -232,41 +354,71 @@ class Frontend():
 
                 ui.button("Do voltage sweep", on_click=voltage_sweep).classes('mt-2 w-full bg-purple-600')
 
-
-            ui.separator()
             with ui.card().classes("w-1/3"):
-                ui.label('Live Temperature Readout').classes('text-h6')
-                temp_display = ui.column().classes("gap-1")
-                self.temp_readings = []
-
-                def add_temperature_reading(temp_value):
-                    # Keep only the last 20 readings
-                    self.temp_readings.append(temp_value)
-                    if len(self.temp_readings) > 20:
-                        self.temp_readings.pop(0)
+                ui.label('Calibration Run').classes('text-h6')
+                plan_file_input = ui.input(label='Plan file on the backend (JSON/YAML)', value='calibration_plan.json')
+                restart_checkbox = ui.checkbox('Start over instead of resuming')
+                self.calibration_label = ui.label('No calibration run').classes('text-sm')
 
-                def on_temp_message(client, userdata, message):
+                def start_calibration_run():
                     try:
-                        payload = json.loads(message.payload.decode())
-                        print("Got MQTT message:", payload)
-                        if "temperature_k" in payload:
-                            add_temperature_reading(payload["temperature_k"])
+                        self.mqtt.publish(
+                            topic="/ui_command",
+                            payload=json.dumps({
+                                "type": "calibration_run",
+                                "plan_file": plan_file_input.value,
+                                "restart": restart_checkbox.value
+                            }),
+                            qos=1
+                        )
+                        ui.notify('Calibration run sent', color='positive')
                     except Exception as e:
-                        ui.notify(f"Temperature parse error: {e}", color="negative")
+                        ui.notify(f'Calibration run failed: {str(e)}', color='negative')
 
-                # Subscribe callback to /temperature topic
-                self.mqtt.client.subscribe("/temperature", qos=1)
-                self.mqtt.client.message_callback_add("/temperature", on_temp_message)
+                ui.button("Start Calibration Run", on_click=start_calibration_run).classes('mt-2 w-full bg-purple-600')
 
-                def refresh_ui():
-                    temp_display.clear()
-                    for temp in self.temp_readings:
-                        ui.label(f"{temp:.2f} K")
 
-                ui.timer(interval=5.0, callback=refresh_ui)
+            ui.separator()
+            with ui.card().classes("w-1/3"):
+                ui.label('Live Temperature Readout').classes('text-h6')
+                ui.add_head_html(CHART_UPSERT_JS)
+
+                def set_chart_window(event):
+                    self.chart_window = event.value
+                    self.redraw_temperature_chart()
+
+                ui.toggle(CHART_WINDOWS, value=self.chart_window, on_change=set_chart_window)
+                # Updated by follow_temperature() as each message arrives, with the new points only
+                self.temp_chart = ui.echart({
+                    "animation": False,
+                    "tooltip": {"trigger": "axis"},
+                    "legend": {"data": ["min", "mean", "max"]},
+                    "xAxis": {"type": "time"},
+                    "yAxis": {"type": "value", "name": "K", "scale": True},
+                    "series": [
+                        {"name": name, "type": "line", "showSymbol": False, "data": [],
+                         "lineStyle": {"width": 2 if name == "mean" else 1, "opacity": 1 if name == "mean" else 0.4}}
+                        for name in ("min", "mean", "max")
+                    ],
+                }).classes("w-full h-64")
+                # The history lives here, so a reloaded page gets it back in full
+                app.on_connect(self.redraw_temperature_chart)
+
+                sample_interval_input = ui.number(label='Sampling interval (s)', value=5.0, min=0.02, step=0.01).classes('w-full')
+
+                async def set_sample_interval():
+                    try:
+                        reply = await self.mqtt.request(
+                            {"type": "temperature_interval", "interval_s": float(sample_interval_input.value)},
+                            timeout=5.0)
+                        ui.notify(f"Sampling every {reply['interval_s']} s", color='positive')
+                    except Exception as e:
+                        ui.notify(f"Setting the sampling interval failed: {str(e)}", color='negative')
+
+                ui.button('Set Sampling Interval', on_click=set_sample_interval).classes('mt-2 w-full')
 
         
-    def execute_switch(self):
+    async def execute_switch(self):
         selected_channel = self.switch_dropdown.value
         if selected_channel is None:
             ui.notify("Please select a channel.", color='warning')
@@ -275,7 +427,9 @@ class Frontend():
             if "Switch" in selected_channel:
                 channel_number = int(selected_channel.split()[1])
                 command_type = "channel_select"
-                percent = float(self.pot_percent_input.value)
+                value = self.pot_percent_input.value
+                # Only a level the user changed is sent; otherwise the backend applies its preset
+                percent = float(value) if value is not None and value != self.preset_percent else None
             else:
                 channel_number = 0
                 command_type = "all_off"
@@ -283,16 +437,20 @@ class Frontend():
         
             payload = {
                 "type": command_type,
-                "channel": channel_number,
-                "percent": percent
+                "channel": channel_number
             }
-
-            self.mqtt.publish(
-                topic="/ui_command",
-                payload=json.dumps(payload),
-                qos=1
-            )
-            ui.notify(f'Channel {selected_channel} selected with voltage percentage: {percent}', color='positive')
+            if percent is not None:
+                payload["percent"] = percent
+
+            # Resolves once the backend reports the switch done, not when the click was sent
+            await self.mqtt.request(payload, timeout=10.0)
+            if percent is not None:
+                self.preset_percent = percent
+            level = percent if percent is not None else self.preset_percent
+            ui.notify(f'Channel {selected_channel} selected with voltage percentage: {level}', color='positive')
+
+        except asyncio.TimeoutError:
+            ui.notify(f'No reply from the backend for {selected_channel}', color='warning')
         
         except Exception as e:
             error_msg = f"MQTT error: {str(e)}"
@@ -315,19 +473,16 @@ class Frontend():
         except Exception as e:
             print(f"Failed to save notes: {e}")
 
-    def load_pot_settings(self):
-        if self.pot_settings_file.exists():
-            try:
-                with open(self.pot_settings_file, 'r') as f:
-                    self.channel_pot_settings = json.load(f)
-            except Exception as e:
-                print(f"Failed to load potentiometer settings: {e}")
-        else:
-            self.channel_pot_settings = {}
-
-    def save_pot_settings(self):
+    async def load_pot_input(self):
+        """Fill the level input with the selected channel's preset, as stored by the backend."""
+        selected = self.switch_dropdown.value
+        if selected is None or "Switch" not in selected:
+            return
         try:
-            with open(self.pot_settings_file, 'w') as f:
-                json.dump(self.channel_pot_settings, f, indent=2)
+            reply = await self.mqtt.request({"type": "channel_presets"}, timeout=5.0)
         except Exception as e:
-            print(f"Failed to save potentiometer settings: {e}")
+            ui.notify(f"Reading the channel presets failed: {str(e)}", color='warning')
+            return
+        if self.switch_dropdown.value == selected:
+            self.preset_percent = reply["percent"][selected.split()[1]]
+            self.pot_percent_input.value = self.preset_percent
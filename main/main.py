@@ -8,13 +8,15 @@ from MQTTHandler import MQTTHandler
 from backend.Backend import HighLevelControl
 from frontend.Frontend import Frontend
 import asyncio
-from nicegui import ui
+from nicegui import app, ui
 
 
 def main():
     backend = HighLevelControl()
     frontend = Frontend()
     frontend.create_ui()
+    # MQTT shares NiceGUI's event loop, so it can only connect once that loop runs
+    app.on_startup(frontend.start)
 
     ui.run(
         title="UV_LED Control Interface",
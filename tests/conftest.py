@@ -0,0 +1,43 @@
+"""
+Shared setup for the pytest suite: the control modules import each other as
+top-level modules from main/, and open their log files in the working
+directory on import, so the suite runs from a scratch directory.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main")
+sys.path.insert(0, MAIN)
+os.chdir(tempfile.mkdtemp(prefix="uv_tests_"))
+
+from Agilent_Controller_RS232 import Agilent33250A  # noqa: E402
+from SimulatedHardware import SimulatedResourceManager  # noqa: E402
+
+
+@pytest.fixture
+def agilent(tmp_path):
+    """An Agilent33250A on a SimulatedSCPIInstrument, without wire-time modelling."""
+    instrument = Agilent33250A(resource_manager=SimulatedResourceManager(model_latency=False),
+                               trigger_log=str(tmp_path / "trigger_log.ndjson"), legacy_trigger_log=None)
+    yield instrument
+    instrument.close()
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """HighLevelControl on simulated hardware and the in-process MQTT broker, writing into tmp_path."""
+    from backend.Backend import HighLevelControl, load_config
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("UV_CONTROL_BACKEND", raising=False)
+    config = load_config(str(tmp_path / "control_config.json"))
+    config["backends"] = {device: "simulated" for device in config["backends"]}
+    config["simulation"]["model_latency"] = False
+    config["mqtt"]["transport"] = "loopback"
+    config["temperature"]["interval_s"] = 0.05
+    control = HighLevelControl(config=config)
+    yield control
+    control.executor.shutdown()
+    control.cleanup()
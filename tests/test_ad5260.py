@@ -0,0 +1,63 @@
+"""AD5260 wiper writes: chip select, skipped repeats and code streaming."""
+import pytest
+
+from GPIOController import AD5260Controller
+from SimulatedHardware import SimulatedGPIO, SimulatedSpiBus
+
+PINS = [14, 9, 10, 25, 8]
+
+
+@pytest.fixture
+def bus():
+    return SimulatedSpiBus(model_latency=False)
+
+
+@pytest.fixture
+def pot(bus):
+    return AD5260Controller(pins=PINS, gpio=SimulatedGPIO(), spi=bus.SpiDev())
+
+
+def test_write_reaches_device_with_gpio_cs(pot, bus):
+    pot.set_resistance(200)
+    assert bus.devices[(0, 0)].code == 200
+    cs_levels = [level for _, pin, level in pot.gpio.history if pin == pot.CS]
+    assert cs_levels[-2:] == [0, 1]
+
+
+def test_gpio_cs_keeps_the_driver_off_every_ce_line(pot):
+    assert pot.spi_device == 0
+    assert pot.spi.no_cs
+
+
+def test_unchanged_code_is_skipped(pot, bus):
+    pot.set_resistance(10)
+    pot.set_resistance(10)
+    assert (pot.writes, pot.skipped_writes) == (1, 1)
+    pot.set_resistance(10, force=True)
+    assert bus.devices[(0, 0)].writes == 2
+
+
+def test_hardware_cs(bus):
+    pot = AD5260Controller(pins=PINS, gpio=SimulatedGPIO(), spi=bus.SpiDev(), hardware_cs=True)
+    pot.set_resistance(5)
+    assert bus.devices[(0, 0)].code == 5
+    assert pot.CS not in pot.gpio.pins
+
+
+def test_hardware_cs_needs_a_ce_pin(bus):
+    with pytest.raises(ValueError):
+        AD5260Controller(pins=[14, 9, 10, 25, 5], gpio=SimulatedGPIO(), spi=bus.SpiDev(), hardware_cs=True)
+
+
+def test_out_of_range_code(pot):
+    with pytest.raises(ValueError):
+        pot.set_resistance(256)
+    with pytest.raises(ValueError):
+        pot.write_codes([0, 300], dt=0.0)
+
+
+def test_write_codes_skips_repeats(pot, bus):
+    stats = pot.write_codes([1, 1, 2, 2, 3], dt=0.0005)
+    assert (stats["writes"], stats["skipped"]) == (3, 2)
+    assert bus.devices[(0, 0)].code == 3
+    assert stats["duration_s"] >= 4 * 0.0005
@@ -0,0 +1,149 @@
+"""asyncio MQTT client of the frontend, against the backend over the in-process broker."""
+import asyncio
+
+import pytest
+
+import LoopbackMQTT
+from AsyncMQTT import AsyncMQTTHandler
+
+TOPICS = {
+    "temperature": "/temperature",
+    "operation_status": "/status",
+    "UI_command": "/ui_command",
+    "control_response": "/control_response",
+}
+
+
+async def connected_client(client_id="web_ui", factory=LoopbackMQTT.client_factory):
+    client = AsyncMQTTHandler(client_id, topics=TOPICS, client_factory=factory)
+    await client.start()
+    for _ in range(500):
+        if client.connected:
+            break
+        await asyncio.sleep(0.01)
+    assert client.connected
+    return client
+
+
+def wait_for_backend(backend):
+    async def wait():
+        for _ in range(500):
+            if backend.mqtt.connected:
+                return
+            await asyncio.sleep(0.01)
+    asyncio.run(wait())
+
+
+def test_request_gets_the_job_outcome(backend):
+    wait_for_backend(backend)
+
+    async def main():
+        client = await connected_client()
+        try:
+            return await client.request({"type": "channel_select", "channel": 2, "code": 40}, timeout=5.0)
+        finally:
+            await client.stop()
+
+    reply = asyncio.run(main())
+    assert reply["event"] == "completed"
+    assert backend.GPIOController.active_channel() == 2
+
+
+def test_failure_is_reported_once(backend, monkeypatch):
+    wait_for_backend(backend)
+    responses = []
+    send_response = backend.mqtt.send_response
+    monkeypatch.setattr(backend.mqtt, "send_response", lambda payload: responses.append(payload) or send_response(payload))
+
+    async def main():
+        client = await connected_client()
+        try:
+            return await client.request({"type": "signal_config", "frequency": 0}, timeout=5.0)
+        finally:
+            await client.stop()
+
+    reply = asyncio.run(main())
+    assert reply["event"] == "failed" and "division" in reply["error"]
+    assert responses == []
+
+
+def test_request_without_a_job(backend):
+    wait_for_backend(backend)
+
+    async def main():
+        client = await connected_client()
+        try:
+            reply = await client.request({"type": "all_off"}, timeout=5.0)
+            with pytest.raises(RuntimeError, match="Unknown command type"):
+                await client.request({"type": "self_destruct"}, timeout=5.0)
+            return reply
+        finally:
+            await client.stop()
+
+    assert asyncio.run(main())["type"] == "all_off"
+
+
+def test_channel_presets_query(backend):
+    wait_for_backend(backend)
+    backend.channel_presets.set(3, 51)
+
+    async def main():
+        client = await connected_client()
+        try:
+            return await client.request({"type": "channel_presets"}, timeout=5.0)
+        finally:
+            await client.stop()
+
+    reply = asyncio.run(main())
+    assert reply["codes"]["3"] == 51 and reply["percent"]["3"] == 20.0
+    assert reply["percent"]["1"] == 49.8
+
+
+def test_handlers_run_on_the_loop():
+    broker = LoopbackMQTT.LoopbackBroker()
+
+    async def main():
+        client = await connected_client("sub", factory=broker.client)
+        sender = broker.client(client_id="sender")
+        sender.connect()
+        try:
+            async with client.subscribe("/temperature/#") as samples:
+                sender.publish("/temperature/a", '{"t": 1}')
+                sender.publish("/temperature/b", '{"t": 2}')
+                received = [await asyncio.wait_for(samples.__anext__(), 5.0) for _ in range(2)]
+            return received
+        finally:
+            await client.stop()
+
+    assert asyncio.run(main()) == [{"t": 1}, {"t": 2}]
+
+
+def test_slow_subscriber_drops_the_oldest():
+    broker = LoopbackMQTT.LoopbackBroker()
+
+    async def main():
+        client = await connected_client("slow", factory=broker.client)
+        try:
+            subscription = client.subscribe("/x", maxsize=2)
+            for n in range(5):
+                subscription._put(n)
+            items = [subscription.queue.get_nowait() for _ in range(2)]
+            subscription.close()
+            return items, subscription.dropped
+        finally:
+            await client.stop()
+
+    assert asyncio.run(main()) == ([3, 4], 3)
+
+
+def test_publish_async_offline_goes_to_the_queue():
+    async def main():
+        client = AsyncMQTTHandler("offline", topics=TOPICS, client_factory=LoopbackMQTT.LoopbackBroker().client)
+        client.loop = asyncio.get_running_loop()
+        delivered = await client.publish_async("/status", {"state": "idle"})
+        queued = len(client.offline_queue)
+        client.outbox.close()
+        client.offline_queue.close()
+        return delivered, queued
+
+    assert asyncio.run(main()) == (False, 1)
@@ -0,0 +1,96 @@
+"""AD5260 calibration LUT: interpolation, edge extrapolation, inversion and the cache."""
+import glob
+import json
+import os
+
+import numpy as np
+import pytest
+
+from GPIOController import AD5260Controller, CalibrationLUT, CalibrationPoint
+from SimulatedHardware import SimulatedGPIO, SimulatedSpiBus
+
+
+def points(*pairs):
+    return [CalibrationPoint(f"p{i}", code, voltage) for i, (code, voltage) in enumerate(pairs)]
+
+
+def test_interpolates_between_points():
+    lut = CalibrationLUT.from_points(points((0, 0.0), (100, 1.0), (200, 3.0)))
+    assert lut.voltage(50) == pytest.approx(0.5)
+    assert lut.voltage(150) == pytest.approx(2.0)
+
+
+def test_extrapolates_past_the_edges():
+    lut = CalibrationLUT.from_points(points((10, 1.0), (20, 2.0), (30, 2.5), (40, 3.0)))
+    assert lut.voltage(0) == pytest.approx(0.0)
+    assert lut.voltage(255) == pytest.approx(3.0 + 215 * 0.05)
+
+
+def test_duplicate_edge_codes_are_averaged():
+    lut = CalibrationLUT.from_points(points((0, 0.0), (0, 0.2), (128, 2.5), (255, 5.0), (255, 4.8)))
+    assert np.isfinite(lut.voltages).all()
+    assert lut.voltage(0) == pytest.approx(0.1)
+    assert lut.voltage(255) == pytest.approx(4.9)
+
+
+def test_duplicate_codes_inside_the_range():
+    lut = CalibrationLUT.from_points(points((10, 0.2), (10, 0.4), (128, 2.5)))
+    assert np.isfinite(lut.voltages).all()
+    assert lut.voltage(10) == pytest.approx(0.3)
+
+
+def test_needs_two_distinct_codes():
+    with pytest.raises(ValueError):
+        CalibrationLUT.from_points(points((5, 1.0), (5, 1.1)))
+
+
+def test_rejects_bad_tables():
+    with pytest.raises(ValueError):
+        CalibrationLUT(np.zeros(10))
+    with pytest.raises(ValueError):
+        CalibrationLUT(np.r_[np.linspace(0, 1, 255), 0.5])
+    with pytest.raises(ValueError):
+        CalibrationLUT(np.r_[np.linspace(0, 1, 255), np.nan])
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_code_for_inverts_the_table(descending):
+    voltages = np.linspace(0.0, 5.0, 256) ** 1.5
+    lut = CalibrationLUT(voltages[::-1] if descending else voltages)
+    codes = np.arange(256)
+    assert np.array_equal(lut.code_for(lut.voltage(codes)), codes)
+    # Beyond the table: the nearest end
+    assert lut.code_for(-1.0) == (255 if descending else 0)
+    assert lut.code_for(100.0) == (0 if descending else 255)
+
+
+def test_code_for_picks_the_nearest():
+    lut = CalibrationLUT(np.arange(256, dtype=float))
+    assert lut.code_for([10.4, 10.6]).tolist() == [10, 11]
+
+
+def test_cached_per_file_contents(tmp_path):
+    filename = tmp_path / "ad5260_calibration.json"
+    calibration = [{"name": "a", "code": 0, "voltage": 0.0}, {"name": "b", "code": 255, "voltage": 4.0}]
+    filename.write_text(json.dumps({"calibration": calibration}))
+    pot = AD5260Controller(gpio=SimulatedGPIO(), spi=SimulatedSpiBus(model_latency=False).SpiDev())
+    pot.load_calibration(str(filename))
+    cache = glob.glob(str(tmp_path / ".calibration_cache" / "*.npy"))
+    assert len(cache) == 1
+    assert pot.calculate_voltage(255) == pytest.approx(4.0)
+    # Edited file contents get a table of their own
+    calibration[1]["voltage"] = 5.0
+    filename.write_text(json.dumps({"calibration": calibration}))
+    pot.load_calibration(str(filename))
+    assert len(os.listdir(tmp_path / ".calibration_cache")) == 2
+    assert pot.calculate_voltage(255) == pytest.approx(5.0)
+
+
+def test_unreadable_cache_is_rebuilt(tmp_path):
+    filename = tmp_path / "calibration.json"
+    filename.write_text("{}")
+    lut = CalibrationLUT.for_file(str(filename), points((0, 0.0), (255, 5.0)), cache_dir=str(tmp_path))
+    cache_path = glob.glob(str(tmp_path / "*.npy"))[0]
+    np.save(cache_path, np.zeros(3))
+    rebuilt = CalibrationLUT.for_file(str(filename), points((0, 0.0), (255, 5.0)), cache_dir=str(tmp_path))
+    assert np.array_equal(rebuilt.voltages, lut.voltages)
@@ -0,0 +1,149 @@
+"""Calibration plans: step ordering, drive codes, run IDs and resuming a run on the backend."""
+import json
+import time
+
+import pytest
+
+from CalibrationPlan import CalibrationPlan, CalibrationRun, load_plan
+from CommandExecutor import CommandCancelled, Job
+
+PLAN = {
+    "name": "test",
+    "channels": [1, 2, 3],
+    "drive": {"percent": [10, 50]},
+    "signals": [
+        {"frequency": 1000, "bursts": 2, "triggers": 2, "inter_burst_wait": 0.0},
+        {"pulse_train_sweep": {"max_pulses": 3, "inter_train_wait": 0.0}},
+        {"frequency": 2000, "bursts": 2, "triggers": 1},
+    ],
+    "settle_s": 0.0,
+}
+
+
+def test_steps_alternate_direction():
+    steps = CalibrationPlan(PLAN).steps()
+    assert len(steps) == 3 * 3 * 2
+    assert steps["step"].tolist() == list(range(18))
+    first = steps[:6]
+    assert [(c, code) for c, code in zip(first["channel"].tolist(), first["code"].tolist())] == [
+        (1, 25), (1, 127), (2, 127), (2, 25), (3, 25), (3, 127)]
+    # The next signal starts where the previous one ended
+    assert (steps[6]["channel"], steps[6]["code"]) == (3, 127)
+
+
+def test_sweeps_run_last():
+    steps = CalibrationPlan(PLAN).steps()
+    assert sorted(set(steps["signal"][-6:].tolist())) == [1]
+    assert CalibrationPlan(PLAN).signal_order() == [0, 2, 1]
+
+
+def test_bursts_ordered_by_fewest_changes():
+    signals = [{"frequency": 1000, "duty_cycle": 50},
+               {"frequency": 2000, "duty_cycle": 20, "bursts": 3},
+               {"frequency": 1000, "duty_cycle": 20}]
+    assert CalibrationPlan({"signals": signals}).signal_order() == [0, 2, 1]
+
+
+@pytest.mark.parametrize("drive, expected", [
+    ({"codes": [0, 255]}, [0, 255]),
+    ({"percent": [0, 50, 100]}, [0, 127, 255]),
+    ({"voltages": [1.0, 2.0]}, [10, 20]),
+])
+def test_drive_codes(drive, expected):
+    assert CalibrationPlan({"drive": drive}).codes(lambda v: v * 10) == expected
+
+
+def test_invalid_plans():
+    with pytest.raises(ValueError):
+        CalibrationPlan({"channels": [0]})
+    with pytest.raises(ValueError):
+        CalibrationPlan({"drive": {"codes": [256]}}).codes()
+    with pytest.raises(ValueError):
+        CalibrationPlan({"drive": {"voltages": [1.0]}}).codes()
+    with pytest.raises(ValueError):
+        CalibrationPlan({"drive": {"ohms": [1.0]}}).codes()
+
+
+def test_run_id_follows_the_plan():
+    assert CalibrationPlan(PLAN).run_id == CalibrationPlan(json.loads(json.dumps(PLAN))).run_id
+    changed = CalibrationPlan({**PLAN, "settle_s": 1.0})
+    assert changed.run_id != CalibrationPlan(PLAN).run_id
+    assert changed.run_id.startswith("test-")
+
+
+def test_load_yaml_plan(tmp_path):
+    yaml = pytest.importorskip("yaml")
+    path = tmp_path / "plan.yaml"
+    path.write_text(yaml.safe_dump(PLAN))
+    assert CalibrationPlan(load_plan(str(path))).run_id == CalibrationPlan(PLAN).run_id
+
+
+def test_run_resumes_and_restarts(tmp_path):
+    plan = CalibrationPlan(PLAN)
+    steps = plan.steps()
+    run = CalibrationRun(plan, str(tmp_path))
+    for step in (0, 1, 2):
+        run.record({"step": step})
+    run.close()
+    resumed = CalibrationRun(plan, str(tmp_path))
+    assert resumed.pending(steps)["step"].tolist() == list(range(3, 18))
+    resumed.close()
+    restarted = CalibrationRun(plan, str(tmp_path), restart=True)
+    assert len(restarted.pending(steps)) == 18
+    restarted.close()
+    assert (tmp_path / f"{plan.run_id}.ndjson.1").exists()
+
+
+class RecordingJob(Job):
+    """A job run outside the executor that keeps its events and can cancel itself after some steps."""
+
+    def __init__(self, cancel_after=None):
+        super().__init__("run", "calibration_run", "agilent", None, self._record)
+        self.events = []
+        self.cancel_after = cancel_after
+
+    def _record(self, event):
+        self.events.append(event)
+        steps = sum(e["event"] == "calibration_step" for e in self.events)
+        if self.cancel_after is not None and steps >= self.cancel_after:
+            self.cancel()
+
+
+def test_backend_run_cancel_and_resume(backend):
+    command = {"plan": PLAN}
+    job = RecordingJob(cancel_after=4)
+    with pytest.raises(CommandCancelled):
+        backend.calibration_run(command, job=job)
+    assert backend.GPIOController.active_channel() is None
+    assert backend.calibration_job is None
+
+    job = RecordingJob()
+    result = backend.calibration_run(command, job=job)
+    assert (result["steps"], result["resumed_after"]) == (18, 4)
+    done = [e["step"] for e in job.events if e["event"] == "calibration_step"]
+    assert done == list(range(4, 18))
+    with open(result["results"]) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[0]["plan"] == PLAN
+    assert sorted(line["step"] for line in lines[1:]) == list(range(18))
+    assert all(line["voltage"] is not None for line in lines[1:])
+
+
+def test_run_owns_the_channels_from_submit(backend, monkeypatch):
+    events, responses = [], []
+    publish = backend.executor._publish_status
+    monkeypatch.setattr(backend.executor, "_publish_status", lambda event: events.append(event) or publish(event))
+    monkeypatch.setattr(backend.mqtt, "send_response", responses.append)
+    backend.handle_ui_command({"type": "channel_scan", "id": "scan", "channels": [1, 2], "dwell_s": 0.05,
+                               "repeat": 1000})
+    deadline = time.monotonic() + 5.0
+    while not any(e["id"] == "scan" and e["event"] == "started" for e in events) and time.monotonic() < deadline:
+        time.sleep(0.005)
+    backend.handle_ui_command({"type": "calibration_run", "id": "run", "plan": {**PLAN, "signals": PLAN["signals"][:1]}})
+    # Refused at once, although the run may not have started on its lane yet
+    backend.handle_ui_command({"type": "channel_select", "id": "select", "channel": 4})
+    assert "owns the channels" in responses[-1]["error"]
+    while backend.calibration_owner() is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    outcome = {e["id"]: e["event"] for e in events if e["event"] in ("completed", "failed", "cancelled")}
+    assert outcome == {"scan": "cancelled", "run": "completed"}
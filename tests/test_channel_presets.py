@@ -0,0 +1,75 @@
+"""Per-channel wiper presets, combined channel select and channel_scan."""
+import json
+import time
+
+import pytest
+
+from ChannelPresets import ChannelPresets
+
+
+def test_defaults_and_persistence(tmp_path):
+    path = str(tmp_path / "presets.json")
+    presets = ChannelPresets(path)
+    assert presets.code(3) == 127
+    assert presets.set(3, 40)
+    assert not presets.set(3, 40)
+    assert ChannelPresets(path).code(3) == 40
+
+
+def test_invalid_channel_and_code(tmp_path):
+    presets = ChannelPresets(str(tmp_path / "presets.json"))
+    with pytest.raises(ValueError):
+        presets.code(9)
+    with pytest.raises(ValueError):
+        presets.set(1, 300)
+
+
+def test_unreadable_file_keeps_defaults(tmp_path):
+    path = tmp_path / "presets.json"
+    path.write_text("{not json")
+    assert ChannelPresets(str(path)).code(1) == 127
+
+
+def test_unknown_channels_in_file_are_ignored(tmp_path):
+    path = tmp_path / "presets.json"
+    path.write_text(json.dumps({"1": 10, "12": 99}))
+    presets = ChannelPresets(str(path))
+    assert presets.code(1) == 10
+    assert 12 not in presets.codes
+
+
+def test_select_channel_moves_the_wiper_with_the_output_off(backend):
+    backend.select_channel(1, 50)
+    enable = backend.GPIOController.pins[0]
+    gpio, spi = backend.backends["gpio"], backend.spi_bus
+    mark = time.perf_counter_ns()
+    backend.select_channel(2, 90)
+    write_ns = next(t for t, _, data in spi.history if t > mark)
+    enable_writes = [(t, level) for t, pin, level in gpio.history if pin == enable and t > mark]
+    assert enable_writes[0][1] == 0 and enable_writes[0][0] < write_ns
+    assert enable_writes[-1][1] == 1 and enable_writes[-1][0] > write_ns
+    assert backend.AD5260Controller.code == 90
+    assert backend.GPIOController.active_channel() == 2
+
+
+def test_select_channel_uses_the_preset(backend):
+    backend.channel_presets.set(4, 33)
+    assert backend.select_channel(4) == 33
+    assert backend.AD5260Controller.code == 33
+
+
+def test_channel_selection_stores_the_preset(backend):
+    backend.handle_channel_selection({"channel": 5, "percent": 50})
+    assert backend.channel_presets.code(5) == 127
+    assert backend.GPIOController.active_channel() == 5
+
+
+def test_channel_scan(backend):
+    backend.channel_presets.set(1, 10)
+    backend.channel_presets.set(2, 20)
+    switched = []
+    backend.backends["gpio"].listeners.append(lambda t, changed: switched.append(backend.GPIOController.active_channel()))
+    backend.channel_scan({"channels": [1, 2], "dwell_s": 0.01, "repeat": 2})
+    assert [c for c in switched if c is not None][-1] == 2
+    assert backend.GPIOController.active_channel() is None
+    assert backend.current_channel is None
@@ -0,0 +1,115 @@
+"""Per-resource executor lanes: ordering, concurrency, cancellation and job ids."""
+import queue
+import threading
+import time
+
+import pytest
+
+from CommandExecutor import CommandExecutor
+
+
+class Events:
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def of(self, command_id):
+        with self.lock:
+            return [e["event"] for e in self.events if e["id"] == command_id]
+
+    def wait(self, command_id, event, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while event not in self.of(command_id):
+            if time.monotonic() > deadline:
+                raise AssertionError(f"No {event} event for {command_id}: {self.of(command_id)}")
+            time.sleep(0.005)
+
+
+@pytest.fixture
+def executor():
+    events = Events()
+    executor = CommandExecutor(events, lanes=("a", "b"), max_queue=2)
+    executor.events = events
+    yield executor
+    executor.shutdown()
+
+
+def test_lifecycle_and_result(executor):
+    executor.submit("a", "t", lambda job: 42, command_id="x")
+    executor.events.wait("x", "completed")
+    assert executor.events.of("x") == ["queued", "started", "completed"]
+    assert executor.events.events[-1]["result"] == 42
+
+
+def test_jobs_on_one_lane_run_in_order(executor):
+    order = []
+    for i in range(2):
+        executor.submit("a", "t", lambda job, i=i: order.append(i), command_id=f"j{i}")
+    executor.events.wait("j1", "completed")
+    assert order == [0, 1]
+
+
+def test_lanes_run_concurrently(executor):
+    release = threading.Event()
+    executor.submit("a", "slow", lambda job: release.wait(2.0), command_id="slow")
+    executor.submit("b", "fast", lambda job: None, command_id="fast")
+    executor.events.wait("fast", "completed")
+    assert "completed" not in executor.events.of("slow")
+    release.set()
+
+
+def test_cancel_wakes_a_sleeping_job(executor):
+    executor.submit("a", "t", lambda job: job.sleep(10), command_id="x")
+    executor.events.wait("x", "started")
+    assert executor.cancel("x") == ["x"]
+    executor.events.wait("x", "cancelled", timeout=1.0)
+
+
+def test_failure_is_published(executor):
+    def fail(job):
+        raise RuntimeError("boom")
+    executor.submit("a", "t", fail, command_id="x")
+    executor.events.wait("x", "failed")
+    assert executor.events.events[-1]["error"] == "boom"
+
+
+def test_full_lane_refuses(executor):
+    release = threading.Event()
+    executor.submit("a", "t", lambda job: release.wait(2.0), command_id="running")
+    executor.events.wait("running", "started")
+    executor.submit("a", "t", lambda job: None)
+    executor.submit("a", "t", lambda job: None)
+    with pytest.raises(queue.Full):
+        executor.submit("a", "t", lambda job: None)
+    release.set()
+
+
+def test_active_id_cannot_be_reused(executor):
+    release = threading.Event()
+    executor.submit("a", "t", lambda job: release.wait(2.0), command_id="x")
+    with pytest.raises(ValueError, match="already in use"):
+        executor.submit("b", "t", lambda job: None, command_id="x")
+    release.set()
+    executor.events.wait("x", "completed")
+    # Once finished, the id is free again
+    executor.submit("b", "t", lambda job: None, command_id="x")
+    deadline = time.monotonic() + 2.0
+    while executor.events.of("x").count("completed") < 2 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert executor.events.of("x").count("completed") == 2
+
+
+def test_cancel_lane_and_wait_idle(executor):
+    executor.submit("a", "t", lambda job: job.sleep(10), command_id="running")
+    executor.submit("a", "t", lambda job: None, command_id="queued")
+    executor.submit("b", "t", lambda job: job.sleep(0.2), command_id="other")
+    executor.events.wait("running", "started")
+    assert not executor.wait_idle("a", timeout=0.01)
+    assert sorted(executor.cancel_lane("a")) == ["queued", "running"]
+    assert executor.wait_idle("a", timeout=2.0)
+    assert executor.events.of("queued")[-1] == "cancelled"
+    assert "cancelled" not in executor.events.of("other")
@@ -0,0 +1,125 @@
+"""Event timeline: segments, reads across them, time joins and trigger correlation."""
+import numpy as np
+import pytest
+
+from EventBus import CHUNK_SIZE, EVENT_KINDS, EventBus, asof, window_join
+
+SECOND = 1_000_000_000
+
+
+@pytest.fixture
+def bus(tmp_path):
+    bus = EventBus(str(tmp_path / "events"), segment_interval=3600.0)
+    yield bus
+    bus.close()
+
+
+def test_read_joins_segments_and_pending(bus):
+    bus.record("trigger", perf_ns=1000, value=1.0)
+    bus.flush()
+    bus.record("trigger", perf_ns=2000, value=2.0)
+    bus.flush()
+    bus.record("trigger", perf_ns=3000, value=3.0)
+    assert len(bus.segments()) == 2
+    events = bus.read()
+    assert events["value"].tolist() == [1.0, 2.0, 3.0]
+    assert events["t_ns"].tolist() == bus.from_perf_ns([1000, 2000, 3000]).tolist()
+
+
+def test_read_time_range_and_kinds(bus):
+    t0 = bus.from_perf_ns(0)
+    for n in range(10):
+        bus.record("temperature", perf_ns=n * 100, value=300.0 + n)
+        bus.record("channel", perf_ns=n * 100 + 50, channel=n % 8)
+    bus.flush()
+    events = bus.read(t0 + 200, t0 + 500, kinds=["temperature"])
+    assert events["value"].tolist() == [302.0, 303.0, 304.0]
+    assert np.all(events["kind"] == EVENT_KINDS["temperature"])
+
+
+def test_record_fills_several_chunks(bus):
+    n = CHUNK_SIZE * 2 + 10
+    for i in range(n):
+        bus.record("wiper", perf_ns=i, code=i % 256)
+    events = bus.read()
+    assert len(events) == n == bus.recorded
+    assert events["code"].tolist() == [i % 256 for i in range(n)]
+
+
+def test_record_many_between_single_records(bus):
+    bus.record("wiper", perf_ns=10, code=1)
+    bus.record("wiper", perf_ns=40, code=4)
+    bus.record_many("wiper", perf_ns=[20, 30], code=[2, 3])
+    bus.record("wiper", perf_ns=50, code=5)
+    # The chunk record() was filling is trimmed, not padded with its unused rows
+    assert len(bus.read()) == 5
+    assert bus.read()["code"].tolist() == [1, 2, 3, 4, 5]
+    bus.flush()
+    assert bus.read()["code"].tolist() == [1, 2, 3, 4, 5]
+
+
+def test_segment_names_cover_their_events(bus):
+    bus.record_many("trigger", perf_ns=[100, 900], value=[1.0, 2.0])
+    bus.flush()
+    (path, first, last), = bus.segments()
+    assert (first, last) == tuple(bus.from_perf_ns([100, 900]).tolist())
+
+
+def test_unfinished_segment_is_ignored(bus, tmp_path):
+    bus.record("trigger", perf_ns=100, value=1.0)
+    bus.flush()
+    (path, _, _), = bus.segments()
+    with open(path + ".tmp", "wb") as f:
+        f.write(b"PK\x03\x04 torn")
+    assert len(bus.segments()) == 1
+    assert bus.read()["value"].tolist() == [1.0]
+
+
+def test_reopened_bus_reads_old_segments(tmp_path):
+    bus = EventBus(str(tmp_path / "events"), segment_interval=3600.0)
+    bus.record("trigger", value=7.0)
+    bus.close()
+    reopened = EventBus(str(tmp_path / "events"), segment_interval=3600.0)
+    assert reopened.read(kinds=["trigger"])["value"].tolist() == [7.0]
+    reopened.close()
+
+
+def test_asof():
+    right = np.array([10, 20, 30])
+    assert asof(np.array([5, 10, 25, 99]), right).tolist() == [-1, 0, 1, 2]
+
+
+def test_window_join():
+    left = np.array([100, 200])
+    right = np.array([90, 100, 150, 205, 400])
+    pairs = window_join(left, right, -10, 10)
+    assert list(zip(*(p.tolist() for p in pairs))) == [(0, 0), (0, 1), (1, 3)]
+
+
+def test_window_join_without_matches():
+    left, right = window_join(np.array([1, 2]), np.array([100]), -1, 1)
+    assert len(left) == len(right) == 0
+
+
+def test_correlate_triggers(bus):
+    bus.record("channel", perf_ns=0, channel=3)
+    bus.record("wiper", perf_ns=0, code=128)
+    bus.record_many("temperature", perf_ns=[int(0.5 * SECOND), int(0.9 * SECOND)], value=[300.0, 302.0])
+    bus.record("trigger", perf_ns=SECOND, value=1.0)
+    bus.record("temperature", perf_ns=int(1.5 * SECOND), value=310.0)
+    bus.flush()
+    bus.record("channel", perf_ns=2 * SECOND, channel=5)
+    bus.record("trigger", perf_ns=5 * SECOND, value=2.0)
+    rows = bus.correlate_triggers(window_s=1.0)
+    assert rows["burst"].tolist() == [1.0, 2.0]
+    assert rows["channel"].tolist() == [3, 5]
+    assert rows["code"].tolist() == [128, 128]
+    assert rows["temperature_before_k"][0] == pytest.approx(301.0)
+    assert rows["temperature_after_k"][0] == pytest.approx(310.0)
+    assert np.isnan(rows["temperature_before_k"][1]) and np.isnan(rows["temperature_after_k"][1])
+
+
+def test_trigger_before_any_channel(bus):
+    bus.record("trigger", perf_ns=100, value=1.0)
+    rows = bus.correlate_triggers()
+    assert (rows["channel"][0], rows["code"][0]) == (-1, -1)
@@ -0,0 +1,48 @@
+"""Background NDJSON journal (trigger log) and the trigger_log.json migration."""
+import json
+import threading
+
+from EventJournal import EventJournal, migrate_json, read_events
+
+
+def test_flush_writes_everything_recorded(tmp_path):
+    path = str(tmp_path / "journal.ndjson")
+    journal = EventJournal(path, flush_interval=10.0)
+    for n in range(100):
+        journal.record({"n": n})
+    assert journal.flush()
+    assert [e["n"] for e in read_events(path)] == list(range(100))
+    journal.close()
+
+
+def test_iso_timestamp_added_by_writer(tmp_path):
+    path = str(tmp_path / "journal.ndjson")
+    journal = EventJournal(path)
+    journal.record({"timestamp_unix": 0.0})
+    journal.close()
+    assert "timestamp" in read_events(path)[0]
+
+
+def test_close_stops_the_writer(tmp_path):
+    path = str(tmp_path / "journal.ndjson")
+    journal = EventJournal(path)
+    journal.record({"n": 1})
+    journal.close()
+    assert not journal._writer.is_alive()
+    assert read_events(path) == [{"n": 1}]
+    assert "journal-journal.ndjson" not in [t.name for t in threading.enumerate()]
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    path = tmp_path / "journal.ndjson"
+    path.write_text('{"n": 1}\n{"n": 2}\n{"n": ')
+    assert read_events(str(path)) == [{"n": 1}, {"n": 2}]
+
+
+def test_migrate_json_goes_in_front(tmp_path):
+    legacy = tmp_path / "trigger_log.json"
+    legacy.write_text(json.dumps({"triggers": [{"burst_number": 1}, {"burst_number": 2}]}))
+    path = tmp_path / "trigger_log.ndjson"
+    path.write_text('{"burst_number": 3}\n')
+    assert migrate_json(str(legacy), str(path), key="triggers") == 2
+    assert [e["burst_number"] for e in read_events(str(path))] == [1, 2, 3]
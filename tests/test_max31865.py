@@ -0,0 +1,119 @@
+"""RTD math and the register-level MAX31865 driver on a simulated chip."""
+import numpy as np
+import pytest
+
+from GPIOController import MAX31865_FAULTS, MAX31865Controller, MAX31865Fault, RTD_A, RTD_B, rtd_temperature_c
+from SimulatedHardware import SimulatedMAX31865, SimulatedRTDSensor, SimulatedSpiBus
+
+
+def cvd_resistance(t, rtd_nominal=1000.0):
+    """Callendar-Van Dusen forward: temperature (°C) -> resistance (Ω)."""
+    t = np.asarray(t, dtype=np.float64)
+    r = rtd_nominal * (1 + RTD_A * t + RTD_B * t * t)
+    return np.where(t < 0, r - rtd_nominal * 4.183e-12 * (t - 100) * t ** 3, r)
+
+
+@pytest.mark.parametrize("rtd_nominal", [100.0, 1000.0])
+def test_inverse_above_zero_is_exact(rtd_nominal):
+    t = np.linspace(0.0, 500.0, 51)
+    assert rtd_temperature_c(cvd_resistance(t, rtd_nominal), rtd_nominal) == pytest.approx(t, abs=1e-9)
+
+
+def test_polynomial_below_zero():
+    t = np.linspace(-200.0, -1.0, 200)
+    assert rtd_temperature_c(cvd_resistance(t)) == pytest.approx(t, abs=0.05)
+
+
+def test_reference_points():
+    assert rtd_temperature_c(1000.0) == pytest.approx(0.0)
+    assert rtd_temperature_c(100.0, rtd_nominal=100.0) == pytest.approx(0.0)
+    assert rtd_temperature_c(1385.055) == pytest.approx(100.0, abs=1e-3)
+
+
+def test_scalar_and_beyond_the_curve():
+    assert np.ndim(rtd_temperature_c(1100.0)) == 0
+    assert np.isnan(rtd_temperature_c(1e9))
+
+
+def sensor_at(temperature_c):
+    return SimulatedRTDSensor(base_temperature_c=temperature_c, drift_c=0.0, noise_c=0.0)
+
+
+@pytest.fixture
+def chip():
+    return SimulatedMAX31865(sensor_at(25.0))
+
+
+@pytest.fixture
+def controller(chip):
+    bus = SimulatedSpiBus(devices={(0, 1): chip}, model_latency=False)
+    controller = MAX31865Controller(driver="registers", spi=bus.SpiDev(), fault_check_interval=3600.0)
+    yield controller
+    controller.cleanup()
+
+
+def test_auto_conversion_configured(controller, chip):
+    # Bias and auto-conversion on, 3-wire, 60 Hz filter; the fault-clear bit reads back as 0
+    assert chip.registers[0] == 0x80 | 0x40 | 0x10
+
+
+@pytest.mark.parametrize("temperature_c", [25.0, 150.0, -100.0])
+def test_reads_through_the_lut(chip, controller, temperature_c):
+    chip.sensor = sensor_at(temperature_c)
+    chip._converted_at = None
+    assert controller.read_temperature_c() == pytest.approx(temperature_c, abs=0.05)
+    assert controller.read_temperature_k() == pytest.approx(temperature_c + 273.15, abs=0.05)
+    assert controller.read_resistance() == pytest.approx(float(cvd_resistance(temperature_c)), abs=0.14)
+
+
+def test_reads_are_one_transfer(chip, controller):
+    reads = chip.reads
+    controller.read_temperature_c()
+    assert chip.reads == reads + 1
+
+
+def test_flagged_reading_raises_and_clears(chip, controller):
+    chip.inject_fault(0x80 | 0x04)
+    with pytest.raises(MAX31865Fault) as raised:
+        controller.read_temperature_c()
+    assert raised.value.status == 0x84
+    assert raised.value.faults == [MAX31865_FAULTS[0x80], MAX31865_FAULTS[0x04]]
+    assert chip.registers[7] == 0
+    # Auto-conversion keeps running, so the next reading is good
+    assert chip.registers[0] & 0xC0 == 0xC0
+    assert controller.read_temperature_c() == pytest.approx(25.0, abs=0.05)
+
+
+def test_periodic_fault_check(chip, controller):
+    controller.fault_check_interval = 0.0
+    chip.registers[7] = 0x20  # raised without the flag in the RTD LSB
+    with pytest.raises(MAX31865Fault):
+        controller.read_temperature_c()
+    assert controller.faults == [MAX31865_FAULTS[0x20]]
+
+
+def test_check_faults_reports_and_clears(chip, controller):
+    assert controller.check_faults() == []
+    chip.inject_fault(0x08)
+    assert controller.check_faults() == [MAX31865_FAULTS[0x08]]
+    assert chip.registers[7] == 0
+
+
+def test_cleanup_stops_conversions(chip):
+    bus = SimulatedSpiBus(devices={(0, 1): chip}, model_latency=False)
+    controller = MAX31865Controller(driver="registers", spi=bus.SpiDev())
+    controller.cleanup()
+    assert chip.registers[0] == 0
+
+
+def test_adafruit_driver_with_simulated_sensor():
+    controller = MAX31865Controller(sensor=sensor_at(-242.0))
+    assert controller.read_temperature_c() == pytest.approx(-242.0)
+    controller.sensor.fault = (True, False, False, False, False, False)
+    assert controller.check_faults() == [MAX31865_FAULTS[0x80]]
+    assert controller.sensor.fault == (False,) * 6
+
+
+def test_unknown_driver():
+    with pytest.raises(ValueError):
+        MAX31865Controller(driver="bitbang", sensor=sensor_at(0.0))
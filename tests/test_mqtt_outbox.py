@@ -0,0 +1,161 @@
+"""MQTT outbox: coalescing, batching, the token bucket and the queue limit."""
+import json
+import threading
+import time
+
+import pytest
+
+from MQTTOutbox import MQTTOutbox, TopicPolicy
+
+
+class Recorder:
+    """publish_fn that records messages and can be held to keep the sender busy."""
+
+    def __init__(self):
+        self.messages = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.busy = threading.Event()
+
+    def __call__(self, topic, payload, qos, retain):
+        self.busy.set()
+        self.gate.wait(5.0)
+        self.messages.append((topic, payload, qos, retain))
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+def hold_sender(outbox, recorder):
+    """Put one message in flight and keep it there until recorder.gate is set."""
+    recorder.gate.clear()
+    outbox.put("hold", "x")
+    assert recorder.busy.wait(5.0)
+
+
+def test_publishes_in_order_with_policy_qos(recorder):
+    outbox = MQTTOutbox(recorder, policies={"status": TopicPolicy(qos=0, retain=True)})
+    outbox.put("status", {"state": "idle"})
+    outbox.put("log", "text")
+    assert outbox.flush()
+    assert recorder.messages == [("status", '{"state": "idle"}', 0, True), ("log", "text", 1, False)]
+    outbox.close()
+
+
+def test_latest_value_wins_while_queued(recorder):
+    policy = TopicPolicy(coalesce_key=lambda payload: payload["job"])
+    outbox = MQTTOutbox(recorder, policies={"progress": policy})
+    hold_sender(outbox, recorder)
+    for step in range(10):
+        outbox.put("progress", {"job": "a", "step": step})
+        outbox.put("progress", {"job": "b", "step": step})
+    recorder.gate.set()
+    assert outbox.flush()
+    progress = [json.loads(payload) for topic, payload, _, _ in recorder.messages if topic == "progress"]
+    assert progress == [{"job": "a", "step": 9}, {"job": "b", "step": 9}]
+    assert outbox.stats()["coalesced"] == 18
+    outbox.close()
+
+
+def test_coalesced_key_is_released_once_sent(recorder):
+    outbox = MQTTOutbox(recorder, policies={"progress": TopicPolicy(coalesce_key=lambda payload: "job")})
+    outbox.put("progress", 1)
+    assert outbox.flush()
+    outbox.put("progress", 2)
+    assert outbox.flush()
+    assert [payload for _, payload, _, _ in recorder.messages] == ["1", "2"]
+    outbox.close()
+
+
+def test_batch_is_one_json_array(recorder):
+    outbox = MQTTOutbox(recorder, policies={"telemetry": TopicPolicy(batch_interval=10.0)})
+    for n in range(5):
+        outbox.put("telemetry", {"n": n})
+    assert outbox.depth() == 5
+    assert outbox.flush()
+    assert len(recorder.messages) == 1
+    assert [item["n"] for item in json.loads(recorder.messages[0][1])] == list(range(5))
+    outbox.close()
+
+
+def test_batch_sent_after_interval(recorder):
+    outbox = MQTTOutbox(recorder, policies={"telemetry": TopicPolicy(batch_interval=0.05)})
+    outbox.put("telemetry", 1)
+    outbox.put("telemetry", 2)
+    deadline = time.monotonic() + 5.0
+    while not recorder.messages and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert recorder.messages[0][1] == "[1,2]"
+    outbox.close()
+
+
+def test_full_batch_is_sealed(recorder):
+    outbox = MQTTOutbox(recorder, policies={"telemetry": TopicPolicy(batch_interval=10.0, max_batch=3)})
+    hold_sender(outbox, recorder)
+    for n in range(7):
+        outbox.put("telemetry", n)
+    recorder.gate.set()
+    assert outbox.flush()
+    batches = [payload for topic, payload, _, _ in recorder.messages if topic == "telemetry"]
+    assert batches == ["[0,1,2]", "[3,4,5]", "[6]"]
+    outbox.close()
+
+
+def test_token_bucket_caps_the_rate(recorder):
+    outbox = MQTTOutbox(recorder, max_rate=100.0, burst=5)
+    start = time.perf_counter()
+    for n in range(25):
+        outbox.put("log", n)
+    assert outbox.flush()
+    elapsed = time.perf_counter() - start
+    assert len(recorder.messages) == 25
+    # 5 go out in the burst, the other 20 at 100/s
+    assert elapsed >= 0.18
+    outbox.close()
+
+
+def test_full_queue_drops(recorder):
+    outbox = MQTTOutbox(recorder, max_queue=3)
+    hold_sender(outbox, recorder)
+    accepted = [outbox.put("log", n) for n in range(5)]
+    assert accepted == [True, True, True, False, False]
+    assert outbox.stats()["dropped"] == 2
+    recorder.gate.set()
+    outbox.close()
+
+
+def test_failed_publish_is_counted():
+    def publish(topic, payload, qos, retain):
+        raise ConnectionError("broker gone")
+
+    outbox = MQTTOutbox(publish)
+    outbox.put("log", "x")
+    assert outbox.flush()
+    assert outbox.stats()["failed"] == 1
+    outbox.close()
+
+
+def test_custom_encoder_gets_the_batch_as_a_list(recorder):
+    seen = []
+
+    def encode(topic, payload):
+        seen.append(payload)
+        return b"encoded"
+
+    outbox = MQTTOutbox(recorder, policies={"telemetry": TopicPolicy(batch_interval=10.0)}, encode=encode)
+    outbox.put("telemetry", 1)
+    outbox.put("telemetry", 2)
+    assert outbox.flush()
+    assert seen == [[1, 2]]
+    assert recorder.messages[0][1] == b"encoded"
+    outbox.close()
+
+
+def test_close_stops_the_sender(recorder):
+    outbox = MQTTOutbox(recorder)
+    outbox.put("log", "x")
+    outbox.close()
+    assert not outbox._sender.is_alive()
+    assert len(recorder.messages) == 1
@@ -0,0 +1,63 @@
+"""Multiplexer channel switching from the precomputed pin-state table."""
+import pytest
+
+from GPIOController import CHANNEL_STATES, Multiplexer
+from SimulatedHardware import SimulatedGPIO
+
+PINS = [17, 18, 22, 27]  # enable, A0, A1, A2
+
+
+@pytest.fixture
+def mux():
+    return Multiplexer(pins=PINS, gpio=SimulatedGPIO())
+
+
+def lit_channels(gpio, transitions):
+    """Every channel the output showed while replaying transitions' pin writes one by one."""
+    levels = {pin: gpio.pins[pin] for pin in PINS}
+    lit = []
+    for pins, values in transitions:
+        for pin, value in zip(pins, values):
+            levels[pin] = value
+            if levels[PINS[0]]:
+                lit.append(1 + sum(levels[PINS[i]] << (i - 1) for i in range(1, 4)))
+    return lit
+
+
+@pytest.mark.parametrize("channel", range(1, 9))
+def test_switch_sets_address_and_enable(mux, channel):
+    mux.switch(channel)
+    gpio = mux.gpio
+    assert gpio.pins[PINS[0]] == 1
+    assert sum(gpio.pins[PINS[i]] << (i - 1) for i in range(1, 4)) == channel - 1
+    assert mux.active_channel() == channel
+
+
+def test_off_keeps_address(mux):
+    mux.switch(6)
+    mux.off()
+    assert mux.active_channel() is None
+    assert mux.state == CHANNEL_STATES[6] & ~1
+
+
+def test_same_channel_writes_nothing(mux):
+    mux.switch(3)
+    before = len(mux.gpio.history)
+    mux.switch(3)
+    assert len(mux.gpio.history) == before
+
+
+@pytest.mark.parametrize("start", range(1, 9))
+@pytest.mark.parametrize("target", range(1, 9))
+def test_no_unintended_channel_lights(mux, start, target):
+    mux.switch(start)
+    transition = mux._transitions[(mux.state, CHANNEL_STATES[target])]
+    lit = lit_channels(mux.gpio, [transition])
+    # Break before make: only the start channel (before the change) or the target may light
+    assert set(lit) <= {start, target}
+    assert not lit or lit[-1] == target
+
+
+def test_invalid_channel(mux):
+    with pytest.raises(ValueError):
+        mux.switch(9)
@@ -0,0 +1,130 @@
+"""Disk-backed offline queue and its replay by MQTTHandler after a reconnect."""
+import threading
+import time
+
+import pytest
+
+from LoopbackMQTT import LoopbackBroker
+from MQTTHandler import MQTTHandler
+from OfflineQueue import OfflineQueue
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class Subscriber:
+    """A second client on the broker, recording what arrives on one topic."""
+
+    def __init__(self, broker, topic):
+        self.payloads = []
+        self.lock = threading.Lock()
+        self.client = broker.client(client_id="subscriber")
+        self.client.on_message = self._on_message
+        self.client.connect()
+        self.client.subscribe(topic)
+        self.client.loop_start()
+
+    def _on_message(self, client, userdata, message):
+        with self.lock:
+            self.payloads.append(message.payload.decode("utf-8"))
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+@pytest.fixture
+def broker():
+    return LoopbackBroker()
+
+
+def test_fifo_and_delete_through():
+    queue = OfflineQueue()
+    for n in range(5):
+        queue.put("t", f"m{n}", qos=1)
+    rows = queue.peek(3)
+    assert [row[2] for row in rows] == [b"m0", b"m1", b"m2"]
+    queue.delete_through(rows[-1][0])
+    assert len(queue) == 2
+    assert [row[2] for row in queue.peek()] == [b"m3", b"m4"]
+    queue.close()
+
+
+def test_full_queue_drops_the_oldest():
+    queue = OfflineQueue(max_messages=3)
+    for n in range(5):
+        queue.put("t", str(n))
+    assert len(queue) == 3
+    assert queue.dropped == 2
+    assert [row[2] for row in queue.peek()] == [b"2", b"3", b"4"]
+    queue.close()
+
+
+def test_survives_a_restart(tmp_path):
+    path = str(tmp_path / "offline.sqlite")
+    queue = OfflineQueue(path)
+    queue.put("a", "1", qos=1, retain=True)
+    queue.put("b", b"\x00\x01", qos=0)
+    queue.close()
+    queue = OfflineQueue(path)
+    assert len(queue) == 2
+    assert [row[1:5] for row in queue.peek()] == [("a", b"1", 1, 1), ("b", b"\x00\x01", 0, 0)]
+    queue.close()
+
+
+def test_replayed_in_order_after_connect(broker):
+    subscriber = Subscriber(broker, "data")
+    handler = MQTTHandler("replay", client_factory=broker.client)
+    for n in range(250):
+        handler.publish("data", str(n))
+    assert handler.outbox.flush()
+    assert len(handler.offline_queue) == 250
+    handler.connect()
+    assert wait_until(lambda: len(subscriber.payloads) == 250)
+    # Published after the connect: must not overtake the replay
+    handler.publish("data", "after")
+    assert wait_until(lambda: len(subscriber.payloads) == 251)
+    assert subscriber.payloads == [str(n) for n in range(250)] + ["after"]
+    assert wait_until(lambda: handler.last_replay is not None)
+    assert handler.last_replay["messages"] == 250
+    assert handler.connection_stats()["offline_queued"] == 0
+    handler.disconnect()
+    assert not handler.outbox._sender.is_alive()
+    subscriber.close()
+
+
+def test_expired_messages_are_not_replayed(broker):
+    subscriber = Subscriber(broker, "data")
+    handler = MQTTHandler("expire", client_factory=broker.client, max_offline_age=0.05)
+    handler.publish("data", "old")
+    assert handler.outbox.flush()
+    time.sleep(0.1)
+    handler.connect()
+    assert wait_until(lambda: handler.last_replay is not None)
+    assert (handler.last_replay["messages"], handler.last_replay["expired"]) == (0, 1)
+    assert subscriber.payloads == []
+    handler.disconnect()
+    subscriber.close()
+
+
+def test_queued_while_disconnected(broker):
+    subscriber = Subscriber(broker, "data")
+    handler = MQTTHandler("drop", client_factory=broker.client)
+    handler.connect()
+    assert wait_until(lambda: handler.connected)
+    handler.client.disconnect()
+    assert wait_until(lambda: not handler.connected)
+    handler.publish("data", "while offline")
+    assert handler.outbox.flush()
+    assert len(handler.offline_queue) == 1
+    handler.client.connect()
+    assert wait_until(lambda: subscriber.payloads == ["while offline"])
+    assert handler.connection_stats()["reconnects"] == 1
+    handler.disconnect()
+    subscriber.close()
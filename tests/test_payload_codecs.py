@@ -0,0 +1,68 @@
+"""MQTT payload codecs: round-trips, the marker byte and the JSON fallback."""
+import json
+
+import pytest
+
+import PayloadCodecs
+from PayloadCodecs import CODECS, MARKER, StructCodec, decode, encode, get_codec, register_codec
+
+MESSAGE = {"command": "set_voltage", "args": [1.25, 3], "id": "abc", "ok": True, "none": None}
+
+
+def optional(name, module):
+    return pytest.param(name, marks=pytest.mark.skipif(module is None, reason=f"{name} is not installed"))
+
+
+@pytest.mark.parametrize("name", ["json", optional("msgpack", PayloadCodecs.msgpack),
+                                  optional("cbor", PayloadCodecs.cbor2)])
+def test_round_trip(name):
+    data = encode(MESSAGE, name)
+    assert data[0] == MARKER
+    assert decode(data) == MESSAGE
+
+
+def test_no_codec_is_plain_json_text():
+    data = encode(MESSAGE)
+    assert isinstance(data, str)
+    assert json.loads(data) == MESSAGE
+    assert decode(data) == MESSAGE
+    assert decode(data.encode("utf-8")) == MESSAGE
+
+
+def test_non_json_text_comes_back_as_str():
+    assert decode(b"hello") == "hello"
+
+
+def test_struct_single_record_and_list():
+    codec = get_codec("temperature")
+    record = {field: float(n) + 0.5 for n, field in enumerate(codec.fields)}
+    assert decode(encode(record, codec)) == record
+    assert decode(encode([record, record], "temperature")) == [record, record]
+
+
+def test_struct_is_fixed_size():
+    data = encode([{"timestamp": 1.0, "temperature_k": 300.0}] * 10, "temperature")
+    assert len(data) == 2 + 1 + 10 * 16
+
+
+def test_unknown_codec_id():
+    with pytest.raises(ValueError):
+        decode(bytes([MARKER, 0xFF]) + b"{}")
+
+
+def test_unknown_codec_name():
+    with pytest.raises(ValueError):
+        get_codec("protobuf")
+
+
+@pytest.mark.parametrize("name, module", [("msgpack", PayloadCodecs.msgpack), ("cbor", PayloadCodecs.cbor2)])
+def test_missing_package_falls_back_to_json(name, module):
+    if module is not None:
+        pytest.skip(f"{name} is installed")
+    assert get_codec(name).name == "json"
+
+
+def test_codec_id_cannot_be_reused():
+    with pytest.raises(ValueError):
+        register_codec(StructCodec("other", 0x10, ("a",)))
+    assert CODECS[0x10].name == "temperature"
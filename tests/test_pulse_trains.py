@@ -0,0 +1,72 @@
+"""Compiled, hardware-timed pulse-train sweeps (Agilent33250A.compile_pulse_trains)."""
+import numpy as np
+import pytest
+
+from Agilent_Controller_RS232 import Agilent33250A, ARB_MAX_POINTS, DAC_MAX
+
+HIGH, LOW = DAC_MAX, -DAC_MAX
+
+
+def test_edges_on_sample_boundaries():
+    compiled = Agilent33250A.compile_pulse_trains((3, 2), pulse_frequency=1000, duty_cycle=50, gap=1e-3)
+    # 50 % duty: two samples per pulse period, the gap is two more
+    assert compiled.sample_period == pytest.approx(5e-4)
+    expected = [LOW, HIGH, LOW, HIGH, LOW, HIGH, LOW, LOW, LOW, HIGH, LOW, HIGH, LOW]
+    assert compiled.samples.tolist() == expected
+    assert compiled.train_starts == pytest.approx([5e-4, 4.5e-3])
+    assert compiled.arb_frequency == pytest.approx(1 / (len(expected) * 5e-4))
+    assert compiled.counts == (3, 2)
+
+
+def test_duty_cycle_sets_samples_per_pulse():
+    compiled = Agilent33250A.compile_pulse_trains((2,), pulse_frequency=10000, duty_cycle=20, gap=0.0)
+    # 1/5: one high sample in five
+    assert compiled.samples.tolist() == [LOW] + [HIGH, LOW, LOW, LOW, LOW] * 2
+    assert compiled.sample_period == pytest.approx(1 / 50000)
+
+
+def test_first_point_is_low():
+    compiled = Agilent33250A.compile_pulse_trains(range(5, 0, -1), pulse_frequency=5e6, duty_cycle=50, gap=1e-6)
+    assert compiled.samples[0] == LOW
+    assert int(np.sum(np.diff(compiled.samples.astype(int)) > 0)) == sum(range(1, 6))
+
+
+def test_largest_sequence_that_fits():
+    # 1 leading point + 2 samples per pulse
+    pulses = (ARB_MAX_POINTS - 1) // 2
+    compiled = Agilent33250A.compile_pulse_trains((pulses,), pulse_frequency=1e6, duty_cycle=50, gap=0.0)
+    assert len(compiled.samples) <= ARB_MAX_POINTS
+    with pytest.raises(ValueError, match="memory holds"):
+        Agilent33250A.compile_pulse_trains((pulses + 1,), pulse_frequency=1e6, duty_cycle=50, gap=0.0)
+
+
+def test_too_long_gap_names_the_gap_that_fits():
+    with pytest.raises(ValueError, match=r"gaps of at most 0\.000343 s would fit"):
+        Agilent33250A.compile_pulse_trains(range(20, 0, -1), pulse_frequency=5e6, duty_cycle=50, gap=0.1)
+    compiled = Agilent33250A.compile_pulse_trains(range(20, 0, -1), pulse_frequency=5e6, duty_cycle=50, gap=3.4e-4)
+    assert len(compiled.samples) <= ARB_MAX_POINTS
+
+
+def test_sample_rate_limit():
+    with pytest.raises(ValueError, match="Sa/s"):
+        Agilent33250A.compile_pulse_trains((1,), pulse_frequency=150e6, duty_cycle=50, gap=0.0)
+
+
+def test_arb_frequency_limit():
+    with pytest.raises(ValueError, match="too short"):
+        Agilent33250A.compile_pulse_trains((1,), pulse_frequency=50e6, duty_cycle=50, gap=0.0)
+
+
+@pytest.mark.parametrize("counts, duty_cycle", [((), 50), ((3, 0), 50), ((3,), 0), ((3,), 100)])
+def test_invalid_arguments(counts, duty_cycle):
+    with pytest.raises(ValueError):
+        Agilent33250A.compile_pulse_trains(counts, pulse_frequency=1000, duty_cycle=duty_cycle, gap=0.0)
+
+
+def test_play_uploads_and_triggers_once(agilent):
+    compiled = Agilent33250A.compile_pulse_trains((3, 2), pulse_frequency=1000, duty_cycle=50, gap=1e-3)
+    agilent.play_compiled_pulse_trains(compiled)
+    assert agilent.inst.waveforms["VOLATILE"] == compiled.samples.tolist()
+    assert agilent.inst.state["FUNCTION"] == "USER"
+    assert agilent.inst.state["BURST:NCYCLES"] == "1"
+    assert len(agilent.inst.triggers) == 1
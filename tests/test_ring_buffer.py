@@ -0,0 +1,106 @@
+"""Ring buffer for the live chart, bucket statistics and LTTB decimation."""
+import numpy as np
+import pytest
+
+from RingBuffer import RingBuffer, bucket_stats, lttb
+
+
+def filled(capacity, n):
+    ring = RingBuffer(capacity)
+    for t in range(n):
+        ring.append(float(t), float(t) * 10)
+    return ring
+
+
+def test_keeps_the_newest_records():
+    ring = filled(5, 12)
+    assert len(ring) == 5
+    assert ring.window()["timestamp"].tolist() == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert ring.last()["value"] == 110.0
+
+
+def test_empty():
+    ring = RingBuffer(4)
+    assert ring.last() is None
+    assert len(ring.window()) == 0
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (None, None, [7, 8, 9, 10, 11]),
+    (8.5, None, [9, 10, 11]),
+    (None, 10, [7, 8, 9]),
+    (9, 11, [9, 10]),
+    (20, None, []),
+])
+def test_window_across_the_wrap(start, end, expected):
+    ring = filled(5, 12)
+    assert ring.window(start, end)["timestamp"].tolist() == expected
+
+
+def test_window_is_a_copy():
+    ring = filled(3, 3)
+    window = ring.window()
+    ring.append(3.0, 30.0)
+    assert window["timestamp"].tolist() == [0.0, 1.0, 2.0]
+
+
+@pytest.mark.parametrize("before, batch", [(0, 3), (2, 3), (4, 3), (1, 12)])
+def test_extend_matches_append(before, batch):
+    records = [(float(t), float(t) * 10) for t in range(before + batch)]
+    appended = RingBuffer(5)
+    for record in records:
+        appended.append(*record)
+    extended = RingBuffer(5)
+    for record in records[:before]:
+        extended.append(*record)
+    extended.extend(records[before:])
+    assert np.array_equal(extended.window(), appended.window())
+    assert len(extended) == len(appended)
+
+
+def test_several_fields():
+    ring = RingBuffer(3, fields=("temperature_k", "resistance"))
+    ring.append(1.0, 300.0, 110.0)
+    record = ring.last()
+    assert (record["temperature_k"], record["resistance"]) == (300.0, 110.0)
+
+
+def test_bucket_stats():
+    timestamps = np.array([0.1, 0.4, 0.9, 1.2, 3.5, 3.6])
+    values = np.array([1.0, 3.0, 2.0, 5.0, 4.0, 6.0])
+    buckets = bucket_stats(timestamps, values, 1.0)
+    assert buckets["timestamp"].tolist() == [0.0, 1.0, 3.0]
+    assert buckets["min"].tolist() == [1.0, 5.0, 4.0]
+    assert buckets["max"].tolist() == [3.0, 5.0, 6.0]
+    assert buckets["mean"].tolist() == pytest.approx([2.0, 5.0, 5.0])
+    assert buckets["count"].tolist() == [3, 1, 2]
+
+
+def test_buckets_stay_aligned_while_the_window_slides():
+    timestamps = np.arange(0.0, 10.0, 0.25)
+    values = np.sin(timestamps)
+    full = bucket_stats(timestamps, values, 2.0)
+    later = bucket_stats(timestamps[8:], values[8:], 2.0)
+    assert np.array_equal(later, full[1:])
+
+
+def test_bucket_stats_empty():
+    assert len(bucket_stats([], [], 1.0)) == 0
+
+
+def test_lttb_keeps_the_ends_and_the_peak():
+    t = np.arange(1000.0)
+    y = np.zeros(1000)
+    y[437] = 50.0
+    kept = lttb(t, y, 20)
+    assert len(kept) == 20
+    assert kept[0] == 0 and kept[-1] == 999
+    assert 437 in kept
+    assert np.all(np.diff(kept) > 0)
+
+
+@pytest.mark.parametrize("threshold", [2, 10, 50])
+def test_lttb_short_series_is_unchanged(threshold):
+    t = np.arange(10.0)
+    kept = lttb(t, t, threshold)
+    assert kept.tolist() == list(range(10))
@@ -0,0 +1,46 @@
+"""Batched SCPI writes: commands joined into ";"-separated lines, flushed before queries."""
+
+
+def written(agilent):
+    return [line for _, line in agilent.inst.lines]
+
+
+def test_batch_joins_into_one_line(agilent):
+    before = len(agilent.inst.lines)
+    with agilent.batch():
+        agilent.set_param("BURST:NCYCLES", 7)
+        agilent.set_param("TRIGGER:SOURCE", "BUS")
+        agilent.send("*TRG")
+    lines = written(agilent)[before:]
+    assert lines == ["BURST:NCYCLES 7;:TRIGGER:SOURCE BUS;*TRG"]
+    # Rooted headers must not resolve relative to BURST
+    assert agilent.inst.state["TRIGGER:SOURCE"] == "BUS"
+    assert agilent.inst.state["BURST:NCYCLES"] == "7"
+
+
+def test_batch_splits_long_lines(agilent):
+    agilent.max_batch_length = 40
+    before = len(agilent.inst.lines)
+    with agilent.batch():
+        for n in range(10):
+            agilent.send(f"BURST:NCYCLES {n}")
+    lines = written(agilent)[before:]
+    assert len(lines) > 1
+    assert all(len(line) <= 40 for line in lines)
+    assert agilent.inst.state["BURST:NCYCLES"] == "9"
+
+
+def test_query_flushes_pending_batch(agilent):
+    with agilent.batch():
+        agilent.set_param("FREQUENCY", 2000)
+        assert agilent.query("FREQUENCY?") == "2000"
+
+
+def test_nested_batches_write_once(agilent):
+    before = len(agilent.inst.lines)
+    with agilent.batch():
+        agilent.set_param("FREQUENCY", 3000)
+        with agilent.batch():
+            agilent.set_param("BURST:NCYCLES", 3)
+        assert len(agilent.inst.lines) == before
+    assert len(agilent.inst.lines) == before + 1
@@ -0,0 +1,54 @@
+"""Write-through SCPI state cache of Agilent33250A."""
+
+
+def written(agilent):
+    return [line for _, line in agilent.inst.lines]
+
+
+def test_unchanged_setting_is_skipped(agilent):
+    assert agilent.set_param("BURST:NCYCLES", 5)
+    assert not agilent.set_param("BURST:NCYCLES", 5)
+    assert agilent.cache_stats()["hits"] == 1
+    assert written(agilent).count("BURST:NCYCLES 5") == 1
+
+
+def test_force_resends(agilent):
+    agilent.set_param("BURST:NCYCLES", 5)
+    assert agilent.set_param("BURST:NCYCLES", 5, force=True)
+    assert written(agilent).count("BURST:NCYCLES 5") == 2
+
+
+def test_reset_invalidates_cache(agilent):
+    agilent.set_param("FREQUENCY", 1000)
+    agilent.reset()
+    assert agilent.cache_stats()["cached_settings"] == 0
+    assert agilent.set_param("FREQUENCY", 1000)
+
+
+def test_apply_invalidates_cache(agilent):
+    agilent.set_param("BURST:STATE", "ON")
+    agilent.send("APPLY:SIN 1000, 1.0, 0")
+    assert agilent.set_param("BURST:STATE", "ON")
+
+
+def test_coupled_setting_is_dropped(agilent):
+    agilent.set_param("FREQUENCY", 1000)
+    agilent.set_param("PULSE:DUTY", 10)
+    # The instrument may adjust frequency and duty cycle when the period changes
+    agilent.set_param("PULSE:PERIOD", 2e-3)
+    assert "FREQUENCY" not in agilent._state
+    assert "PULSE:DUTY" not in agilent._state
+    assert agilent._state["PULSE:PERIOD"] == "0.002"
+    assert agilent.set_param("PULSE:DUTY", 10)
+
+
+def test_output_alias_shares_cache_entry(agilent):
+    agilent.send("OUTPUT ON")
+    assert not agilent.set_param("OUTPUT:STATE", "ON")
+
+
+def test_disconnect_and_connect_invalidate_cache(agilent):
+    agilent.set_param("FREQUENCY", 1000)
+    agilent.disconnect()
+    agilent.connect()
+    assert agilent.set_param("FREQUENCY", 1000)
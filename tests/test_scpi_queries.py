@@ -0,0 +1,74 @@
+"""Sleep-free Agilent33250A queries: wait_opc(), the adaptive timeout and the error queue."""
+import pytest
+from pyvisa.errors import VisaIOError
+
+from Agilent_Controller_RS232 import ADAPTIVE_TIMEOUT_MIN_SAMPLES, MIN_QUERY_TIMEOUT_MS
+from SimulatedHardware import _raise_timeout
+
+
+def test_wait_opc(agilent):
+    assert agilent.wait_opc()
+    assert agilent.wait_for_completion()
+
+
+def test_wait_opc_timeout(agilent, monkeypatch):
+    monkeypatch.setattr(agilent.inst, "read", _raise_timeout)
+    assert agilent.wait_opc(timeout=0.1) is False
+    assert agilent.inst.timeout == 100
+
+
+def test_query_after_a_timed_out_wait_opc(agilent, monkeypatch):
+    agilent.set_param("FREQUENCY", 2000)
+    read = agilent.inst.read
+    monkeypatch.setattr(agilent.inst, "read", _raise_timeout)
+    # *OPC? has queued its "1"; only the read timed out
+    assert agilent.wait_opc(timeout=0.1) is False
+    monkeypatch.setattr(agilent.inst, "read", read)
+    assert agilent.query("FREQUENCY?") == "2000"
+
+
+def test_query_flushes_a_batch_first(agilent):
+    with agilent.batch():
+        agilent.set_param("FREQUENCY", 2000)
+        assert agilent.query("FREQUENCY?") == "2000"
+
+
+def test_adaptive_timeout_after_enough_replies(agilent):
+    for _ in range(ADAPTIVE_TIMEOUT_MIN_SAMPLES):
+        agilent.query("*STB?")
+    assert agilent._adaptive_timeout("*STB?") == MIN_QUERY_TIMEOUT_MS
+    assert agilent._adaptive_timeout("*OPC?") == agilent.timeout
+    assert agilent.get_status_byte() == 0
+    assert agilent.inst.timeout == MIN_QUERY_TIMEOUT_MS
+    assert agilent.query_stats()["*STB?"]["count"] == ADAPTIVE_TIMEOUT_MIN_SAMPLES + 1
+
+
+def test_slow_reply_gets_the_full_timeout(agilent, monkeypatch):
+    for _ in range(ADAPTIVE_TIMEOUT_MIN_SAMPLES):
+        agilent.query("*IDN?")
+    read = agilent.inst.read
+    calls = []
+
+    def late_read():
+        calls.append(agilent.inst.timeout)
+        if len(calls) == 1:
+            _raise_timeout()
+        return read()
+
+    monkeypatch.setattr(agilent.inst, "read", late_read)
+    assert agilent.query("*IDN?").startswith("Agilent")
+    assert calls == [MIN_QUERY_TIMEOUT_MS, agilent.timeout]
+
+
+def test_explicit_timeout_is_not_retried(agilent, monkeypatch):
+    monkeypatch.setattr(agilent.inst, "read", _raise_timeout)
+    with pytest.raises(VisaIOError):
+        agilent.query("*IDN?", timeout=50)
+
+
+def test_check_errors_drains_the_queue(agilent):
+    agilent.send("*BOGUS")
+    agilent.send("*BOGUS")
+    errors = agilent.check_errors()
+    assert len(errors) == 2 and errors[0].startswith("-113")
+    assert agilent.check_errors() == []
@@ -0,0 +1,161 @@
+"""Simulated hardware backends and their selection from the configuration."""
+import json
+import time
+
+import pytest
+
+from SimulatedHardware import (SimulatedGPIO, SimulatedMAX31865, SimulatedResourceManager, SimulatedSCPIInstrument,
+                               SimulatedSpiBus)
+
+
+def test_gpio_records_writes():
+    gpio = SimulatedGPIO()
+    gpio.setmode(gpio.BCM)
+    gpio.setup([17, 18], gpio.OUT, initial=gpio.HIGH)
+    changes = []
+    gpio.listeners.append(lambda t, changed: changes.append(changed))
+    gpio.output([17, 18], [0, 1])
+    assert (gpio.input(17), gpio.input(18)) == (0, 1)
+    assert [(pin, level) for _, pin, level in gpio.history] == [(17, 0), (18, 1)]
+    assert changes == [{17: 0, 18: 1}]
+
+
+def test_gpio_rejects_unset_pins_and_mismatched_values():
+    gpio = SimulatedGPIO()
+    with pytest.raises(RuntimeError):
+        gpio.output(5, 1)
+    gpio.setup([1, 2], gpio.OUT)
+    with pytest.raises(RuntimeError):
+        gpio.output([1, 2], [0, 1, 1])
+
+
+def test_spi_routes_by_chip_select():
+    bus = SimulatedSpiBus(model_latency=False)
+    spi = bus.SpiDev()
+    with pytest.raises(OSError):
+        spi.xfer2([0x00, 1])
+    spi.open(0, 0)
+    spi.xfer2([0x00, 42])
+    assert bus.devices[(0, 0)].code == 42 and bus.devices[(0, 1)].code != 42
+    with pytest.raises(FileNotFoundError):
+        bus.SpiDev().open(1, 0)
+
+
+def test_spi_wire_time_modelled():
+    bus = SimulatedSpiBus(model_latency=True)
+    spi = bus.SpiDev()
+    spi.open(0, 0)
+    spi.max_speed_hz = 100000
+    start = time.perf_counter()
+    spi.xfer2([0] * 250)
+    assert time.perf_counter() - start >= 0.02
+
+
+def test_scpi_parses_joined_and_relative_headers():
+    instrument = SimulatedSCPIInstrument(model_latency=False)
+    instrument.write("BURST:NCYCLES 5;STATE ON;:FREQUENCY 2000\n")
+    assert instrument.state["BURST:NCYCLES"] == "5"
+    assert instrument.state["BURST:STATE"] == "ON"
+    assert instrument.state["FREQUENCY"] == "2000"
+    assert instrument.query("FREQUENCY?") == "2000\n"
+
+
+def test_scpi_apply_and_errors():
+    instrument = SimulatedSCPIInstrument(model_latency=False)
+    instrument.write("BURST:STATE ON\nAPPLY:SQU 500, 2.0, 0.1\nFREQUENCY\n")
+    assert instrument.state["FUNCTION"] == "SQU"
+    assert instrument.state["BURST:STATE"] == "OFF"
+    assert instrument.query("SYST:ERR?").startswith("-109")
+    assert instrument.query("SYST:ERR?").startswith("+0")
+
+
+def test_scpi_records_triggers_and_split_dac_blocks():
+    instrument = SimulatedSCPIInstrument(model_latency=False)
+    fired = []
+    instrument.trigger_listeners.append(fired.append)
+    instrument.write("BURST:NCYCLES 3\n*TRG\n")
+    assert [cycles for _, cycles in instrument.triggers] == ["3"]
+    assert len(fired) == 1
+    block = b"DATA:DAC VOLATILE, #14" + (5).to_bytes(2, "big", signed=True) + (-5).to_bytes(2, "big", signed=True)
+    instrument.write_raw(block[:10])
+    instrument.write_raw(block[10:] + b"\r\n")
+    assert instrument.waveforms["VOLATILE"] == [5, -5]
+
+
+def test_resource_manager():
+    rm = SimulatedResourceManager(model_latency=False)
+    assert rm.instrument is None
+    with pytest.raises(OSError):
+        rm.open_resource("ASRL/dev/ttyUSB9::INSTR")
+    instrument = rm.open_resource("ASRL/dev/ttyUSB0::INSTR")
+    assert rm.instrument is instrument
+    instrument.close()
+    with pytest.raises(OSError):
+        instrument.write("*RST\n")
+
+
+def test_max31865_registers():
+    chip = SimulatedMAX31865()
+    chip.transfer([0x80, 0xC2])
+    assert chip.transfer([0x00, 0])[1] == 0xC0  # fault-clear reads back as 0
+    chip.transfer([0x81, 0xFF, 0xFF])  # the RTD registers are read-only
+    msb, lsb = chip.transfer([0x01, 0, 0])[1:]
+    assert (msb, lsb) != (0xFF, 0xFF) and chip.conversions == 1
+    chip.inject_fault(0x04)
+    assert chip.transfer([0x07, 0])[1] == 0x04
+    chip.transfer([0x80, 0xC2])
+    assert chip.transfer([0x07, 0])[1] == 0
+
+
+def test_load_config_file_and_environment(tmp_path, monkeypatch):
+    from backend.Backend import DEFAULT_CONFIG, load_config
+    path = tmp_path / "control_config.json"
+    path.write_text(json.dumps({"backends": {"gpio": "simulated"}, "agilent": {"port": "/dev/ttyUSB1"}}))
+    monkeypatch.delenv("UV_CONTROL_BACKEND", raising=False)
+    config = load_config(str(path))
+    assert config["backends"]["gpio"] == "simulated"
+    assert config["backends"]["spi"] == "hardware"
+    assert config["agilent"] == {**DEFAULT_CONFIG["agilent"], "port": "/dev/ttyUSB1"}
+    monkeypatch.setenv("UV_CONTROL_BACKEND", "simulated")
+    assert set(load_config(str(path))["backends"].values()) == {"simulated"}
+    assert DEFAULT_CONFIG["backends"]["gpio"] == "hardware"
+
+
+def test_backend_runs_on_simulated_hardware(backend):
+    assert backend.agilent.inst is backend.backends["resource_manager"].instrument
+    backend.select_channel(3, 99)
+    assert backend.spi_bus.devices[(0, 0)].code == 99
+    backend.agilent.send_trigger(1)
+    assert len(backend.backends["resource_manager"].instrument.triggers) == 1
+
+
+def registers_config(tmp_path, spi_device):
+    from backend.Backend import load_config
+    config = load_config(str(tmp_path / "control_config.json"))
+    config["backends"] = {device: "simulated" for device in config["backends"]}
+    config["simulation"]["model_latency"] = False
+    config["mqtt"]["transport"] = "loopback"
+    config["temperature"].update(driver="registers", spi_device=spi_device)
+    return config
+
+
+def test_max31865_shares_the_bus_on_its_own_ce(tmp_path, monkeypatch):
+    from backend.Backend import HighLevelControl
+    monkeypatch.chdir(tmp_path)
+    control = HighLevelControl(config=registers_config(tmp_path, spi_device=1))
+    try:
+        devices = {address: type(device).__name__ for address, device in control.spi_bus.devices.items()}
+        assert devices == {(0, 0): "SimulatedAD5260", (0, 1): "SimulatedMAX31865"}
+        control.select_channel(1, 77)
+        assert control.spi_bus.devices[(0, 0)].code == 77
+        assert control.spi_bus.devices[(0, 1)].registers[0] & 0xC0 == 0xC0
+    finally:
+        control.executor.shutdown()
+        control.cleanup()
+
+
+def test_max31865_on_the_ad5260_ce_is_refused(tmp_path, monkeypatch):
+    from backend.Backend import HighLevelControl
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match="chip select"):
+        HighLevelControl(config=registers_config(tmp_path, spi_device=0))
@@ -0,0 +1,136 @@
+"""Temperature pipeline: sample ring, drift-free sampler, consumers and the alarm."""
+import itertools
+import time
+
+import numpy as np
+import pytest
+
+from TemperatureAcquisition import (SAMPLE_RECORD, RingConsumer, SampleRing, TemperatureAcquisition,
+                                    TemperatureAlarm, TemperatureSampler)
+
+
+def records(*temperatures):
+    data = np.zeros(len(temperatures), dtype=SAMPLE_RECORD)
+    data["timestamp"] = np.arange(len(temperatures))
+    data["temperature_k"] = temperatures
+    return data
+
+
+def test_ring_read_from_cursor():
+    ring = SampleRing(8)
+    for n in range(5):
+        ring.put(float(n), 300.0 + n)
+    data, cursor, lost = ring.read(2)
+    assert data["temperature_k"].tolist() == [302.0, 303.0, 304.0]
+    assert (cursor, lost) == (5, 0)
+    data, cursor, lost = ring.read(cursor)
+    assert (len(data), cursor, lost) == (0, 5, 0)
+
+
+def test_slow_reader_loses_the_oldest():
+    ring = SampleRing(4)
+    for n in range(10):
+        ring.put(float(n), float(n))
+    data, cursor, lost = ring.read(0)
+    assert data["temperature_k"].tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert (cursor, lost) == (10, 6)
+
+
+def test_consumer_skips_samples_from_before_it_existed():
+    ring = SampleRing(16)
+    ring.put(0.0, 1.0)
+    seen = []
+    consumer = RingConsumer("test", ring, lambda data: seen.extend(data["temperature_k"].tolist()))
+    ring.put(1.0, 2.0)
+    ring.put(2.0, 3.0)
+    consumer.poll()
+    assert seen == [2.0, 3.0]
+    assert consumer.stats() == {"consumed": 2, "lost": 0, "errors": 0, "backlog": 0}
+
+
+def test_failing_consumer_is_counted_and_moves_on():
+    ring = SampleRing(16)
+
+    def broken(data):
+        raise OSError("disk full")
+
+    consumer = RingConsumer("broken", ring, broken)
+    ring.put(0.0, 1.0)
+    consumer.poll()
+    assert (consumer.errors, consumer.cursor) == (1, 1)
+
+
+def test_alarm_with_hysteresis():
+    events = []
+    alarm = TemperatureAlarm(events.append, high_k=310.0, low_k=280.0, hysteresis_k=1.0)
+    alarm(records(300.0, 310.5, 309.5, 310.2, 308.9, 279.0, 280.5, 281.5))
+    assert [event["state"] for event in events] == ["high", "ok", "low", "ok"]
+    assert [event["temperature_k"] for event in events] == [310.5, 308.9, 279.0, 281.5]
+
+
+def test_sampler_keeps_its_schedule():
+    ring = SampleRing(256)
+    sampler = TemperatureSampler(lambda: 300.0, ring, interval=0.01)
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    # About 21 samples on a drift-free schedule; allow for a loaded machine
+    assert 10 <= ring.written <= 22
+    data, _, _ = ring.read(0)
+    assert np.all(np.diff(data["perf_counter_ns"]) > 0)
+
+
+def test_sampler_counts_read_errors():
+    values = itertools.cycle([300.0, RuntimeError("fault")])
+
+    def read():
+        value = next(values)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    sampler = TemperatureSampler(read, SampleRing(64), interval=0.01)
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    assert sampler.errors >= 1
+    assert sampler.samples >= 1
+    assert abs(sampler.samples - sampler.errors) <= 1
+
+
+def test_sampler_skips_overrun_deadlines():
+    sampler = TemperatureSampler(lambda: time.sleep(0.035) or 300.0, SampleRing(64), interval=0.01)
+    sampler.start()
+    time.sleep(0.15)
+    sampler.stop()
+    assert sampler.overruns >= sampler.samples
+
+
+def test_interval_limits():
+    sampler = TemperatureSampler(lambda: 300.0, SampleRing(4), interval=1.0, min_interval=0.1)
+    with pytest.raises(ValueError):
+        sampler.set_interval(0.05)
+    with pytest.raises(ValueError):
+        sampler.set_interval(float("nan"))
+    sampler.set_interval(0.5)
+    assert sampler.interval == 0.5
+
+
+def test_set_interval_while_running():
+    acquisition = TemperatureAcquisition(lambda: 300.0, interval=10.0)
+    acquisition.start()
+    acquisition.set_interval(0.01)
+    time.sleep(0.1)
+    acquisition.stop()
+    assert acquisition.sampler.samples >= 5
+
+
+def test_stop_hands_every_sample_to_the_consumers():
+    acquisition = TemperatureAcquisition(lambda: 300.0, interval=0.01)
+    stored = []
+    acquisition.add_consumer("storage", lambda data: stored.extend(data["timestamp"].tolist()), period=10.0)
+    acquisition.start()
+    time.sleep(0.1)
+    acquisition.stop()
+    assert len(stored) == acquisition.sampler.samples > 0
+    assert acquisition.stats()["consumers"]["storage"]["backlog"] == 0
@@ -0,0 +1,71 @@
+"""Append-only temperature time-series store and the JSON log migration."""
+import json
+import os
+
+import numpy as np
+
+from TimeSeriesStore import TimeSeriesStore, migrate_json
+
+
+def test_append_and_read_range(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    for t in range(10):
+        store.append(float(t), 20.0 + t)
+    records = store.read(3.0, 6.0)
+    assert records["timestamp"].tolist() == [3.0, 4.0, 5.0]
+    assert records["temperature_k"].tolist() == [23.0, 24.0, 25.0]
+    store.close()
+
+
+def test_append_many_and_rotation(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), max_segment_bytes=16 * 10)
+    records = np.zeros(25, dtype=store.dtype)
+    records["timestamp"] = np.arange(25)
+    for chunk in np.array_split(records, 5):
+        store.append_many(chunk)
+    assert len(store.segments()) > 1
+    assert store.read()["timestamp"].tolist() == list(range(25))
+    # A range that starts inside a later segment skips the earlier ones
+    assert store.read(start=21.0)["timestamp"].tolist() == [21.0, 22.0, 23.0, 24.0]
+    store.close()
+
+
+def test_torn_record_is_dropped_on_reopen(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    store.append(1.0, 10.0)
+    store.append(2.0, 11.0)
+    store.close()
+    segment = store.segments()[-1]
+    with open(segment, "ab") as f:
+        f.write(b"\x00" * 5)  # a crash mid-write
+    store = TimeSeriesStore(str(tmp_path))
+    store.append(3.0, 12.0)
+    assert os.path.getsize(segment) % store.dtype.itemsize == 0
+    assert store.read()["timestamp"].tolist() == [1.0, 2.0, 3.0]
+    store.close()
+
+
+def test_read_arrays(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), fields=("a", "b"))
+    store.append(1.0, 2.0, 3.0)
+    timestamps, values = store.read_arrays()
+    assert timestamps.tolist() == [1.0]
+    assert values == {"a": [2.0], "b": [3.0]}
+    store.close()
+
+
+def test_empty_store_reads_empty(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    assert len(store.read()) == 0
+
+
+def test_migrate_json_sorts_by_timestamp(tmp_path):
+    legacy = tmp_path / "Temperature_measurements.json"
+    legacy.write_text(json.dumps([{"timestamp": 2.0, "temperature_k": 30.0},
+                                  {"timestamp": 1.0, "temperature_k": 31.0}]))
+    store = TimeSeriesStore(str(tmp_path / "store"))
+    assert migrate_json(str(legacy), store) == 2
+    records = store.read()
+    assert records["timestamp"].tolist() == [1.0, 2.0]
+    assert records["temperature_k"].tolist() == [31.0, 30.0]
+    store.close()
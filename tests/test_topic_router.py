@@ -0,0 +1,130 @@
+"""Topic-trie router: wildcard matching, removal and handler executors."""
+import asyncio
+import concurrent.futures
+import threading
+
+import pytest
+
+from TopicRouter import TopicRouter
+
+
+@pytest.fixture
+def router():
+    router = TopicRouter()
+    yield router
+    router.shutdown()
+
+
+def matching(router, topic):
+    return sorted(registration.topic_filter for registration in router.match(topic))
+
+
+FILTERS = ["#", "uv/#", "uv/+/command", "+/control/command", "uv/control/#", "uv/control/command", "uv/status"]
+
+
+@pytest.mark.parametrize("topic, expected", [
+    ("uv/control/command", ["#", "+/control/command", "uv/#", "uv/+/command", "uv/control/#", "uv/control/command"]),
+    ("uv/status", ["#", "uv/#", "uv/status"]),
+    ("uv", ["#", "uv/#"]),
+    ("other/control/command", ["#", "+/control/command"]),
+    ("uv/control/command/extra", ["#", "uv/#", "uv/control/#"]),
+])
+def test_wildcards(router, topic, expected):
+    for topic_filter in FILTERS:
+        router.add(topic_filter, lambda payload: None)
+    assert matching(router, topic) == sorted(expected)
+
+
+def test_plus_matches_exactly_one_level(router):
+    router.add("a/+/c", lambda payload: None)
+    assert matching(router, "a/b/c") == ["a/+/c"]
+    assert matching(router, "a/c") == []
+    assert matching(router, "a/b/x/c") == []
+
+
+def test_system_topics_skip_first_level_wildcards(router):
+    router.add("#", lambda payload: None)
+    router.add("+/broker/load", lambda payload: None)
+    router.add("$SYS/#", lambda payload: None)
+    assert matching(router, "$SYS/broker/load") == ["$SYS/#"]
+
+
+def test_several_handlers_per_filter_in_order(router):
+    calls = []
+    router.add("t", lambda payload: calls.append(("first", payload)))
+    router.add("t", lambda payload: calls.append(("second", payload)))
+    assert router.dispatch("t", 1) == 2
+    assert calls == [("first", 1), ("second", 1)]
+
+
+def test_remove_clears_the_match_cache(router):
+    calls = []
+    first = router.add("a/+", calls.append)
+    second = router.add("a/+", calls.append)
+    router.dispatch("a/b", 1)
+    assert router.remove(first) is False
+    router.dispatch("a/b", 2)
+    assert router.remove(second) is True
+    assert router.dispatch("a/b", 3) == 0
+    assert calls == [1, 1, 2]
+    assert router.filters() == []
+
+
+def test_filters_lists_registered(router):
+    router.add("a/b", lambda payload: None)
+    router.add("a/#", lambda payload: None)
+    assert sorted(router.filters()) == ["a/#", "a/b"]
+
+
+def test_failing_handler_is_counted(router):
+    def broken(payload):
+        raise RuntimeError("bad")
+
+    registration = router.add("t", broken)
+    router.dispatch("t", None)
+    assert router.errors[registration.name] == 1
+    assert router.stats()[registration.name]["errors"] == 1
+
+
+def test_thread_and_executor_handlers(router):
+    done = threading.Barrier(3, timeout=5.0)
+    names = []
+
+    def handler(payload):
+        names.append(threading.current_thread().name)
+        done.wait()
+
+    with concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="custom") as pool:
+        router.add("t", handler, executor="thread")
+        router.add("t", handler, executor=pool)
+        router.dispatch("t", None)
+        done.wait()
+    assert sorted(name.split("_")[0] for name in names) == ["custom", "mqtt-handler"]
+
+
+def test_coroutine_handler_on_event_loop(router):
+    received = []
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        done = threading.Event()
+
+        async def handler(payload):
+            await asyncio.sleep(0)
+            received.append(payload)
+            done.set()
+
+        router.add("t", handler, executor=loop)
+        router.dispatch("t", "payload")
+        assert done.wait(5.0)
+        assert received == ["payload"]
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5.0)
+        loop.close()
+
+
+def test_unknown_executor(router):
+    with pytest.raises(ValueError):
+        router.add("t", lambda payload: None, executor="process")
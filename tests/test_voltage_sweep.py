@@ -0,0 +1,51 @@
+"""AD5260 voltage sweep engine: profiles, code conversion and scheduled playback."""
+import numpy as np
+import pytest
+
+from GPIOController import AD5260Controller
+from SimulatedHardware import SimulatedGPIO, SimulatedSpiBus
+
+PINS = [14, 9, 10, 25, 8]
+
+
+@pytest.fixture
+def bus():
+    return SimulatedSpiBus(model_latency=False)
+
+
+@pytest.fixture
+def pot(bus):
+    return AD5260Controller(pins=PINS, gpio=SimulatedGPIO(), spi=bus.SpiDev())
+
+
+def test_voltage_code_round_trip(pot):
+    codes = np.arange(256)
+    assert np.array_equal(pot.voltage_to_code(pot.calculate_voltage(codes)), codes)
+    assert pot.voltage_to_code(-1.0) == 0
+    assert pot.voltage_to_code(10.0) == 255
+
+
+@pytest.mark.parametrize("profile, kwargs, expected", [
+    ("linear", {}, [1.0, 2.0, 3.0]),
+    ("log", {}, [1.0, np.sqrt(3.0), 3.0]),
+    ("custom", {"voltages": [0.5, 4.0]}, [0.5, 4.0]),
+])
+def test_sweep_profiles(pot, profile, kwargs, expected):
+    assert pot.sweep_profile(1.0, 3.0, 2, profile=profile, **kwargs) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("start_v, end_v, steps, profile", [
+    (0.0, 3.0, 2, "log"), (1.0, 3.0, 0, "linear"), (1.0, 6.0, 2, "linear"), (1.0, 3.0, 2, "cubic"),
+])
+def test_invalid_sweep_profiles(pot, start_v, end_v, steps, profile):
+    with pytest.raises(ValueError):
+        pot.sweep_profile(start_v, end_v, steps, profile=profile)
+
+
+def test_voltage_sweep_records(pot):
+    results = pot.voltage_sweep(0.0, 2.0, steps=4, duration=0.01)
+    assert results["step"].tolist() == list(range(5))
+    assert results["code"].tolist() == pot.voltage_to_code(np.linspace(0.0, 2.0, 5)).tolist()
+    assert results["scheduled_s"] == pytest.approx(np.arange(5) * 0.002)
+    assert (results["late_s"] >= 0).all()
+    assert pot.code == results["code"][-1]
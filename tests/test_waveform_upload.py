@@ -0,0 +1,56 @@
+"""Chunked binary arbitrary-waveform upload."""
+import numpy as np
+import pytest
+
+from Agilent_Controller_RS232 import ARB_MAX_POINTS, DAC_MAX
+
+
+def test_normalized_samples_scaled_to_dac_codes(agilent):
+    result = agilent.upload_waveform([0.0, 0.5, 1.0, -1.0, 2.0])
+    assert agilent.inst.waveforms["VOLATILE"] == [0, 1024, DAC_MAX, -DAC_MAX, DAC_MAX]
+    assert result["points"] == 5 and not result["skipped"]
+
+
+def test_integer_codes_clipped(agilent):
+    agilent.upload_waveform(np.array([0, 100, 3000, -3000]), name="CODES")
+    assert agilent.inst.waveforms["CODES"] == [0, 100, DAC_MAX, -DAC_MAX]
+
+
+def test_legacy_entry_points(agilent):
+    agilent.upload_arbitrary_waveform([0.0, 1.0], name="A")
+    agilent.upload_arbitrary_waveform_binary(np.array([5, -5]), name="B")
+    assert agilent.inst.waveforms["A"] == [0, DAC_MAX]
+    assert agilent.inst.waveforms["B"] == [5, -5]
+
+
+def test_streamed_in_chunks(agilent, monkeypatch):
+    writes = []
+    write_raw = agilent.inst.write_raw
+    monkeypatch.setattr(agilent.inst, "write_raw", lambda data: writes.append(len(data)) or write_raw(data))
+    data = np.sin(np.linspace(0, 2 * np.pi, 1000))
+    result = agilent.upload_waveform(data, chunk_size=256)
+    assert sum(writes) == result["bytes"]
+    assert max(writes) == 256 and len(writes) == -(-result["bytes"] // 256)
+    assert agilent.inst.waveforms["VOLATILE"] == np.rint(data * DAC_MAX).astype(int).tolist()
+
+
+def test_same_waveform_is_skipped(agilent):
+    data = np.linspace(-1, 1, 100)
+    agilent.upload_waveform(data)
+    written = agilent.inst.bytes_written
+    assert agilent.upload_waveform(data)["skipped"]
+    assert agilent.inst.bytes_written == written
+    assert not agilent.upload_waveform(data, force=True)["skipped"]
+    assert not agilent.upload_waveform(data, name="OTHER")["skipped"]
+
+
+def test_close_forgets_uploads(agilent):
+    agilent.upload_waveform([0.0, 1.0])
+    agilent.close()
+    assert agilent._uploaded_waveforms == {}
+
+
+@pytest.mark.parametrize("data", [[], np.zeros((2, 2)), np.zeros(ARB_MAX_POINTS + 1)])
+def test_invalid_shapes(agilent, data):
+    with pytest.raises(ValueError):
+        agilent.upload_waveform(data)